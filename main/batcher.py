@@ -0,0 +1,96 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Every batcher registers itself here so /stats/batching can report them
+BATCHERS = {}
+
+
+class MicroBatcher:
+    """
+    Collects work items from many threads and runs them through `batch_fn`
+    in one call.
+
+    A caller submits a list of items and blocks until its slice of the
+    results is ready. The worker waits at most `max_wait_ms` after the first
+    submission (or until `max_batch_size` items are queued), runs
+    batch_fn(all_items) once, and hands every caller back its own results.
+
+    batch_fn must return a sequence aligned with its input.
+    """
+
+    def __init__(self, name, batch_fn, max_batch_size, max_wait_ms):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = queue.Queue()
+
+        self.lock = threading.Lock()
+        self.stats = {"batches": 0, "items": 0, "requests": 0, "max_batch_seen": 0}
+
+        BATCHERS[name] = self
+        self.worker = threading.Thread(target=self._run, name=f"batcher-{name}", daemon=True)
+        self.worker.start()
+
+    def submit(self, items: list) -> list:
+        if not items:
+            return []
+        future = Future()
+        self.queue.put((items, future))
+        return future.result()
+
+    def _collect(self):
+        """Blocks for the first request, then gathers more until size or time runs out."""
+        first = self.queue.get()
+        batch = [first]
+        size = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                nxt = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(nxt)
+            size += len(nxt[0])
+        return batch, size
+
+    def _run(self):
+        while True:
+            batch, size = self._collect()
+            flat = [item for items, _ in batch for item in items]
+
+            try:
+                results = self.batch_fn(flat)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            start = 0
+            for items, future in batch:
+                end = start + len(items)
+                future.set_result(results[start:end])
+                start = end
+
+            with self.lock:
+                self.stats["batches"] += 1
+                self.stats["items"] += size
+                self.stats["requests"] += len(batch)
+                self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], size)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["avg_batch_size"] = round(stats["items"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["queued"] = self.queue.qsize()
+        return stats
+
+
+def batcher_stats():
+    return {name: b.get_stats() for name, b in BATCHERS.items()}
@@ -0,0 +1,2 @@
+# Offline benchmark harness: fake Gemini / Groq backends, a synthetic
+# knowledge base and an open-loop load generator. See benchmark/__main__.py.
@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import json
+import sys
+import config
+
+# Usage (from main/):
+#   python -m benchmark kb                      # build the synthetic KB + users
+#   python -m benchmark serve --gemini-429 0.05 # server on fake Gemini / Groq
+#   python -m benchmark load --rps 20 --duration 60 --compare default
+#   python -m benchmark load --rps 20 --save-baseline default
+
+
+def _serve(args):
+    from benchmark import synthetic_kb
+    synthetic_kb.apply_config(args.data_dir, n_keys=args.keys)
+
+    from benchmark import fakes
+    gemini_faults = fakes.FaultConfig(
+        latency_ms=args.gemini_latency_ms, jitter_ms=args.gemini_jitter_ms,
+        rate_limit_rate=args.gemini_429, unavailable_rate=args.gemini_503,
+        error_rate=args.gemini_error, rpm_limit=args.gemini_rpm
+    )
+    groq_faults = fakes.FaultConfig(
+        latency_ms=args.groq_latency_ms, jitter_ms=args.groq_latency_ms / 3,
+        rate_limit_rate=args.groq_429
+    )
+    fakes.install(gemini_faults, groq_faults, synthetic_kb.load_glossary(args.data_dir).keys())
+
+    import uvicorn
+    import server_main
+    uvicorn.run(server_main.app, host=args.host, port=args.port, log_level="warning")
+
+
+def _load(args):
+    from benchmark import loadgen, synthetic_kb
+
+    query_mix = loadgen.QueryMix(synthetic_kb.load_glossary(args.data_dir).keys(), loadgen.parse_mix(args.mix))
+    records, elapsed = asyncio.run(loadgen.run_load(
+        args.url, query_mix, synthetic_kb.load_users(args.data_dir), args.rps, args.duration
+    ))
+    report = loadgen.summarize(records, elapsed, args.rps)
+    print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        loadgen.save_baseline(args.save_baseline, report)
+        print(f"[Bench] Saved baseline '{args.save_baseline}' to {config.BENCH_BASELINE_PATH}")
+
+    if args.compare:
+        baseline = loadgen.load_baselines().get(args.compare)
+        if baseline is None:
+            print(f"[Bench] No baseline named '{args.compare}'.")
+            sys.exit(2)
+        regressions = loadgen.compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"[Bench] REGRESSIONS vs '{args.compare}':")
+            for line in regressions:
+                print(f"   - {line}")
+            sys.exit(1)
+        print(f"[Bench] No regressions vs '{args.compare}' (tolerance {args.tolerance:.0%}).")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Offline benchmark harness")
+    parser.add_argument("--data-dir", default=config.BENCH_DATA_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    kb = sub.add_parser("kb", help="Build the synthetic knowledge base, glossary and users")
+    kb.add_argument("--chunks-per-tag", type=int, default=5)
+    kb.add_argument("--users", type=int, default=50)
+
+    serve = sub.add_parser("serve", help="Run the API against fake Gemini / Groq backends")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument("--keys", type=int, default=4, help="Number of fake Gemini keys")
+    serve.add_argument("--gemini-latency-ms", type=float, default=600.0)
+    serve.add_argument("--gemini-jitter-ms", type=float, default=200.0)
+    serve.add_argument("--gemini-429", type=float, default=0.0, help="Injected 429 probability")
+    serve.add_argument("--gemini-503", type=float, default=0.0, help="Injected 503 probability")
+    serve.add_argument("--gemini-error", type=float, default=0.0, help="Injected 400 probability")
+    serve.add_argument("--gemini-rpm", type=float, default=0.0, help="Per-key quota (0 = unlimited)")
+    serve.add_argument("--groq-latency-ms", type=float, default=250.0)
+    serve.add_argument("--groq-429", type=float, default=0.0)
+
+    load = sub.add_parser("load", help="Replay a query mix against /chat at a target RPS")
+    load.add_argument("--url", default="http://127.0.0.1:8000")
+    load.add_argument("--rps", type=float, default=10.0)
+    load.add_argument("--duration", type=float, default=30.0, help="Seconds of offered load")
+    load.add_argument("--mix", default=None, help='e.g. "in_scope=0.7,repeat=0.2,off_topic=0.1"')
+    load.add_argument("--save-baseline", default=None, metavar="NAME")
+    load.add_argument("--compare", default=None, metavar="NAME")
+    load.add_argument("--tolerance", type=float, default=config.BENCH_REGRESSION_TOLERANCE)
+
+    args = parser.parse_args()
+    if args.command == "kb":
+        from benchmark import synthetic_kb
+        synthetic_kb.build(args.data_dir, args.chunks_per_tag, args.users)
+    elif args.command == "serve":
+        _serve(args)
+    else:
+        _load(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import json
+import random
+import sys
+import time
+import types as pytypes
+from ratelimit import TokenBucket
+
+# Stand-ins for google-genai and groq that cost no quota. Latency, errors
+# and 429s are injected from a FaultConfig, so the key pool, retries and
+# the rest of the pipeline behave like they would against the real APIs.
+
+CANNED_ANSWER = (
+    "Patience, student. The market rewards those who manage risk before they chase profit. "
+    "Study the reference, size your position small, and let the trade come to you."
+)
+
+
+class FaultConfig:
+    """
+    latency_ms / jitter_ms: time to the answer (or first chunk), uniform +/- jitter
+    chunk_interval_ms:      gap between streamed chunks
+    *_rate:                 probability per call of a 429 / 503 / non-retryable 400
+    rpm_limit:              per-key quota; calls over it get a 429 (0 = unlimited)
+    """
+
+    def __init__(self, latency_ms=600.0, jitter_ms=200.0, chunk_interval_ms=30.0,
+                 rate_limit_rate=0.0, unavailable_rate=0.0, error_rate=0.0, rpm_limit=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.chunk_interval_ms = chunk_interval_ms
+        self.rate_limit_rate = rate_limit_rate
+        self.unavailable_rate = unavailable_rate
+        self.error_rate = error_rate
+        self.rpm_limit = rpm_limit
+
+    def delay(self):
+        return max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+
+
+class FakeAPIError(Exception):
+    """Shaped like the SDK errors ResilientClient._classify() looks at (`.code` + message)."""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+def _inject(faults, bucket=None):
+    if bucket is not None and not bucket.try_take():
+        raise FakeAPIError(429, "RESOURCE_EXHAUSTED (fake per-key quota)")
+    roll = random.random()
+    if roll < faults.rate_limit_rate:
+        raise FakeAPIError(429, "RESOURCE_EXHAUSTED (injected)")
+    roll -= faults.rate_limit_rate
+    if roll < faults.unavailable_rate:
+        raise FakeAPIError(503, "UNAVAILABLE (injected)")
+    roll -= faults.unavailable_rate
+    if roll < faults.error_rate:
+        raise FakeAPIError(400, "INVALID_ARGUMENT (injected)")
+
+
+def _usage(prompt_text, answer):
+    return pytypes.SimpleNamespace(
+        prompt_token_count=len(prompt_text) // 4,
+        candidates_token_count=len(answer) // 4,
+    )
+
+
+def _chunks(answer, size=24):
+    return [answer[i:i + size] for i in range(0, len(answer), size)]
+
+
+#  GEMINI 
+class _FakeChat:
+    def __init__(self, client, history):
+        self.client = client
+        self.history = history or []
+
+    def _prompt_text(self, message):
+        parts = [p.text for c in self.history for p in (getattr(c, "parts", None) or [])]
+        return "\n".join(parts + [str(message)])
+
+    def send_message(self, message):
+        faults = self.client.faults
+        time.sleep(faults.delay())
+        _inject(faults, self.client.bucket)
+        return pytypes.SimpleNamespace(text=CANNED_ANSWER, usage_metadata=_usage(self._prompt_text(message), CANNED_ANSWER))
+
+    def send_message_stream(self, message):
+        faults = self.client.faults
+        time.sleep(faults.delay())
+        _inject(faults, self.client.bucket)
+        pieces = _chunks(CANNED_ANSWER)
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(faults.chunk_interval_ms / 1000.0)
+            last = i == len(pieces) - 1
+            usage = _usage(self._prompt_text(message), CANNED_ANSWER) if last else None
+            yield pytypes.SimpleNamespace(text=piece, usage_metadata=usage)
+
+
+class _Chats:
+    def __init__(self, client, chat_cls):
+        self.client = client
+        self.chat_cls = chat_cls
+
+    def create(self, model=None, history=None, config=None):
+        return self.chat_cls(self.client, history)
+
+
+class FakeGenaiClient:
+    """Drop-in for genai.Client(api_key=...): chats.create()."""
+
+    def __init__(self, api_key=None, faults=None):
+        self.api_key = api_key
+        self.faults = faults or FaultConfig()
+        self.bucket = None
+        if self.faults.rpm_limit:
+            self.bucket = TokenBucket(rate=self.faults.rpm_limit / 60.0, capacity=max(1.0, self.faults.rpm_limit / 12))
+        self.chats = _Chats(self, _FakeChat)
+
+
+#  GROQ 
+class FakeGroq:
+    """
+    Drop-in for groq.Groq: chat.completions.create() answers with the glossary
+    terms that literally appear in the user message, as {"tags": [...]} when
+    JSON mode is requested and as a bare JSON list otherwise.
+    """
+
+    def __init__(self, api_key=None, faults=None, glossary_terms=()):
+        self.faults = faults or FaultConfig(latency_ms=250.0, jitter_ms=100.0)
+        self.terms = sorted(glossary_terms, key=len, reverse=True)
+        self.chat = pytypes.SimpleNamespace(completions=pytypes.SimpleNamespace(create=self._create))
+
+    def _create(self, messages, model=None, temperature=None, **kwargs):
+        time.sleep(self.faults.delay())
+        _inject(self.faults)
+        text = messages[-1]["content"].lower()
+        tags = [t for t in self.terms if t.lower() in text][:3]
+        payload = {"tags": tags} if kwargs.get("response_format") else tags
+        message = pytypes.SimpleNamespace(content=json.dumps(payload))
+        return pytypes.SimpleNamespace(choices=[pytypes.SimpleNamespace(message=message)])
+
+
+def install(gemini_faults=None, groq_faults=None, glossary_terms=()):
+    """
+    Swaps the real SDKs for the fakes in this process. Call before the
+    router / brain are constructed (the server's startup manager does that lazily).
+    """
+    import gemini_client
+
+    gemini_faults = gemini_faults or FaultConfig()
+    gemini_client.genai = pytypes.SimpleNamespace(
+        Client=lambda api_key=None, **kwargs: FakeGenaiClient(api_key, gemini_faults)
+    )
+
+    groq_module = pytypes.ModuleType("groq")
+    groq_module.Groq = lambda api_key=None, **kwargs: FakeGroq(api_key, groq_faults, glossary_terms)
+    sys.modules["groq"] = groq_module
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import os
+import random
+import time
+import numpy as np
+import config
+
+# Open-loop load generator: requests are sent on a fixed schedule (target
+# RPS) regardless of how fast the server answers, so queueing shows up in
+# the latency numbers instead of silently lowering the offered load.
+
+OFF_TOPIC_QUERIES = [
+    "What's the best pizza place in Naples?",
+    "Can you write me a poem about the ocean?",
+    "Who won the football match last night?",
+    "How do I fix my bike chain?",
+    "What is the capital of Australia?",
+]
+
+IN_SCOPE_TEMPLATES = [
+    "What is {term}?",
+    "How should I use {term} in my trading?",
+    "I keep losing money, does {term} matter for me?",
+    "Explain {term} like I'm new to trading.",
+]
+
+DEFAULT_MIX = {"in_scope": 0.7, "repeat": 0.2, "off_topic": 0.1}
+
+
+def parse_mix(text) -> dict:
+    """"in_scope=0.7,repeat=0.2,off_topic=0.1" -> normalised weights."""
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise ValueError(f"Unknown query kind: {name}")
+        mix[name.strip()] = float(weight)
+    total = sum(mix.values())
+    return {k: v / total for k, v in mix.items()}
+
+
+class QueryMix:
+    """
+    in_scope:  a template around a random glossary term (mostly cache misses)
+    repeat:    one of a handful of fixed questions (exercises the caches)
+    off_topic: nothing in the KB matches (exercises the rejection path)
+    """
+
+    def __init__(self, glossary_terms, mix=None, seed=11):
+        self.rng = random.Random(seed)
+        self.terms = list(glossary_terms)
+        self.mix = mix or dict(DEFAULT_MIX)
+        self.repeats = [IN_SCOPE_TEMPLATES[0].format(term=t) for t in self.terms[:5]]
+
+    def next(self):
+        kind = self.rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        if kind == "off_topic":
+            return kind, self.rng.choice(OFF_TOPIC_QUERIES)
+        if kind == "repeat" and self.repeats:
+            return kind, self.rng.choice(self.repeats)
+        template = self.rng.choice(IN_SCOPE_TEMPLATES)
+        return "in_scope", template.format(term=self.rng.choice(self.terms))
+
+
+async def run_load(base_url, query_mix, user_ids, rps, duration_s, endpoint="/chat", timeout_s=60.0):
+    """Fires rps * duration_s requests on schedule; returns one record per request."""
+    import httpx
+
+    total = max(1, int(rps * duration_s))
+    records = []
+    state = {
+        "current_chapter": "2. Risk Management",
+        "finished_chapters": ["1. Psychology"],
+        "unfinished_chapters": ["3. Technical Analysis"],
+        "win_rate": "45%",
+    }
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout_s,
+                                 limits=httpx.Limits(max_connections=None, max_keepalive_connections=200)) as client:
+
+        async def send(kind, query, user_id):
+            payload = {"user_id": user_id, "query": query, "user_state": state, "debug_timings": True}
+            start = time.perf_counter()
+            record = {"kind": kind, "status": None, "latency_s": None, "breakdown": None}
+            try:
+                response = await client.post(endpoint, json=payload)
+                record["status"] = response.status_code
+                if response.status_code == 200:
+                    record["breakdown"] = response.json().get("breakdown")
+            except Exception as e:
+                record["status"] = f"exception: {type(e).__name__}"
+            record["latency_s"] = time.perf_counter() - start
+            records.append(record)
+
+        tasks = []
+        start = time.perf_counter()
+        for i in range(total):
+            delay = start + i / rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            kind, query = query_mix.next()
+            tasks.append(asyncio.ensure_future(send(kind, query, query_mix.rng.choice(user_ids))))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    return records, elapsed
+
+
+def _percentiles(values_ms):
+    if not values_ms:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    arr = np.asarray(values_ms)
+    return {
+        "p50": round(float(np.percentile(arr, 50)), 2),
+        "p95": round(float(np.percentile(arr, 95)), 2),
+        "p99": round(float(np.percentile(arr, 99)), 2),
+        "mean": round(float(arr.mean()), 2),
+        "max": round(float(arr.max()), 2),
+    }
+
+
+def summarize(records, elapsed_s, target_rps):
+    ok = [r for r in records if r["status"] == 200]
+    rejected = [r for r in records if r["status"] == 503]
+
+    stages = {}
+    for r in ok:
+        for stage, ms in (r["breakdown"] or {}).items():
+            stages.setdefault(stage, []).append(ms)
+
+    by_kind = {}
+    for r in ok:
+        by_kind.setdefault(r["kind"], []).append(r["latency_s"] * 1000)
+
+    return {
+        "requests": len(records),
+        "ok": len(ok),
+        "rejected": len(rejected),
+        "errors": len(records) - len(ok) - len(rejected),
+        "duration_s": round(elapsed_s, 2),
+        "target_rps": target_rps,
+        "throughput_rps": round(len(ok) / elapsed_s, 2) if elapsed_s else 0.0,
+        "latency_ms": _percentiles([r["latency_s"] * 1000 for r in ok]),
+        "latency_ms_by_kind": {kind: _percentiles(v) for kind, v in by_kind.items()},
+        "stages_ms": {
+            stage: {"mean": round(float(np.mean(v)), 2), "p95": round(float(np.percentile(v, 95)), 2)}
+            for stage, v in sorted(stages.items())
+        },
+    }
+
+
+#  BASELINES 
+def load_baselines(path=config.BENCH_BASELINE_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(name, report, path=config.BENCH_BASELINE_PATH):
+    baselines = load_baselines(path)
+    baselines[name] = {**report, "saved_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baselines, f, indent=2)
+
+
+def compare(report, baseline, tolerance=config.BENCH_REGRESSION_TOLERANCE, min_delta_ms=5.0) -> list:
+    """
+    Regressions vs a stored baseline: latency percentiles and per-stage p95
+    more than `tolerance` slower (and at least min_delta_ms, to ignore noise),
+    or throughput more than `tolerance` lower.
+    """
+    regressions = []
+
+    def slower(label, now, before):
+        if now is None or before is None:
+            return
+        if now > before * (1 + tolerance) and now - before >= min_delta_ms:
+            regressions.append(f"{label}: {before} -> {now} ms (+{(now / before - 1) * 100:.0f}%)")
+
+    for p in ("p50", "p95", "p99"):
+        slower(f"latency {p}", report["latency_ms"][p], baseline["latency_ms"][p])
+    for stage, now in report["stages_ms"].items():
+        before = baseline.get("stages_ms", {}).get(stage)
+        if before:
+            slower(f"stage {stage} p95", now["p95"], before["p95"])
+
+    if report["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        regressions.append(f"throughput: {baseline['throughput_rps']} -> {report['throughput_rps']} rps")
+    return regressions
@@ -0,0 +1,138 @@
+import json
+import os
+import random
+import config
+
+# A throwaway knowledge base for benchmarks: glossary, registered users and a
+# Chroma collection, all under one data dir so real data is never touched.
+
+FALLBACK_GLOSSARY = {
+    "stop loss": "An order that closes a position once price moves against it by a set amount.",
+    "position sizing": "Choosing how much capital to commit to a single trade based on risk.",
+    "risk reward ratio": "The expected loss of a trade compared with its expected gain.",
+    "support": "A price level where falling prices tend to pause because of buying interest.",
+    "resistance": "A price level where rising prices tend to stall because of selling pressure.",
+    "moving average": "The average closing price over a rolling window, used to smooth price action.",
+    "relative strength index": "A momentum oscillator between 0 and 100 that flags overbought or oversold markets.",
+    "average true range": "A volatility measure based on the typical range of recent price bars.",
+    "drawdown": "The decline from an account's peak value to its subsequent low.",
+    "trading plan": "A written set of rules covering entries, exits, risk and review.",
+    "overtrading": "Taking more trades than the plan allows, usually out of boredom or revenge.",
+    "leverage": "Borrowed exposure that magnifies both gains and losses.",
+    "spread": "The difference between the bid and the ask price.",
+    "trend": "The prevailing direction of price over a chosen timeframe.",
+    "breakout": "Price moving decisively through a support or resistance level.",
+    "journal": "A record of every trade with the reasoning and the emotions behind it.",
+}
+
+SENTENCE_TEMPLATES = [
+    "{Term} means the following: {definition}",
+    "Many beginners misunderstand {term}. {definition} Review it before your next session.",
+    "In chapter {chapter} we apply {term} to real charts. {definition}",
+    "A disciplined trader checks {term} on every setup. {definition} Skipping it is how accounts bleed.",
+    "Example: a gold trader ignored {term} and gave back a month of profit. {definition}",
+]
+
+
+def paths(data_dir=config.BENCH_DATA_DIR):
+    return {
+        "db": os.path.join(data_dir, "rag_db"),
+        "glossary": os.path.join(data_dir, "glossary_tags.json"),
+        "users": os.path.join(data_dir, "users_db.json"),
+        "profiles": os.path.join(data_dir, "users_db.sqlite"),
+        "sessions": os.path.join(data_dir, "chat_sessions.jsonl"),
+        "sessions_sqlite": os.path.join(data_dir, "chat_sessions.db"),
+        "candidates": os.path.join(data_dir, "candidate_index"),
+    }
+
+
+def apply_config(data_dir=config.BENCH_DATA_DIR, n_keys=4):
+    """
+    Points config at the benchmark data dir and fills in fake API keys.
+    Must run before profile_store / session_store / server_main are imported
+    (their default arguments read config at import time).
+    """
+    p = paths(data_dir)
+    config.DB_PATH = p["db"]
+    config.GLOSSARY_PATH = p["glossary"]
+    config.USERS_DB_PATH = p["users"]
+    config.PROFILE_DB_PATH = p["profiles"]
+    config.SESSION_LOG_PATH = p["sessions"]
+    config.SESSION_SQLITE_PATH = p["sessions_sqlite"]
+    config.CANDIDATE_INDEX_DIR = p["candidates"]
+    config.LEGACY_HISTORY_FILE = os.path.join(data_dir, "chat_sessions.json")
+    config.GOOGLE_KEYS = [f"fake-gemini-{i}" for i in range(n_keys)]
+    config.GROQ_API_KEY = "fake-groq"
+
+
+def load_glossary(data_dir=config.BENCH_DATA_DIR) -> dict:
+    with open(paths(data_dir)["glossary"], "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_users(data_dir=config.BENCH_DATA_DIR) -> list:
+    with open(paths(data_dir)["users"], "r", encoding="utf-8") as f:
+        return list(json.load(f).keys())
+
+
+def build(data_dir=config.BENCH_DATA_DIR, chunks_per_tag=5, n_users=50, seed=7):
+    """
+    Writes the glossary (the real one when present, else FALLBACK_GLOSSARY),
+    n_users registered profiles, and a Chroma collection with
+    chunks_per_tag templated chunks per glossary term.
+    """
+    import chromadb
+    import encoders
+    import candidates
+    from rag import open_collection
+    from ingest import chunk_metadata
+
+    rng = random.Random(seed)
+    p = paths(data_dir)
+    os.makedirs(data_dir, exist_ok=True)
+
+    glossary = FALLBACK_GLOSSARY
+    if os.path.exists(config.GLOSSARY_PATH) and os.path.abspath(config.GLOSSARY_PATH) != os.path.abspath(p["glossary"]):
+        with open(config.GLOSSARY_PATH, "r", encoding="utf-8") as f:
+            glossary = json.load(f)
+    with open(p["glossary"], "w", encoding="utf-8") as f:
+        json.dump(glossary, f, indent=2, ensure_ascii=False)
+
+    chapters = ["1. Psychology", "2. Risk Management", "3. Technical Analysis", "4. Trading Plan"]
+    users = {
+        f"bench_user_{i}": {
+            "current_chapter": rng.choice(chapters),
+            "finished_chapters": chapters[:rng.randint(0, 2)],
+            "unfinished_chapters": chapters[2:],
+            "win_rate": f"{rng.randint(20, 80)}%",
+        }
+        for i in range(n_users)
+    }
+    with open(p["users"], "w", encoding="utf-8") as f:
+        json.dump(users, f, indent=2)
+
+    ids, docs, metas = [], [], []
+    for t, (term, definition) in enumerate(glossary.items()):
+        for c in range(chunks_per_tag):
+            chapter = rng.choice(chapters)
+            template = SENTENCE_TEMPLATES[(t + c) % len(SENTENCE_TEMPLATES)]
+            ids.append(f"bench-{t}-{c}")
+            docs.append(template.format(term=term, Term=term.capitalize(), definition=definition,
+                                        chapter=chapter.split(".")[0]))
+            metas.append(chunk_metadata(chapter, f"synthetic/{chapter}", [term]))
+
+    client = chromadb.PersistentClient(path=p["db"])
+    try:
+        client.delete_collection(config.COLLECTION_NAME)
+    except Exception:
+        pass
+    collection = open_collection(p["db"])
+    embeddings = encoders.encode(docs)
+    for start in range(0, len(ids), 500):
+        end = start + 500
+        collection.add(ids=ids[start:end], documents=docs[start:end], metadatas=metas[start:end],
+                       embeddings=embeddings[start:end].tolist())
+    candidates.build(collection, out_dir=p["candidates"])
+
+    print(f"[Bench] KB ready in {data_dir}: {len(glossary)} tags, {len(ids)} chunks, {len(users)} users.")
+    return {"tags": len(glossary), "chunks": len(ids), "users": len(users)}
@@ -1,152 +1,242 @@
-import json
-import os
 import config
-from google import genai
-from google.genai import types
 from gemini_client import ResilientClient
-
-# File to store chat history
-HISTORY_FILE = "chat_sessions.json"
+from ratelimit import KeysUnavailableError, GenerationError
+from session_store import create_session_store
+from memory import HistoryWindow, Session, SessionCache, Turn
+import metrics
+import prompts
+from rejections import RejectionPool
+from locks import UserLocks
 
 class SenseiBrain:
-    def __init__(self):
+    def __init__(self, io_pool=None):
         # Initialize the resilient client with keys from config
         self.client = ResilientClient(api_keys=config.GOOGLE_KEYS)
         
-        # Load existing history from JSON file
-        self.user_memories = self._load_history_from_disk()
+        # Persistent history lives in the session store; we only pull a
+        # user's turns into memory when they talk to us, and drop the least
+        # recently active ones beyond HISTORY_CACHE_MAX_SESSIONS.
+        self.store = create_session_store()
+        self.sessions = SessionCache(config.HISTORY_CACHE_MAX_SESSIONS)
+        self.user_locks = UserLocks()
+
+        # Only a bounded window of history goes to Gemini; older turns get summarized
+        # after the reply, on the I/O pool when we have one (the server's executor)
+        self.history_window = HistoryWindow(
+            summarize_fn=self._summarize_turns,
+            max_turns=config.HISTORY_MAX_TURNS,
+            token_budget=config.HISTORY_TOKEN_BUDGET,
+            fold_batch=config.SUMMARY_FOLD_BATCH,
+            max_fold_input=config.SUMMARY_MAX_INPUT_TURNS,
+            submit_fn=io_pool.submit if io_pool else None
+        )
+
+        # Pre-generated rejections for out-of-scope questions
+        self.rejections = RejectionPool(generate_fn=self._generate_rejection)
         
     def generate_response(self, user_id, user_query, rag_context, user_state):
         """
         Orchestrates the Sensei's response generation with PERSISTENT MEMORY.
+        KeysUnavailableError / GenerationError / UserLockTimeout propagate
+        (nothing is recorded for the turn).
         """
         
+        self.rejections.touch()
+
         # 1. Check for "Out of Scope" (Strict guardrail)
         if not rag_context:
             return self._reject_with_humour(user_query)
 
-        # 2. Retrieve history for this specific User
-        # We need to convert the stored JSON dicts back into Google's 'types.Content' objects
-        raw_history = self.user_memories.get(user_id, [])
-        
-        # Convert JSON -> Gemini Object
-        gemini_history = []
-        for turn in raw_history:
-            gemini_history.append(types.Content(
-                role=turn["role"],
-                parts=[types.Part(text=turn["text"])]
-            ))
+        # 2. + 3. History window, system prompt and input block
+        # (the user lock covers history reads and appends, never the Gemini call)
+        with self.user_locks.hold(user_id):
+            gemini_history, system_instruction, full_input = self._prepare_turn(
+                user_id, user_query, rag_context, user_state
+            )
 
-        # 3. Build Input
-        system_instruction = self._build_system_prompt(user_state)
-        
-        # We combine context + query here so it appears as one user block
-        full_input = (
-            f"REFERENCE CONTEXT:\n{rag_context['text']}\n\n"
-            f"USER QUESTION:\n{user_query}"
-        )
-        
         # 4. Send to Gemini
         # Note: We pass the reconstructed gemini_history
-        response_text = self.client.chat(
+        with metrics.timed("generation"):
+            response_text = self.client.chat(
+                user_input=full_input,
+                history=gemini_history,
+                system_instruction=system_instruction
+            )
+
+        # 5. UPDATE MEMORY & SAVE TO DISK
+        with self.user_locks.hold(user_id):
+            self._record_turn(user_id, user_query, response_text)
+        
+        return response_text
+
+    def generate_response_stream(self, user_id, user_query, rag_context, user_state):
+        """
+        Streaming version of generate_response(). Yields text chunks;
+        history is persisted once the whole answer has been produced (so an
+        answer cut short by KeysUnavailableError / GenerationError is not
+        recorded).
+        """
+        self.rejections.touch()
+        if not rag_context:
+            yield self._reject_with_humour(user_query)
+            return
+
+        with self.user_locks.hold(user_id):
+            gemini_history, system_instruction, full_input = self._prepare_turn(
+                user_id, user_query, rag_context, user_state
+            )
+
+        chunks = []
+        for chunk in self.client.chat_stream(
             user_input=full_input,
-            history=gemini_history, 
+            history=gemini_history,
             system_instruction=system_instruction
+        ):
+            chunks.append(chunk)
+            yield chunk
+
+        with self.user_locks.hold(user_id):
+            self._record_turn(user_id, user_query, "".join(chunks))
+
+    def _prepare_turn(self, user_id, user_query, rag_context, user_state):
+        """Builds (gemini_history, system_instruction, full_input) for one turn."""
+        # 2. Retrieve history for this specific User
+        session = self._get_session(user_id)
+        window, window_info = self.history_window.build(user_id, session)
+        print(
+            f"[Memory] {user_id}: sending {window_info['history_tokens_sent']} history tokens "
+            f"(saved {window_info['tokens_saved']})"
         )
+        metrics.HISTORY_TOKENS.inc(window_info["history_tokens_full"], kind="full")
+        metrics.HISTORY_TOKENS.inc(window_info["history_tokens_sent"], kind="sent")
+        metrics.HISTORY_TOKENS.inc(window_info["tokens_saved"], kind="saved")
         
-        # 5. UPDATE MEMORY & SAVE TO DISK
-        # Append the new interaction to our local state
-        new_user_turn = {"role": "user", "text": full_input}
-        new_model_turn = {"role": "model", "text": response_text}
-        
-        if user_id not in self.user_memories:
-            self.user_memories[user_id] = []
-            
-        self.user_memories[user_id].append(new_user_turn)
-        self.user_memories[user_id].append(new_model_turn)
-        
-        # Sync to JSON file immediately
-        self._save_history_to_disk()
-        
-        return response_text
+        # Gemini objects are built once per turn and reused while it stays in the window
+        gemini_history = [turn.content() for turn in window]
+
+        # 3. Build Input
+        # The system instruction is the static (cacheable) prefix; the student's
+        # profile rides along with the context + query as one user block
+        system_instruction = prompts.SENSEI_SYSTEM_PREFIX
+        full_input = prompts.sensei_turn_input(user_state, rag_context['text'], user_query)
+        return gemini_history, system_instruction, full_input
+
+    def _record_turn(self, user_id, user_query, response_text):
+        # Append the new interaction to our local state.
+        # We store the bare question, not the RAG chunk (that gets re-retrieved every turn anyway).
+        new_turns = [Turn("user", user_query), Turn("model", response_text)]
+        session = self._get_session(user_id)
+        session.extend(new_turns)
+        
+        # Append just this turn to the store (no whole-file rewrite)
+        self._save_turns(user_id, session, new_turns)
+
+        # Summarize whatever fell out of the window, off the request path
+        self.history_window.schedule_fold(user_id, session)
+
+    def _get_session(self, user_id):
+        """
+        Returns the in-memory session for a user, loading it from the store if
+        it isn't resident (first turn, or evicted as idle) and reloading it if
+        another worker has appended turns since.
+        """
+        session = self.sessions.get(user_id)
+        try:
+            version = self.store.version(user_id)
+        except Exception as e:
+            print(f"[System] Could not check history version for {user_id}: {e}")
+            if session is not None:
+                return session
+            version = None
+
+        if session is not None and session.version == version:
+            return session
 
-    def _load_history_from_disk(self):
-        """Loads the JSON database into memory on startup."""
-        if os.path.exists(HISTORY_FILE):
-            try:
-                with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-                    print(f"[System] Loading chat history from {HISTORY_FILE}...")
-                    return json.load(f)
-            except Exception as e:
-                print(f"[System] Error loading history: {e}. Starting fresh.")
-                return {}
-        return {}
-
-    def _save_history_to_disk(self):
-        """Saves the current memory state to JSON."""
         try:
-            with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-                json.dump(self.user_memories, f, indent=2, ensure_ascii=False)
+            turns = self.store.load(user_id)
+        except Exception as e:
+            print(f"[System] Error loading history for {user_id}: {e}. Starting fresh.")
+            turns = []
+        fresh = Session.from_dicts(turns, version)
+        if session is not None and session.summary[0] <= len(fresh):
+            fresh.summary = session.summary  # Still covers a prefix of the reloaded history
+        self.sessions.put(user_id, fresh)
+        return fresh
+
+    def _save_turns(self, user_id, session, turns):
+        """Appends new turns to the session store."""
+        try:
+            with metrics.timed("history_save"):
+                self.store.append(user_id, [t.to_dict() for t in turns])
+                session.version = self.store.version(user_id)
         except Exception as e:
             print(f"[System] Failed to save history: {e}")
 
-    def _build_system_prompt(self, user_state):
-        """
-        Dynamically builds the prompt based on user progress.
+    def _summarize_turns(self, previous_summary, turns):
         """
-        metrics = user_state.get('trade_metrics', {})
-        win_rate = metrics.get('win_rate', 'unknown')
-        
-        progress = user_state.get('learning_progress', {})
-        current = progress.get('current_chapter', 'Unknown')
-        
-        finished_list = progress.get('finished_chapters', [])
-        finished_str = ", ".join(finished_list) if finished_list else "None"
-        
-        unfinished_list = progress.get('unfinished_chapters', [])
-        unfinished_str = ", ".join(unfinished_list) if unfinished_list else "None"
-        
-        return f"""
-        You are "The Sensei", a wise, slightly strict, but caring trading mentor.
-        
-        === STUDENT PROFILE ===
-        • Recent Win Rate: {win_rate}
-        • Current Lesson:  {current}
-        • Completed Modules: [{finished_str}]
-        • Future Modules:    [{unfinished_str}]
-        
-        === INSTRUCTIONS ===
-        1. **Source of Truth:** Answer using ONLY the provided REFERENCE CONTEXT. If the answer is not there, admit ignorance.
-        2. **Contextual Teaching:**
-           - If the user asks about a topic in "Completed Modules", remind them they should already know this (be slightly disappointed).
-           - If the user asks about a topic in "Future Modules", tell them to be patient, as they will learn it soon.
-           - If the win rate is low (<50%), emphasize risk management and discipline.
-        3. **Tone:** concise (under 150 words), authoritative, using trading metaphors.
+        Folds older turns into the rolling summary. Returns None on failure
+        so the window keeps the previous summary.
         """
+        transcript = "\n".join(f"{t.role.upper()}: {t.text}" for t in turns)
+        try:
+            response = self.client.chat(
+                user_input=(
+                    f"CURRENT SUMMARY:\n{previous_summary or 'None'}\n\n"
+                    f"NEW TURNS:\n{transcript}\n\n"
+                    "Return the updated summary."
+                ),
+                system_instruction=prompts.SUMMARY_INSTRUCTION,
+                source="summary"
+            )
+        except (KeysUnavailableError, GenerationError):
+            return None
+        if not response:
+            return None
+        return response.strip()
 
     def _reject_with_humour(self, user_query):
         """
-        Uses the LLM to generate a dynamic, humorous rejection.
+        Serves a humorous rejection from the pool; falls back to asking the
+        LLM for one in "live" mode or when the pool is empty.
         """
         print(f"[Sensei] Rejecting query: '{user_query}'")
-        
-        rejection_instruction = """
-        You are "The Sensei". The student has asked a question that is OUTSIDE the "Scrolls of Knowledge" (your database).
-        
-        TASK:
-        Refuse to answer. You must be HUMOROUS, STERN, and use TRADING METAPHORS.
-        
-        Examples of style:
-        - "Focus! That question is like buying the top of a meme coin - foolish."
-        - "We are here to study charts, not the weather. Your focus is drifting like a loose stop-loss."
-        
-        Do NOT answer the question. Just scold them wittily.
-        """
-        
+
+        if config.REJECTION_MODE == "pool":
+            line = self.rejections.take()
+            if line:
+                return line
+
         # We assume rejection doesn't need history, just the current query
-        response = self.client.chat(
-            user_input=f"The student asked this off-topic question: '{user_query}'. Reject it.",
-            system_instruction=rejection_instruction
-        )
-        
-        return response
\ No newline at end of file
+        self.rejections.record_live()
+        with metrics.timed("rejection"):
+            try:
+                response = self.client.chat(
+                    user_input=f"The student asked this off-topic question: '{user_query}'. Reject it.",
+                    system_instruction=prompts.REJECTION_INSTRUCTION,
+                    source="rejection"
+                )
+            except (KeysUnavailableError, GenerationError):
+                # A canned line beats a 503 for a question we wouldn't answer anyway
+                response = self.rejections.take()
+                if response is None:
+                    raise
+        
+        return response
+
+    def _generate_rejection(self, recent):
+        """One generic rejection for the pool, worded unlike the recent ones."""
+        avoid = "\n".join(f"- {line}" for line in recent)
+        try:
+            response = self.client.chat(
+                user_input=(
+                    "Write ONE short rejection (max 2 sentences) for a student who asked an off-topic question. "
+                    f"Do not repeat these:\n{avoid}"
+                ),
+                system_instruction=prompts.REJECTION_INSTRUCTION,
+                source="rejection_pool"
+            )
+        except (KeysUnavailableError, GenerationError):
+            return None
+        if not response:
+            return None
+        return response.strip().strip('"')
@@ -0,0 +1,141 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+# Every cache registers itself here so /stats/cache can report all tiers
+CACHES = {}
+
+MISS = object()
+
+
+def normalize_query(text: str) -> str:
+    """'  What is a STOP-LOSS?? ' -> 'what is a stop loss'"""
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a per-entry time-to-live.
+    get() returns cache.MISS on a miss so that None / [] can be cached too.
+    """
+
+    def __init__(self, name, maxsize, ttl):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        CACHES[name] = self
+
+    def get(self, key):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self.data[key]
+                self.misses += 1
+                return MISS
+            self.data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+class SemanticCache:
+    """
+    Near-duplicate lookup: a hit is any stored entry with the same scope
+    (e.g. the routed tags) whose embedding has cosine similarity >= threshold.
+    Embeddings must be L2-normalised. Lookup is one matrix-vector product.
+    """
+
+    def __init__(self, name, maxsize, ttl, threshold):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.entries = OrderedDict()  # id -> (expires_at, scope, vector, value)
+        self.next_id = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        CACHES[name] = self
+
+    def get(self, vector, scope=None):
+        now = time.monotonic()
+        with self.lock:
+            expired = [k for k, e in self.entries.items() if e[0] < now]
+            for k in expired:
+                del self.entries[k]
+
+            candidates = [(k, e) for k, e in self.entries.items() if e[1] == scope]
+            if candidates:
+                matrix = np.stack([e[2] for _, e in candidates])
+                sims = matrix @ vector
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    key, entry = candidates[best]
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[3]
+
+            self.misses += 1
+            return MISS
+
+    def set(self, vector, value, scope=None):
+        with self.lock:
+            self.entries[self.next_id] = (time.monotonic() + self.ttl, scope, vector, value)
+            self.next_id += 1
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+def cache_stats():
+    return {name: c.stats() for name, c in CACHES.items()}
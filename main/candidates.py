@@ -0,0 +1,265 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+import numpy as np
+import config
+
+# Precomputed retrieval for the routes we see most: one glossary tag (or a
+# few) from the router, or the student's current / upcoming chapters.
+#
+#   python candidates.py build     (after every `python ingest.py run`)
+#
+# For every tag and chapter the job stores the ranked list of its chunks.
+# Chunk embeddings go into one .npy file that the server memory-maps, so a
+# routed query is a dot product over a few hundred rows instead of an ANN
+# search in Chroma; the reranker then works on that candidate set as usual.
+#
+# Layout of CANDIDATE_INDEX_DIR:
+#   index.json              chunks (id, text, metadata), ranked lists, build info
+#   embeddings-<build>.npy  float32 (n_chunks, dim), L2-normalised, row = chunk
+#
+# The build records a digest of every chunk's id, text and metadata; the
+# server ignores an index whose digest no longer matches the collection
+# (re-tagged or edited chunks keep the count but change the digest).
+
+
+def chapter_key(chapter) -> str:
+    """'2. Risk Management', '2' and 2 all mean chapter 2."""
+    match = re.match(r"\s*(\d+)", str(chapter))
+    return match.group(1) if match else str(chapter).strip().lower()
+
+
+def read_collection(collection, page_size=1000):
+    """(ids, documents, metadatas) of every chunk, paged."""
+    ids, docs, metas = [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        docs.extend(page["documents"])
+        metas.extend(page["metadatas"])
+        offset += len(page["ids"])
+    return ids, docs, metas
+
+
+def collection_digest(ids, docs, metas) -> str:
+    """Changes whenever any chunk is added, removed, edited or re-tagged."""
+    entries = sorted(
+        (chunk_id, hashlib.sha1((doc or "").encode("utf-8")).hexdigest(), json.dumps(meta or {}, sort_keys=True))
+        for chunk_id, doc, meta in zip(ids, docs, metas)
+    )
+    digest = hashlib.sha1()
+    for entry in entries:
+        digest.update("\x1f".join(entry).encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+def _rank(embeddings, rows, anchor, limit):
+    """rows sorted by cosine similarity to `anchor`, best first."""
+    rows = np.asarray(rows, dtype=np.int64)
+    order = np.argsort(-(embeddings[rows] @ anchor), kind="stable")
+    return rows[order][:limit].tolist()
+
+
+def build(collection=None, out_dir=config.CANDIDATE_INDEX_DIR, max_per_key=config.CANDIDATE_MAX_PER_KEY,
+          batch_size=128):
+    """
+    Reads every chunk, embeds it with the same encoder the query path uses
+    (so int8 / ONNX backends stay consistent), and writes the index.
+
+    - Tag lists are ranked by similarity to the glossary entry ("term: definition").
+    - Chapter lists are ranked by similarity to the chapter's centroid.
+    - With max_per_key, longer lists are cut and marked truncated; routes
+      through them go to the ANN search, so no chunk becomes unreachable.
+    """
+    import encoders
+    from rag import RAGPipeline, open_collection
+
+    start = time.time()
+    collection = collection or open_collection()
+    ids, docs, metas = read_collection(collection)
+    if not ids:
+        raise SystemExit("Collection is empty; run `python ingest.py run` first.")
+
+    print(f"[Candidates] Embedding {len(ids)} chunks...")
+    embeddings = np.vstack([
+        encoders.encode(docs[i:i + batch_size]) for i in range(0, len(docs), batch_size)
+    ]).astype(np.float32)
+
+    by_tag, by_chapter = {}, {}
+    for row, meta in enumerate(metas):
+        for tag in RAGPipeline.chunk_tags(meta):
+            by_tag.setdefault(tag, []).append(row)
+        if (meta or {}).get("chapter") is not None:
+            by_chapter.setdefault(chapter_key(meta["chapter"]), []).append(row)
+
+    try:
+        with open(config.GLOSSARY_PATH, "r", encoding="utf-8") as f:
+            glossary = json.load(f)
+    except FileNotFoundError:
+        glossary = {}
+
+    lists, truncated = {}, []
+    tags = sorted(by_tag)
+    if tags:
+        anchors = encoders.encode([f"{t}: {glossary.get(t, '')}".strip(": ") for t in tags])
+        for tag, anchor in zip(tags, anchors):
+            lists[f"tag:{tag}"] = _rank(embeddings, by_tag[tag], anchor, max_per_key)
+            if len(lists[f"tag:{tag}"]) < len(by_tag[tag]):
+                truncated.append(f"tag:{tag}")
+    for chapter, rows in by_chapter.items():
+        centroid = embeddings[rows].mean(axis=0)
+        centroid /= np.linalg.norm(centroid) or 1.0
+        lists[f"chapter:{chapter}"] = _rank(embeddings, rows, centroid, max_per_key)
+        if len(lists[f"chapter:{chapter}"]) < len(rows):
+            truncated.append(f"chapter:{chapter}")
+
+    # Write the new build next to the old one, then switch index.json over atomically
+    os.makedirs(out_dir, exist_ok=True)
+    build_id = time.strftime("%Y%m%d%H%M%S")
+    emb_name = f"embeddings-{build_id}.npy"
+    np.save(os.path.join(out_dir, emb_name), embeddings)
+    index = {
+        "build_id": build_id,
+        "created_at": time.time(),
+        "collection_count": len(ids),
+        "digest": collection_digest(ids, docs, metas),
+        "dim": int(embeddings.shape[1]),
+        "embeddings": emb_name,
+        "chunks": [{"id": i, "text": d, "metadata": m} for i, d, m in zip(ids, docs, metas)],
+        "lists": lists,
+        "truncated": sorted(truncated),
+    }
+    tmp_path = os.path.join(out_dir, "index.json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(out_dir, "index.json"))
+
+    for old in glob.glob(os.path.join(out_dir, "embeddings-*.npy")):
+        if os.path.basename(old) != emb_name:
+            os.remove(old)
+
+    summary = {
+        "chunks": len(ids),
+        "tags": len(by_tag),
+        "chapters": len(by_chapter),
+        "largest_list": max((len(v) for v in lists.values()), default=0),
+        "truncated_lists": len(truncated),
+        "seconds": round(time.time() - start, 1),
+    }
+    print(f"[Candidates] Index written to {out_dir}: {summary}")
+    return summary
+
+
+class CandidateIndex:
+    """
+    Read side of the precomputed index (see module comment).
+
+    - rows_for() resolves a route to the union of its ranked lists, or None
+      if any routed tag isn't in the index or its list was truncated (then
+      the caller does the ANN search).
+    - nearest() ranks those rows against the query vector on the memory-mapped
+      embeddings and returns candidates in the same shape as a Chroma fetch.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, "index.json"), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        self.build_id = index["build_id"]
+        self.collection_count = index["collection_count"]
+        self.digest = index.get("digest")
+        self.embeddings = np.load(os.path.join(directory, index["embeddings"]), mmap_mode="r")
+        self.chunks = index["chunks"]
+        self.lists = {key: np.asarray(rows, dtype=np.int64) for key, rows in index["lists"].items()}
+        self.truncated = set(index.get("truncated", ()))
+
+    @classmethod
+    def load(cls, directory=config.CANDIDATE_INDEX_DIR, expected_digest=None):
+        """
+        The index, or None if it is missing or was built from a different
+        collection. expected_digest is collection_digest() of the live
+        collection, or a function returning it (only called if there is an index).
+        """
+        if not os.path.exists(os.path.join(directory, "index.json")):
+            print(f"[Candidates] No precomputed index in {directory}; every query uses ANN search.")
+            return None
+        index = cls(directory)
+        if callable(expected_digest):
+            expected_digest = expected_digest()
+        if expected_digest is not None and index.digest != expected_digest and not config.CANDIDATE_ALLOW_STALE:
+            print(
+                f"[Candidates] Index {index.build_id} doesn't match the collection (chunks added, edited "
+                f"or re-tagged since); ignoring it. Run `python candidates.py build`."
+            )
+            return None
+        print(f"[Candidates] Index {index.build_id} ready ({len(index.chunks)} chunks, {len(index.lists)} lists).")
+        return index
+
+    def has_chapter(self, chapter) -> bool:
+        key = f"chapter:{chapter_key(chapter)}"
+        return key in self.lists and key not in self.truncated
+
+    def rows_for(self, tags=None, chapters=None):
+        if tags:
+            keys = [f"tag:{t}" for t in tags]
+        else:
+            keys = [f"chapter:{chapter_key(c)}" for c in chapters or []]
+            keys = [k for k in keys if k in self.lists]
+        if not keys or any(k not in self.lists or k in self.truncated for k in keys):
+            return None
+        if len(keys) == 1:
+            return self.lists[keys[0]]
+        return np.unique(np.concatenate([self.lists[k] for k in keys]))
+
+    def nearest(self, query_vec, rows, limit) -> list:
+        sims = self.embeddings[rows] @ np.asarray(query_vec, dtype=np.float32)
+        if len(rows) > limit:
+            top = np.argpartition(-sims, limit - 1)[:limit]
+            top = top[np.argsort(-sims[top], kind="stable")]
+        else:
+            top = np.argsort(-sims, kind="stable")
+        candidates = []
+        for i in top:
+            chunk = self.chunks[int(rows[i])]
+            candidates.append({"id": chunk["id"], "text": chunk["text"], "metadata": chunk["metadata"],
+                               "similarity": float(sims[i])})
+        return candidates
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute per-tag / per-chapter retrieval candidates.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_cmd = sub.add_parser("build", help="Embed every chunk and write the candidate index")
+    build_cmd.add_argument("--out", default=config.CANDIDATE_INDEX_DIR)
+    build_cmd.add_argument("--max-per-key", type=int, default=config.CANDIDATE_MAX_PER_KEY,
+                           help="Cap per list; capped lists fall back to ANN search (default: no cap)")
+
+    info_cmd = sub.add_parser("info", help="Summarize an existing index")
+    info_cmd.add_argument("--dir", default=config.CANDIDATE_INDEX_DIR)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        build(out_dir=args.out, max_per_key=args.max_per_key)
+    else:
+        index = CandidateIndex(args.dir)
+        sizes = [len(rows) for rows in index.lists.values()]
+        print(json.dumps({
+            "build_id": index.build_id,
+            "chunks": len(index.chunks),
+            "dim": int(index.embeddings.shape[1]),
+            "tag_lists": sum(k.startswith("tag:") for k in index.lists),
+            "chapter_lists": sum(k.startswith("chapter:") for k in index.lists),
+            "truncated_lists": len(index.truncated),
+            "digest": index.digest,
+            "mean_list_size": round(sum(sizes) / len(sizes), 1) if sizes else 0,
+        }, indent=2))
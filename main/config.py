@@ -28,5 +28,169 @@ GEMINI_MODEL_NAME = "gemini-2.5-flash-lite" # The Brain
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
 
+# Inference backend for both models: "torch" (fp32), "onnx" (ONNX Runtime fp32)
+# or "int8" (ONNX Runtime, dynamically int8-quantized). Check with: python inference.py --parity
+INFERENCE_BACKEND = "torch"
+INFERENCE_THREADS = os.cpu_count() or 1 # Intra-op threads per model
+INT8_QUANTIZATION = "avx2" # ORT quantization preset: "avx2", "avx512", "avx512_vnni" or "arm64"
+MODEL_CACHE_DIR = "../model_cache" # Exported / quantized models are kept here
+
 #  THRESHOLDS 
-LOGIT_THRESHOLD = 0.0
\ No newline at end of file
+LOGIT_THRESHOLD = 0.0
+
+#  ROUTER 
+ROUTER_MODE = "local" # "local" (embedding similarity) or "llm" (Groq classification)
+ROUTER_TOP_K = 3
+ROUTER_SIM_THRESHOLD = 0.35 # Min cosine similarity for a tag to be returned
+ROUTER_LLM_FALLBACK = False # In local mode, ask Groq when the best match is weak
+ROUTER_FALLBACK_THRESHOLD = 0.45 # "Weak" = best similarity below this
+ROUTER_FAST_PATH = True # Queries naming a glossary term skip embeddings / Groq entirely
+ROUTER_FUZZY_MIN_LENGTH = 5 # Shortest query word the fast path will typo-correct
+ROUTER_AMBIGUOUS_TERMS = ("short", "long", "call", "put", "ask", "bid", "gap", "range", "order", "position", "volume", "margin") # Everyday words; never matched by the fast path
+ROUTER_LLM_JSON_MODE = True # Ask Groq for a JSON object (response_format); replies are validated either way
+
+#  CONCURRENCY 
+# Network-bound stages (router, Gemini, disk) share the I/O pool.
+# Embedding / reranking are CPU-bound, so that pool matches the core count.
+IO_WORKERS = 32
+CPU_WORKERS = os.cpu_count() or 1
+MAX_PENDING_REQUESTS = 64 # Admission limit (running + waiting) before we shed load
+RETRY_AFTER_SECONDS = 2
+BATCH_MAX_SIZE = 256 # Items per /chat/batch call
+BATCH_GEMINI_CONCURRENCY = 8 # Gemini calls in flight per batch
+SCHEDULER_COALESCE = True # Identical in-flight queries from one user share a single execution
+
+#  MULTI-WORKER 
+# SENSEI_WORKERS=4 python server_main.py  (or: SENSEI_WORKERS=4 uvicorn server_main:app --workers 4)
+# Every worker loads its own models; sessions and profiles are shared on disk.
+WORKERS = int(os.getenv("SENSEI_WORKERS", "1"))
+USER_LOCK_DIR = "locks" # Per-user lock files shared by the workers
+USER_LOCK_STRIPES = 256
+USER_LOCK_TIMEOUT_SECONDS = 10 # Longest wait for a user's history lock (held only for reads / appends) before a 503
+PROFILE_REFRESH_SECONDS = 2.0 # How often a worker pulls profile changes made by the others
+
+#  SESSION STORE 
+SESSION_BACKEND = "jsonl" # "jsonl" (append-only log) or "sqlite"
+SESSION_LOG_PATH = "chat_sessions.jsonl"
+SESSION_SQLITE_PATH = "chat_sessions.db"
+LEGACY_HISTORY_FILE = "chat_sessions.json" # Imported once if no log exists yet
+SESSION_COMPACT_EVERY = 1000 # Appends between checks for something to compact
+SESSION_MAX_TURNS_PER_USER = None # Keep only this many turns per user on disk (None = keep all)
+
+#  CONVERSATION MEMORY 
+HISTORY_MAX_TURNS = 8 # Most recent messages (user + model) sent verbatim
+HISTORY_TOKEN_BUDGET = 1500 # Max estimated tokens for the verbatim window
+SUMMARY_FOLD_BATCH = 4 # Fold older messages into the summary once this many have fallen out
+SUMMARY_MAX_INPUT_TURNS = 40 # Cap on messages fed to a single summarization call
+HISTORY_CACHE_MAX_SESSIONS = 2000 # Users whose history stays in memory (LRU); others reload on demand
+
+#  CACHES 
+CACHE_TTL_SECONDS = 3600
+ROUTER_CACHE_SIZE = 5000 # normalized query -> tags
+RETRIEVAL_CACHE_SIZE = 2000 # (normalized query, tags) -> best chunk
+EMBEDDING_CACHE_SIZE = 10000 # normalized query -> vector
+SEMANTIC_CACHE_ENABLED = False # Reuse retrieval results for near-duplicate queries
+SEMANTIC_CACHE_SIZE = 1000
+SEMANTIC_CACHE_THRESHOLD = 0.95 # Cosine similarity needed to count as a near-duplicate
+
+#  MICRO-BATCHING 
+# Concurrent requests' encoder work is merged into one forward pass.
+MICRO_BATCHING_ENABLED = True
+RERANK_MAX_BATCH = 64 # (query, doc) pairs per Cross-Encoder pass
+RERANK_MAX_WAIT_MS = 5
+EMBED_MAX_BATCH = 32 # queries per bi-encoder pass
+EMBED_MAX_WAIT_MS = 3
+
+#  GEMINI KEY POOL 
+GEMINI_RPM_PER_KEY = 15 # Token-bucket refill rate per key
+GEMINI_BURST_PER_KEY = 5 # Bucket capacity
+GEMINI_KEY_COOLDOWN_SECONDS = 60 # How long a key sits out after a 429
+GEMINI_MAX_ATTEMPTS = 6
+GEMINI_BACKOFF_BASE_SECONDS = 0.5 # Exponential backoff (full jitter) on 5xx
+GEMINI_BACKOFF_MAX_SECONDS = 8
+GEMINI_ACQUIRE_TIMEOUT_SECONDS = 15 # Give up if no key frees up within this window
+
+#  USER PROFILE STORE 
+PROFILE_BACKEND = "sqlite" # "sqlite" (per-user rows) or "json" (atomic whole-file flush)
+PROFILE_DB_PATH = "../document_db/users_db.sqlite"
+# "sync": every change is written before we answer (no data-loss window)
+# "interval": dirty profiles are flushed every PROFILE_FLUSH_INTERVAL_SECONDS (loss window = interval)
+# "shutdown": only flushed on clean shutdown
+PROFILE_DURABILITY = "interval"
+PROFILE_FLUSH_INTERVAL_SECONDS = 2.0
+
+#  PIPELINING 
+# "speculative": start an unfiltered over-fetch while the router runs, then filter by tags locally
+# "sequential": route -> filtered Chroma query -> rerank
+PIPELINE_MODE = "speculative"
+SPECULATIVE_OVERFETCH = 30 # Unfiltered candidates fetched during routing
+
+#  HYBRID RETRIEVAL 
+RETRIEVAL_MODE = "hybrid" # "hybrid" (BM25 + dense, RRF) or "dense" (Chroma only)
+HYBRID_DENSE_FETCH = 30 # Unfiltered dense candidates; tag filter is applied locally
+HYBRID_LEXICAL_FETCH = 20 # BM25 candidates
+HYBRID_LEXICAL_IGNORES_TAGS = True # Let exact glossary-term hits through even if routing picked the wrong tags
+RRF_K = 60 # Reciprocal rank fusion constant
+
+#  CANDIDATE INDEX 
+# python candidates.py build  -> per-tag / per-chapter chunk lists + memory-mapped embeddings
+CANDIDATE_INDEX_ENABLED = True # Used when the index exists; otherwise every query does the ANN search
+CANDIDATE_INDEX_DIR = "../datasets/candidate_index"
+CANDIDATE_MAX_PER_KEY = None # Cap per tag / chapter list (None = keep all); capped lists fall back to ANN search
+CANDIDATE_CHAPTER_SCOPE = True # Untagged queries search the student's current + upcoming chapters first
+CANDIDATE_ALLOW_STALE = False # Use an index whose digest no longer matches the collection
+
+#  ADAPTIVE RERANKING 
+# Uses the dense (Chroma) distances to decide how much Cross-Encoder work a query needs.
+# Off until the calibration below is fitted: run with ADAPTIVE_RERANK_REPORT and
+# copy /stats/rerank "suggested_calibration" here.
+ADAPTIVE_RERANK = False
+ADAPTIVE_SKIP_MIN_SIMILARITY = 0.75 # Top hit at least this similar...
+ADAPTIVE_SKIP_MIN_GAP = 0.12 # ...and this far ahead of #2 -> skip the Cross-Encoder
+ADAPTIVE_PARTIAL_MIN_GAP = 0.05 # Clear leader -> rerank only the top M
+ADAPTIVE_TOP_M = 2
+ADAPTIVE_ESCALATE_MAX_SIMILARITY = 0.35 # Weak top hit -> rerank a bigger pool
+ADAPTIVE_ESCALATE_K = 15
+# Maps cosine similarity onto the Cross-Encoder logit scale (fit with the report mode).
+# None = not fitted yet: the "skip" path is never taken.
+CALIBRATION_SLOPE = None
+CALIBRATION_INTERCEPT = None
+ADAPTIVE_RERANK_REPORT = False # Also run the full rerank to measure top-1 agreement (slow)
+
+#  STARTUP 
+# Models load in the background; /ready (and /chat) return 503 until this finishes.
+STARTUP_PARALLEL = True # Load router, RAG and brain on parallel threads
+STARTUP_WARMUP = True # One inference per model before /ready turns green
+
+#  BENCHMARK 
+# python -m benchmark (fake Gemini / Groq, synthetic KB, load generator)
+BENCH_DATA_DIR = "../benchmark_data"
+BENCH_BASELINE_PATH = "benchmark/baselines.json"
+BENCH_REGRESSION_TOLERANCE = 0.15 # Allowed slowdown (and throughput drop) vs a baseline
+
+#  INGESTION 
+# python ingest.py extract Trading_Book.docx && python ingest.py run
+GROQ_INGEST_KEYS = [
+    os.getenv("ROUTER"),
+    os.getenv("GROQ_API_KEY"),
+    os.getenv("SECONDGROQ_API")
+]
+INGEST_TAG_MODEL_NAME = ROUTER_LLM_MODEL_NAME
+INGEST_MARKDOWN_DIR = "../datasets/RAG_Knowledge_Base"
+INGEST_CHECKPOINT_PATH = "../datasets/ingest_checkpoint.jsonl"
+INGEST_WORKERS = 8 # Concurrent tagging calls
+INGEST_RPM_PER_KEY = 30 # Groq requests per minute per key
+INGEST_KEY_COOLDOWN_SECONDS = 60
+INGEST_MAX_ATTEMPTS = 5
+INGEST_MIN_CHUNK_CHARS = 50 # Shorter chunks (headers) get no tags and no LLM call
+INGEST_UPSERT_BATCH = 128 # Chunks per embed + upsert call
+
+#  REJECTIONS 
+# Off-topic queries are answered from a pool of pre-generated rejections
+REJECTION_MODE = "pool" # "pool" or "live" (one Gemini call per rejection)
+REJECTION_POOL_SIZE = 20
+REJECTION_REFRESH_SECONDS = 30 # How often the background refresher checks the pool
+REJECTION_IDLE_SECONDS = 20 # Only generate when no request came in for this long
+REJECTION_MAX_AGE_SECONDS = 6 * 3600 # Rotate lines out after this long
+REJECTION_SHORT_CIRCUIT = False # Skip routing + retrieval for queries with no trading vocabulary (needs the glossary)
+REJECTION_MIN_TOKENS = 2 # Shorter queries are never short-circuited
@@ -0,0 +1,84 @@
+import threading
+import config
+import inference
+from cache import TTLCache, MISS, normalize_query
+from batcher import MicroBatcher
+import metrics
+
+# One copy of the bi-encoder shared by the router and the RAG query path
+_embedder = None
+_embedder_lock = threading.Lock()
+
+# Router and RAG both embed the same query; this makes the second one free
+embedding_cache = TTLCache("query_embedding", config.EMBEDDING_CACHE_SIZE, config.CACHE_TTL_SECONDS)
+
+# Cache misses from concurrent requests are embedded together
+_query_batcher = None
+
+
+def get_embedder():
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = inference.load_embedder()
+    return _embedder
+
+
+def encode(texts: list):
+    """Returns L2-normalised float32 embeddings, shape (len(texts), dim)."""
+    return get_embedder().encode(
+        texts,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=False
+    )
+
+
+def encode_query(text: str):
+    """Single-query encode with caching on the normalized text."""
+    key = normalize_query(text)
+    vector = embedding_cache.get(key)
+    if vector is MISS:
+        with metrics.timed("embed"):
+            if config.MICRO_BATCHING_ENABLED:
+                vector = _get_query_batcher().submit([text])[0]
+            else:
+                vector = encode([text])[0]
+        embedding_cache.set(key, vector)
+    return vector
+
+
+def encode_queries(texts: list) -> list:
+    """
+    Batch version of encode_query(): cache misses (deduplicated) go through
+    one encode() call. Returns one vector per input text, in order.
+    """
+    keys = [normalize_query(t) for t in texts]
+    vectors = {}
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key in vectors or key in missing:
+            continue
+        vector = embedding_cache.get(key)
+        if vector is MISS:
+            missing[key] = text
+        else:
+            vectors[key] = vector
+
+    if missing:
+        with metrics.timed("embed"):
+            encoded = encode(list(missing.values()))
+        for key, vector in zip(missing, encoded):
+            embedding_cache.set(key, vector)
+            vectors[key] = vector
+    return [vectors[key] for key in keys]
+
+
+def _get_query_batcher() -> MicroBatcher:
+    global _query_batcher
+    with _embedder_lock:
+        if _query_batcher is None:
+            _query_batcher = MicroBatcher(
+                "embed", encode, config.EMBED_MAX_BATCH, config.EMBED_MAX_WAIT_MS
+            )
+    return _query_batcher
@@ -0,0 +1,137 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import config
+
+_STREAM_END = object()
+
+
+class QueueFullError(Exception):
+    """Raised when the server is already holding MAX_PENDING_REQUESTS requests."""
+    pass
+
+
+class AdmissionSlot:
+    """
+    One admitted request. release() is idempotent, so every path that may end
+    the request (a stream's body, its background task, a finalizer) can call it.
+    """
+
+    __slots__ = ("executor", "released")
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.released = False
+
+    def release(self):
+        with self.executor.lock:
+            if self.released:
+                return
+            self.released = True
+            self.executor.pending -= 1
+
+
+class PipelineExecutor:
+    """
+    Runs the blocking pipeline stages off the event loop.
+
+    - I/O pool:  Groq router call, Gemini call, JSON writes.
+    - CPU pool:  Embedding + Cross-Encoder reranking (sized to cores so
+                 requests don't thrash each other).
+    - Admission: a bounded counter of in-flight requests. When it's full we
+                 refuse immediately instead of letting the queue (and p99) grow.
+    """
+
+    def __init__(self, io_workers=config.IO_WORKERS, cpu_workers=config.CPU_WORKERS,
+                 max_pending=config.MAX_PENDING_REQUESTS):
+        self.io_pool = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="sensei-io")
+        self.cpu_pool = ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix="sensei-cpu")
+        self.max_pending = max_pending
+        self.pending = 0
+        self.lock = threading.Lock()  # Slots may be released from a finalizer, off the event loop
+
+    @asynccontextmanager
+    async def admit(self):
+        """Reserves a slot for one request."""
+        slot = self.acquire()
+        try:
+            yield
+        finally:
+            slot.release()
+
+    def acquire(self) -> AdmissionSlot:
+        """Non-context version of admit(), for streams that outlive the handler."""
+        with self.lock:
+            if self.pending >= self.max_pending:
+                raise QueueFullError(f"{self.pending} requests already pending")
+            self.pending += 1
+        return AdmissionSlot(self)
+
+    async def run_io(self, fn, *args, **kwargs):
+        return await self._run(self.io_pool, fn, *args, **kwargs)
+
+    async def run_cpu(self, fn, *args, **kwargs):
+        return await self._run(self.cpu_pool, fn, *args, **kwargs)
+
+    async def _run(self, pool, fn, *args, **kwargs):
+        # Carry context vars (per-request metrics breakdown) into the worker thread
+        ctx = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, functools.partial(ctx.run, fn, *args, **kwargs))
+
+    async def stream_io(self, gen_fn, *args, **kwargs):
+        """
+        Drives a blocking generator on the I/O pool and re-yields its items
+        on the event loop as they arrive. If the consumer stops early
+        (closed or cancelled), the pump stops at the next item and closes
+        the generator, so its cleanup (e.g. freeing a Gemini key) runs then.
+        """
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def emit(item):
+            try:
+                loop.call_soon_threadsafe(items.put_nowait, item)
+            except RuntimeError:
+                pass  # Loop closed (shutdown); let the generator finish anyway
+
+        def pump():
+            gen = gen_fn(*args, **kwargs)
+            try:
+                for item in gen:
+                    if cancelled.is_set():
+                        break
+                    emit((item, None))
+                emit((_STREAM_END, None))
+            except Exception as e:
+                emit((_STREAM_END, e))
+            finally:
+                gen.close()
+
+        self.io_pool.submit(contextvars.copy_context().run, pump)
+        try:
+            while True:
+                item, error = await items.get()
+                if item is _STREAM_END:
+                    if error:
+                        raise error
+                    return
+                yield item
+        finally:
+            cancelled.set()
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "io_workers": self.io_pool._max_workers,
+            "cpu_workers": self.cpu_pool._max_workers,
+        }
+
+    def shutdown(self):
+        self.io_pool.shutdown(wait=False, cancel_futures=True)
+        self.cpu_pool.shutdown(wait=False, cancel_futures=True)
@@ -1,68 +1,272 @@
 from google import genai
 from google.genai import types
+from collections import deque
+import math
+import random
+import threading
 import time
 import config
+from ratelimit import TokenBucket, KeysUnavailableError, GenerationError
+import metrics
+import prompts
+
+RESUME_MESSAGE = "Continue your previous answer exactly where it stopped. Do not repeat anything."
+
+
+class KeySlot:
+    """One API key with its own client, rate limiter, cooldown and counters."""
+
+    def __init__(self, idx, api_key):
+        self.idx = idx
+        self.client = genai.Client(api_key=api_key)
+        self.bucket = TokenBucket(
+            rate=config.GEMINI_RPM_PER_KEY / 60.0,
+            capacity=config.GEMINI_BURST_PER_KEY
+        )
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.recent = deque()  # Start times of requests in the last 60s
+        self.stats = {"requests": 0, "successes": 0, "rate_limited": 0, "unavailable": 0, "errors": 0}
+
 
 class ResilientClient:
+    """
+    Gemini client over a pool of API keys, safe to share between threads.
+
+    - Each key has a token bucket (GEMINI_RPM_PER_KEY) so we stay under quota
+      instead of discovering it through 429s.
+    - New requests go to the least-loaded ready key (fewest in-flight calls).
+    - A 429 puts only that key in cooldown; the request moves to another key.
+    - 5xx errors are retried with exponential backoff + full jitter.
+    - System instructions are static (per-turn data goes in the user
+      message), so Gemini's implicit prefix caching can serve them; cached
+      token counts are recorded per caller.
+    - chat()/chat_stream() are blocking (callers run them on the I/O pool).
+    - Failures are raised, never returned as text: KeysUnavailableError when
+      no key is usable, GenerationError for any other error.
+    """
+
     def __init__(self, api_keys, model=config.GEMINI_MODEL_NAME, verbose=True):
         self.keys = [k for k in api_keys if k]
         self.model = model
         self.verbose = verbose
-        self.current_key_idx = 0
-        
+
         if not self.keys:
             raise ValueError("No valid API keys provided.")
-        self._init_client()
 
-    def _init_client(self):
-        self.client = genai.Client(api_key=self.keys[self.current_key_idx])
+        self.slots = [KeySlot(i, k) for i, k in enumerate(self.keys)]
+        self.lock = threading.Lock()
+
+    # --- KEY SELECTION ---
+
+    def _try_acquire(self):
+        """Returns (slot, 0) on success, else (None, seconds until a key might be free)."""
+        now = time.monotonic()
+        with self.lock:
+            ready = [s for s in self.slots if s.cooldown_until <= now]
+            ready.sort(key=lambda s: (s.in_flight, -s.bucket.available()))
+            for slot in ready:
+                if slot.bucket.try_take():
+                    slot.in_flight += 1
+                    slot.stats["requests"] += 1
+                    slot.recent.append(now)
+                    return slot, 0.0
+
+            waits = [
+                max(s.cooldown_until - now, 0.0) + s.bucket.time_until_available()
+                for s in self.slots
+            ]
+        return None, max(0.01, min(waits))
+
+    def _acquire(self, deadline):
+        """A slot, or KeysUnavailableError once the next free key is past the deadline."""
+        while True:
+            slot, wait = self._try_acquire()
+            if slot:
+                return slot
+            if time.monotonic() + wait > deadline:
+                raise KeysUnavailableError(max(config.RETRY_AFTER_SECONDS, math.ceil(wait)))
+            time.sleep(wait)
+
+    def _release(self, slot, outcome, error=None):
+        with self.lock:
+            slot.in_flight -= 1
+            if outcome == "ok":
+                slot.stats["successes"] += 1
+            elif outcome == "rate_limit":
+                slot.stats["rate_limited"] += 1
+                slot.cooldown_until = time.monotonic() + config.GEMINI_KEY_COOLDOWN_SECONDS
+            elif outcome == "unavailable":
+                slot.stats["unavailable"] += 1
+            else:
+                slot.stats["errors"] += 1
+
+        metrics.GEMINI_KEY_EVENTS.inc(key=slot.idx, event=outcome)
+
+        if self.verbose and outcome == "rate_limit":
+            print(f"[System] Key {slot.idx} unavailable (Quota Exhausted). "
+                  f"Cooling down for {config.GEMINI_KEY_COOLDOWN_SECONDS}s.")
+        elif self.verbose and outcome == "unavailable":
+            print(f"[System] Key {slot.idx} got a 5xx ({error}). Backing off.")
+
+    @staticmethod
+    def _classify(error):
+        code = getattr(error, "code", None)
+        error_msg = str(error).upper()
+        if code == 429 or "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
+            return "rate_limit"
+        if code in (500, 502, 503, 504) or "503" in error_msg or "UNAVAILABLE" in error_msg:
+            return "unavailable"
+        return "error"
+
+    @staticmethod
+    def _backoff(attempt):
+        ceiling = min(config.GEMINI_BACKOFF_MAX_SECONDS, config.GEMINI_BACKOFF_BASE_SECONDS * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    @staticmethod
+    def _record_usage(response, source):
+        """Token counts from usage_metadata (streams only carry it on the final chunk)."""
+        usage = getattr(response, "usage_metadata", None)
+        if not usage:
+            return
+        prompt = getattr(usage, "prompt_token_count", None) or 0
+        cached = getattr(usage, "cached_content_token_count", None) or 0
+        output = getattr(usage, "candidates_token_count", None) or 0
+        if prompt or output:
+            metrics.GEMINI_TOKENS.inc(prompt, kind="prompt")
+            metrics.GEMINI_TOKENS.inc(cached, kind="cached")
+            metrics.GEMINI_TOKENS.inc(output, kind="output")
+            prompts.USAGE.record(source, prompt, cached)
+
+    # --- REQUEST HELPERS ---
+
+    @staticmethod
+    def _make_config(system_instruction):
+        if not system_instruction:
+            return None
+        return types.GenerateContentConfig(
+            system_instruction=system_instruction,
+            temperature=0.7
+        )
+
+    @staticmethod
+    def _stream_request(user_input, history, emitted):
+        """
+        First attempt: the normal request. After a mid-stream failure: replay the
+        partial answer as a model turn and ask the next key to carry on.
+        """
+        if not emitted:
+            return history, user_input
+        session_history = history + [
+            types.Content(role="user", parts=[types.Part(text=user_input)]),
+            types.Content(role="model", parts=[types.Part(text="".join(emitted))]),
+        ]
+        return session_history, RESUME_MESSAGE
 
-    def _rotate_key(self, reason):
-        prev_idx = self.current_key_idx
-        self.current_key_idx = (self.current_key_idx + 1) % len(self.keys)
-        if self.verbose:
-            print(f"[System] Key {prev_idx} unavailable ({reason}). Switching to Key {self.current_key_idx}.")
-        self._init_client()
+    # --- BLOCKING API ---
 
-    def chat(self, user_input, history=None, system_instruction=None):
+    def chat(self, user_input, history=None, system_instruction=None, source="answer"):
         """
         Now accepts 'history' as an argument for this specific turn.
         """
         if history is None:
             history = []
 
-        attempts = 0
-        # Configuration for system instruction
-        sys_config = None
-        if system_instruction:
-            sys_config = types.GenerateContentConfig(
-                system_instruction=system_instruction,
-                temperature=0.7 
-            )
+        deadline = time.monotonic() + config.GEMINI_ACQUIRE_TIMEOUT_SECONDS
 
-        while attempts < len(self.keys):
+        for attempt in range(config.GEMINI_MAX_ATTEMPTS):
+            slot = self._acquire(deadline)
+            sys_config = self._make_config(system_instruction)
             try:
                 # Create a session using the USER'S specific history
-                chat_session = self.client.chats.create(
+                chat_session = slot.client.chats.create(
                     model=self.model,
                     history=history,
                     config=sys_config
                 )
-                
                 response = chat_session.send_message(user_input)
-                
-                # We return the text AND the new turn data so the Brain can save it
+                self._release(slot, "ok")
+                self._record_usage(response, source)
                 return response.text
 
             except Exception as e:
-                error_msg = str(e).upper()
-                if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
-                    self._rotate_key("Quota Exhausted")
-                    attempts += 1
-                elif "503" in error_msg:
-                    time.sleep(1)
-                    attempts += 1
-                else:
-                    return f"System Error: {e}"
-                    
-        return "System Notification: All API keys are currently unavailable."
\ No newline at end of file
+                outcome = self._classify(e)
+                self._release(slot, outcome, e)
+                if outcome == "unavailable":
+                    time.sleep(self._backoff(attempt))
+                elif outcome == "error":
+                    raise GenerationError(str(e)) from e
+
+        # Every attempt hit a 5xx
+        raise KeysUnavailableError(config.RETRY_AFTER_SECONDS)
+
+    def chat_stream(self, user_input, history=None, system_instruction=None, source="answer"):
+        """
+        Same as chat(), but yields text chunks as Gemini produces them.
+
+        If a key dies before anything was sent we simply retry on another key.
+        If it dies mid-answer we ask the next key to continue from the partial
+        answer, so the caller just sees the stream carry on.
+        """
+        if history is None:
+            history = []
+
+        deadline = time.monotonic() + config.GEMINI_ACQUIRE_TIMEOUT_SECONDS
+        emitted = []
+
+        for attempt in range(config.GEMINI_MAX_ATTEMPTS):
+            slot = self._acquire(deadline)
+            sys_config = self._make_config(system_instruction)
+            try:
+                session_history, message = self._stream_request(user_input, history, emitted)
+                last_chunk = None
+                chat_session = slot.client.chats.create(
+                    model=self.model,
+                    history=session_history,
+                    config=sys_config
+                )
+                for chunk in chat_session.send_message_stream(message):
+                    last_chunk = chunk
+                    if chunk.text:
+                        emitted.append(chunk.text)
+                        yield chunk.text
+                self._release(slot, "ok")
+                self._record_usage(last_chunk, source)
+                return
+
+            except GeneratorExit:
+                # Consumer went away mid-stream: free the slot, don't retry
+                self._release(slot, "ok")
+                raise
+
+            except Exception as e:
+                outcome = self._classify(e)
+                self._release(slot, outcome, e)
+                if outcome == "unavailable":
+                    time.sleep(self._backoff(attempt))
+                elif outcome == "error":
+                    raise GenerationError(str(e)) from e
+
+        raise KeysUnavailableError(config.RETRY_AFTER_SECONDS)
+
+    # --- OBSERVABILITY ---
+
+    def stats(self):
+        """Per-key load, utilization (share of RPM used in the last minute) and error counts."""
+        now = time.monotonic()
+        report = []
+        with self.lock:
+            for slot in self.slots:
+                while slot.recent and slot.recent[0] < now - 60:
+                    slot.recent.popleft()
+                report.append({
+                    "key": slot.idx,
+                    "in_flight": slot.in_flight,
+                    "requests_last_minute": len(slot.recent),
+                    "utilization": round(len(slot.recent) / config.GEMINI_RPM_PER_KEY, 3),
+                    "tokens_available": round(slot.bucket.available(), 2),
+                    "cooldown_remaining_s": round(max(0.0, slot.cooldown_until - now), 1),
+                    **slot.stats,
+                })
+        return report
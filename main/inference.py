@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import numpy as np
+import config
+
+# Loads the bi-encoder and Cross-Encoder on the configured backend.
+# ONNX exports and int8-quantized copies are written to MODEL_CACHE_DIR once
+# and reused on every later start.
+
+BACKENDS = ("torch", "onnx", "int8")
+
+
+def _cache_path(model_name):
+    return os.path.join(config.MODEL_CACHE_DIR, model_name.replace("/", "__") + "-onnx")
+
+
+def _int8_file():
+    return f"onnx/model_qint8_{config.INT8_QUANTIZATION}.onnx"
+
+
+def _ort_kwargs(threads):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    return {"provider": "CPUExecutionProvider", "session_options": options}
+
+
+def _load_onnx(model_cls, model_name, threads, file_name=None):
+    """Exports to ONNX on first use, then loads the cached export."""
+    path = _cache_path(model_name)
+    if not os.path.isdir(os.path.join(path, "onnx")):
+        print(f"[Inference] Exporting {model_name} to ONNX -> {path}")
+        model = model_cls(model_name, backend="onnx", model_kwargs=_ort_kwargs(threads))
+        model.save_pretrained(path)
+
+    kwargs = _ort_kwargs(threads)
+    if file_name:
+        kwargs["file_name"] = file_name
+    return model_cls(path, backend="onnx", model_kwargs=kwargs)
+
+
+def _load_int8(model_cls, model_name, threads):
+    """Dynamic int8 quantization of the cached ONNX export (no calibration data needed)."""
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    path = _cache_path(model_name)
+    if not os.path.exists(os.path.join(path, _int8_file())):
+        onnx_model = _load_onnx(model_cls, model_name, threads)
+        print(f"[Inference] Quantizing {model_name} to int8 ({config.INT8_QUANTIZATION})")
+        export_dynamic_quantized_onnx_model(onnx_model, config.INT8_QUANTIZATION, path)
+    return _load_onnx(model_cls, model_name, threads, file_name=_int8_file())
+
+
+def _load(model_cls, model_name, backend, threads):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown INFERENCE_BACKEND: {backend}")
+
+    if backend == "torch":
+        import torch
+        torch.set_num_threads(threads)
+        return model_cls(model_name)
+    if backend == "onnx":
+        return _load_onnx(model_cls, model_name, threads)
+    return _load_int8(model_cls, model_name, threads)
+
+
+def load_embedder(backend=config.INFERENCE_BACKEND, threads=config.INFERENCE_THREADS):
+    from sentence_transformers import SentenceTransformer
+    print(f"Loading Embedder: {config.EMBEDDING_MODEL} [{backend}]...")
+    return _load(SentenceTransformer, config.EMBEDDING_MODEL, backend, threads)
+
+
+def load_reranker(backend=config.INFERENCE_BACKEND, threads=config.INFERENCE_THREADS):
+    from sentence_transformers import CrossEncoder
+    print(f"Loading Reranker: {config.RERANKER_MODEL} [{backend}]...")
+    return _load(CrossEncoder, config.RERANKER_MODEL, backend, threads)
+
+
+#  PARITY CHECK 
+def _top1_agreement(a, b):
+    return float(np.mean(np.argmax(a, axis=1) == np.argmax(b, axis=1)))
+
+
+def _spearman(a, b):
+    ra = np.argsort(np.argsort(a))
+    rb = np.argsort(np.argsort(b))
+    if np.std(ra) == 0 or np.std(rb) == 0:
+        return 1.0
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+
+def parity_check(backend, max_queries=200, rerank_pool=10):
+    """
+    Compares `backend` against the fp32 PyTorch models on the glossary:
+    terms are the queries, definitions are the documents.
+    Reports embedding cosine, retrieval top-1 / top-5 agreement, and
+    Cross-Encoder top-1 agreement + Spearman rank correlation.
+    """
+    with open(config.GLOSSARY_PATH, "r", encoding="utf-8") as f:
+        glossary = json.load(f)
+    queries = list(glossary.keys())[:max_queries]
+    docs = list(glossary.values())
+
+    ref_embedder, cand_embedder = load_embedder("torch"), load_embedder(backend)
+    encode = lambda m, texts: m.encode(texts, normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False)
+
+    ref_docs, cand_docs = encode(ref_embedder, docs), encode(cand_embedder, docs)
+    ref_q, cand_q = encode(ref_embedder, queries), encode(cand_embedder, queries)
+    ref_sims, cand_sims = ref_q @ ref_docs.T, cand_q @ cand_docs.T
+
+    top5_overlap = np.mean([
+        len(set(np.argsort(-r)[:5]) & set(np.argsort(-c)[:5])) / 5
+        for r, c in zip(ref_sims, cand_sims)
+    ])
+
+    ref_reranker, cand_reranker = load_reranker("torch"), load_reranker(backend)
+    rerank_top1, rerank_rho = [], []
+    for qi, query in enumerate(queries):
+        pool = [docs[i] for i in np.argsort(-ref_sims[qi])[:rerank_pool]]
+        pairs = [[query, d] for d in pool]
+        ref_scores = np.asarray(ref_reranker.predict(pairs, show_progress_bar=False))
+        cand_scores = np.asarray(cand_reranker.predict(pairs, show_progress_bar=False))
+        rerank_top1.append(int(np.argmax(ref_scores) == np.argmax(cand_scores)))
+        rerank_rho.append(_spearman(ref_scores, cand_scores))
+
+    return {
+        "backend": backend,
+        "queries": len(queries),
+        "documents": len(docs),
+        "embedding_cosine_mean": round(float(np.mean(np.sum(ref_docs * cand_docs, axis=1))), 5),
+        "retrieval_top1_agreement": round(_top1_agreement(ref_sims, cand_sims), 4),
+        "retrieval_top5_overlap": round(float(top5_overlap), 4),
+        "rerank_top1_agreement": round(float(np.mean(rerank_top1)), 4),
+        "rerank_spearman_mean": round(float(np.mean(rerank_rho)), 4),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export models / check backend parity against fp32 PyTorch.")
+    parser.add_argument("--backend", default=config.INFERENCE_BACKEND, choices=BACKENDS)
+    parser.add_argument("--export", action="store_true", help="Only build the cached export for --backend")
+    parser.add_argument("--parity", action="store_true", help="Report ranking agreement vs fp32")
+    parser.add_argument("--max-queries", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.export or not args.parity:
+        load_embedder(args.backend)
+        load_reranker(args.backend)
+        print(f"[Inference] {args.backend} models ready in {config.MODEL_CACHE_DIR}")
+    if args.parity:
+        print(json.dumps(parity_check(args.backend, args.max_queries), indent=2))
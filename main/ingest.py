@@ -0,0 +1,504 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import config
+from ratelimit import TokenBucket
+
+# Builds the trading_knowledge collection from the book:
+#   extract: Trading_Book.docx -> one markdown file per chapter
+#   run:     markdown -> chunks -> Groq tagging -> embed -> upsert into Chroma
+#
+# Every chunk is identified by a hash of its content (+ heading path). The
+# checkpoint is an append-only JSONL log of "tagged" / "upserted" events, so
+# a crash loses at most the chunks in flight, and a re-run only tags and
+# upserts chunks whose hash it hasn't seen.
+
+
+#  DOCX -> MARKDOWN
+def _clean_text(text):
+    """Normalizes whitespace."""
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def _part_folder(chapter_title):
+    """Determines the Part folder based on the Chapter Number."""
+    match = re.match(r'^(\d+)', chapter_title.strip())
+    if not match:
+        return "Front_Matter"
+
+    chap_num = int(match.group(1))
+    if 1 <= chap_num <= 3: return "Part_I_Business_of_Trading"
+    if 4 <= chap_num <= 6: return "Part_II_Foundations"
+    if 7 <= chap_num <= 8: return "Part_III_Methodology"
+    if 9 <= chap_num <= 13: return "Part_IV_Indicators"
+    if chap_num >= 14: return "Part_V_Risk_Management"
+    return "Other"
+
+
+def _save_markdown(base_dir, folder, filename, lines):
+    full_folder_path = os.path.join(base_dir, folder)
+    os.makedirs(full_folder_path, exist_ok=True)
+    with open(os.path.join(full_folder_path, f"{filename}.md"), "w", encoding="utf-8") as f:
+        f.write("\n\n".join(lines))
+
+
+def extract_markdown(docx_path, base_dir=config.INGEST_MARKDOWN_DIR):
+    """Heading 1 starts a new chapter file; Heading 2 / 3 become ## / ### headers."""
+    from docx import Document  # pip install python-docx
+
+    doc = Document(docx_path)
+    print(f"[Ingest] Extracting {docx_path} -> {base_dir}")
+    os.makedirs(base_dir, exist_ok=True)
+
+    current_lines = []
+    current_filename = "Front_Matter"
+    current_folder = "Front_Matter"
+    files = 0
+
+    for para in doc.paragraphs:
+        text = _clean_text(para.text)
+        style = para.style.name
+        if not text:
+            continue
+
+        if style.startswith("Heading 1"):
+            if current_lines:
+                _save_markdown(base_dir, current_folder, current_filename, current_lines)
+                files += 1
+            current_folder = _part_folder(text)
+            safe_name = re.sub(r'[^\w\s-]', '', text).strip().replace(' ', '_')
+            current_filename = f"Chapter_{safe_name}" if safe_name.isdigit() else safe_name
+            current_lines = [f"# {text}"]
+        elif style.startswith("Heading 2"):
+            current_lines.append(f"\n## {text}")
+        elif style.startswith("Heading 3"):
+            current_lines.append(f"\n### {text}")
+        else:
+            current_lines.append(text)
+
+    if current_lines:
+        _save_markdown(base_dir, current_folder, current_filename, current_lines)
+        files += 1
+    print(f"[Ingest] Wrote {files} markdown files.")
+
+
+#  MARKDOWN -> CHUNKS
+_REPLACEMENTS = {
+    "’": "'", "‘": "'", "–": "-", "—": " - ",
+    "“": '"', "”": '"', "…": "...",
+}
+
+
+def _natural_sort_key(s):
+    """Sorts Chapter_2 before Chapter_10"""
+    return [int(text) if text.isdigit() else text.lower() for text in re.split('([0-9]+)', s)]
+
+
+def _normalize_text(text):
+    for old, new in _REPLACEMENTS.items():
+        text = text.replace(old, new)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def content_hash(chunk):
+    """Same text under the same heading path = same chunk."""
+    return hashlib.sha1(f"{chunk['path']}\n{chunk['text']}".encode("utf-8")).hexdigest()
+
+
+def iter_chunks(md_folder_path=config.INGEST_MARKDOWN_DIR):
+    """
+    Yields {"id", "hash", "chapter", "path", "text"} per paragraph block,
+    with the H1 > H2 > H3 trail as the path. The id is derived from the
+    content hash so it is stable across re-runs; duplicate blocks are skipped.
+    """
+    md_files = glob.glob(os.path.join(md_folder_path, "**", "*.md"), recursive=True)
+    md_files.sort(key=lambda f: _natural_sort_key(os.path.basename(f)))
+    seen = set()
+
+    for file_path in md_files:
+        filename = os.path.basename(file_path)
+        with open(file_path, 'r', encoding='utf-8') as f:
+            blocks = f.read().split('\n\n')
+
+        # Heuristic: Extract "1" from "Chapter_1.md"
+        chapter_match = re.search(r'Chapter_(\d+)', filename)
+        chapter = chapter_match.group(1) if chapter_match else "0"
+        h1 = h2 = h3 = ""
+
+        for block in blocks:
+            block = block.strip()
+            if not block:
+                continue
+            if block.startswith('# '):
+                h1, h2, h3 = block[2:].strip(), "", ""
+                continue
+            if block.startswith('## '):
+                h2, h3 = block[3:].strip(), ""
+                continue
+            if block.startswith('### '):
+                h3 = block[4:].strip()
+                continue
+
+            chunk = {
+                "chapter": chapter,
+                "path": " > ".join(p for p in (h1, h2, h3) if p) or "Intro",
+                "text": _normalize_text(block),
+            }
+            chunk["hash"] = content_hash(chunk)
+            if chunk["hash"] in seen:
+                continue
+            seen.add(chunk["hash"])
+            chunk["id"] = f"ch{chapter}-{chunk['hash'][:16]}"
+            yield chunk
+
+
+#  CHECKPOINT
+class Checkpoint:
+    """
+    Append-only JSONL log. Each line is one event:
+      {"event": "tagged",   "hash", "tags", "glossary"}
+      {"event": "upserted", "hash", "id"}
+    Loading replays the log (last event wins); a torn last line is ignored.
+    """
+
+    def __init__(self, path=config.INGEST_CHECKPOINT_PATH):
+        self.path = path
+        self.tags = {}  # hash -> (tags, glossary_version)
+        self.upserted = {}  # hash -> chunk id
+        self.lock = threading.Lock()
+        self._load()
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue  # Torn write from a crash
+                if event["event"] == "tagged":
+                    self.tags[event["hash"]] = (event["tags"], event.get("glossary"))
+                elif event["event"] == "upserted":
+                    self.upserted[event["hash"]] = event["id"]
+
+    def _append(self, events):
+        with self.lock:
+            self.file.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in events))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def record_tags(self, chunk_hash, tags, glossary_version):
+        self.tags[chunk_hash] = (tags, glossary_version)
+        self._append([{"event": "tagged", "hash": chunk_hash, "tags": tags, "glossary": glossary_version}])
+
+    def record_upserts(self, chunks):
+        for chunk in chunks:
+            self.upserted[chunk["hash"]] = chunk["id"]
+        self._append([{"event": "upserted", "hash": c["hash"], "id": c["id"]} for c in chunks])
+
+    def cached_tags(self, chunk_hash, glossary_version):
+        entry = self.tags.get(chunk_hash)
+        if entry and entry[1] == glossary_version:
+            return entry[0]
+        return None
+
+    def close(self):
+        self.file.close()
+
+
+#  TAGGING
+class GroqKeyPool:
+    """
+    Groq clients over several keys, each behind a token bucket
+    (INGEST_RPM_PER_KEY). A 429 cools only that key down; workers keep
+    going on the others instead of someone swapping keys by hand.
+    """
+
+    def __init__(self, api_keys, rpm_per_key=config.INGEST_RPM_PER_KEY):
+        from groq import Groq
+
+        keys = [k for k in api_keys if k]
+        if not keys:
+            raise ValueError("No Groq API keys configured for ingestion (GROQ_INGEST_KEYS).")
+        self.slots = [
+            {"idx": i, "client": Groq(api_key=k), "cooldown_until": 0.0, "in_flight": 0,
+             "bucket": TokenBucket(rate=rpm_per_key / 60.0, capacity=max(1.0, rpm_per_key / 10))}
+            for i, k in enumerate(keys)
+        ]
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "rate_limited": 0, "errors": 0}
+
+    def acquire(self):
+        while True:
+            now = time.monotonic()
+            with self.lock:
+                ready = sorted((s for s in self.slots if s["cooldown_until"] <= now), key=lambda s: s["in_flight"])
+                for slot in ready:
+                    if slot["bucket"].try_take():
+                        slot["in_flight"] += 1
+                        self.stats["calls"] += 1
+                        return slot
+                wait_s = min(
+                    max(s["cooldown_until"] - now, 0.0) + s["bucket"].time_until_available()
+                    for s in self.slots
+                )
+            time.sleep(max(0.01, wait_s))
+
+    def release(self, slot, rate_limited=False, error=False):
+        with self.lock:
+            slot["in_flight"] -= 1
+            if rate_limited:
+                self.stats["rate_limited"] += 1
+                slot["cooldown_until"] = time.monotonic() + config.INGEST_KEY_COOLDOWN_SECONDS
+                print(f"[Ingest] Groq key {slot['idx']} rate limited. Cooling down.")
+            elif error:
+                self.stats["errors"] += 1
+
+
+def _tag_prompt(chunk, glossary_string):
+    return f"""
+    You are a data labeling assistant.
+
+    TASK:
+    Analyze the text below and identify which terms from the provided 'Glossary List' are highly relevant to the text.
+
+    RULES:
+    1. STRICTLY output only a valid JSON list of strings (e.g., ["Term A", "Term B"]).
+    2. If no terms match, output an empty list [].
+    3. Do NOT invent new tags. Only use terms exactly as written in the Glossary List.
+    4. Do not output markdown, explanations, or code blocks. Just the list.
+
+    TEXT TO ANALYZE:
+    "{chunk['text'][:2000]}"
+    (Context: {chunk.get('path', '')})
+
+    GLOSSARY LIST:
+    {glossary_string}
+    """
+
+
+def tag_chunk(pool, chunk, glossary_terms, glossary_string):
+    """Returns the chunk's glossary tags (only terms that really are in the glossary)."""
+    if len(chunk["text"]) < config.INGEST_MIN_CHUNK_CHARS:
+        return []  # Tiny chunks are headers / captions
+
+    for attempt in range(config.INGEST_MAX_ATTEMPTS):
+        slot = pool.acquire()
+        try:
+            completion = slot["client"].chat.completions.create(
+                messages=[
+                    {"role": "system", "content": "You are a helpful JSON-only assistant."},
+                    {"role": "user", "content": _tag_prompt(chunk, glossary_string)}
+                ],
+                model=config.INGEST_TAG_MODEL_NAME,
+                temperature=0.0,
+            )
+        except Exception as e:
+            rate_limited = "429" in str(e) or getattr(e, "status_code", None) == 429
+            pool.release(slot, rate_limited=rate_limited, error=not rate_limited)
+            if not rate_limited:
+                time.sleep(min(30.0, 2 ** attempt))
+            continue
+        pool.release(slot)
+
+        response = completion.choices[0].message.content.strip()
+        if "```" in response:
+            response = response.replace("```json", "").replace("```", "").strip()
+        try:
+            suggested = json.loads(response)
+        except ValueError:
+            print(f"[Ingest] Could not parse tags for chunk {chunk['id']}; storing none.")
+            return []
+        return [t for t in suggested if isinstance(t, str) and t in glossary_terms]
+
+    raise RuntimeError(f"Tagging failed for chunk {chunk['id']} after {config.INGEST_MAX_ATTEMPTS} attempts")
+
+
+#  CHUNK METADATA
+# Chroma metadata values are scalars, so a chunk's tags are stored twice:
+# "tags" as a readable comma-joined string (what RAGPipeline.chunk_tags and
+# the BM25 postings parse), and one boolean "tag:<term>" key per tag, which
+# is what the where filter matches on.
+TAG_KEY_PREFIX = "tag:"
+
+
+def chunk_metadata(chapter, path, tags, content_hash=None) -> dict:
+    metadata = {"chapter": chapter, "path": path, "tags": ", ".join(tags)}
+    if content_hash is not None:
+        metadata["content_hash"] = content_hash
+    metadata.update({TAG_KEY_PREFIX + tag: True for tag in tags})
+    return metadata
+
+
+def tag_filter(tags):
+    """
+    Chroma `where` clause matching chunks that carry ANY of the tags. Also
+    matches collections built before the per-tag keys, where "tags" held a
+    single term.
+    """
+    if not tags:
+        return None
+    clauses = [{TAG_KEY_PREFIX + tag: True} for tag in tags]
+    clauses.append({"tags": tags[0]} if len(tags) == 1 else {"tags": {"$in": list(tags)}})
+    return {"$or": clauses}
+
+
+#  PIPELINE
+def _upsert(collection, batch, checkpoint):
+    """Embeds a batch with the shared encoder and upserts it in one call."""
+    import encoders
+
+    embeddings = encoders.encode([c["text"] for c in batch])
+    ids = [c["id"] for c in batch]
+    metadatas = [chunk_metadata(c["chapter"], c["path"], c["tags"], c["hash"]) for c in batch]
+
+    # Upsert merges metadata, so tags a re-tagged chunk lost have to be unset explicitly
+    existing = collection.get(ids=ids, include=["metadatas"])
+    old_by_id = dict(zip(existing["ids"], existing["metadatas"]))
+    for chunk_id, metadata in zip(ids, metadatas):
+        for key in old_by_id.get(chunk_id) or {}:
+            if key.startswith(TAG_KEY_PREFIX) and key not in metadata:
+                metadata[key] = None
+
+    collection.upsert(
+        ids=ids,
+        documents=[c["text"] for c in batch],
+        embeddings=embeddings.tolist(),
+        metadatas=metadatas,
+    )
+    checkpoint.record_upserts(batch)
+
+
+def run(md_dir=config.INGEST_MARKDOWN_DIR, checkpoint_path=config.INGEST_CHECKPOINT_PATH,
+        workers=config.INGEST_WORKERS, prune=True, dry_run=False):
+    """
+    Incremental ingestion. Chunks whose hash was already upserted (and tagged
+    against the current glossary) are left alone; the rest stream through the tagging workers and are embedded and
+    upserted in batches of INGEST_UPSERT_BATCH. With prune, chunks that no
+    longer exist in the markdown are deleted from the collection.
+    """
+    with open(config.GLOSSARY_PATH, "r", encoding="utf-8") as f:
+        glossary_terms = set(json.load(f).keys())
+    glossary_string = ", ".join(sorted(glossary_terms))
+    glossary_version = hashlib.sha1(glossary_string.encode("utf-8")).hexdigest()[:12]
+
+    chunks = list(iter_chunks(md_dir))
+    checkpoint = Checkpoint(checkpoint_path)
+    # New / edited chunks, plus everything tagged against an older glossary
+    todo = [
+        c for c in chunks
+        if checkpoint.upserted.get(c["hash"]) != c["id"]
+        or checkpoint.cached_tags(c["hash"], glossary_version) is None
+    ]
+    stats = {"chunks": len(chunks), "unchanged": len(chunks) - len(todo), "tagged": 0,
+             "tags_from_checkpoint": 0, "upserted": 0, "deleted": 0, "failed": 0}
+    print(f"[Ingest] {len(chunks)} chunks, {len(todo)} new or changed.")
+
+    if dry_run:
+        checkpoint.close()
+        return stats
+
+    from rag import open_collection
+    collection = open_collection()
+    pool = None
+    batch = []
+    started = time.perf_counter()
+
+    def flush():
+        if batch:
+            _upsert(collection, batch, checkpoint)
+            stats["upserted"] += len(batch)
+            batch.clear()
+
+    def finish(chunk, tags):
+        batch.append({**chunk, "tags": tags})
+        if len(batch) >= config.INGEST_UPSERT_BATCH:
+            flush()
+
+    # Chunks tagged in an earlier (interrupted) run go straight to the upsert batches
+    needs_tagging = []
+    for chunk in todo:
+        tags = checkpoint.cached_tags(chunk["hash"], glossary_version)
+        if tags is None:
+            needs_tagging.append(chunk)
+        else:
+            stats["tags_from_checkpoint"] += 1
+            finish(chunk, tags)
+
+    if needs_tagging:
+        pool = GroqKeyPool(config.GROQ_INGEST_KEYS)
+        pending = {}
+        chunk_iter = iter(needs_tagging)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest-tag") as executor:
+            # Keep a bounded window in flight so results stream into upserts
+            while True:
+                while len(pending) < workers * 2:
+                    chunk = next(chunk_iter, None)
+                    if chunk is None:
+                        break
+                    future = executor.submit(tag_chunk, pool, chunk, glossary_terms, glossary_string)
+                    pending[future] = chunk
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk = pending.pop(future)
+                    try:
+                        tags = future.result()
+                    except Exception as e:
+                        stats["failed"] += 1
+                        print(f"[Ingest] {e}")
+                        continue
+                    checkpoint.record_tags(chunk["hash"], tags, glossary_version)
+                    stats["tagged"] += 1
+                    finish(chunk, tags)
+                    if stats["tagged"] % 50 == 0:
+                        rate = stats["tagged"] / (time.perf_counter() - started)
+                        print(f"[Ingest] Tagged {stats['tagged']}/{len(needs_tagging)} ({rate:.1f} chunks/s)")
+    flush()
+
+    if prune:
+        current_ids = {c["id"] for c in chunks}
+        stale = [i for i in collection.get(include=[])["ids"] if i not in current_ids]
+        for start in range(0, len(stale), 500):
+            collection.delete(ids=stale[start:start + 500])
+        stats["deleted"] = len(stale)
+
+    checkpoint.close()
+    stats["seconds"] = round(time.perf_counter() - started, 1)
+    if pool:
+        stats["groq"] = dict(pool.stats)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build / refresh the trading_knowledge collection.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    extract = sub.add_parser("extract", help="Trading_Book.docx -> markdown chapters")
+    extract.add_argument("docx")
+    extract.add_argument("--out", default=config.INGEST_MARKDOWN_DIR)
+
+    run_cmd = sub.add_parser("run", help="Chunk, tag, embed and upsert (incremental)")
+    run_cmd.add_argument("--markdown-dir", default=config.INGEST_MARKDOWN_DIR)
+    run_cmd.add_argument("--checkpoint", default=config.INGEST_CHECKPOINT_PATH)
+    run_cmd.add_argument("--workers", type=int, default=config.INGEST_WORKERS)
+    run_cmd.add_argument("--no-prune", action="store_true", help="Keep chunks that disappeared from the markdown")
+    run_cmd.add_argument("--dry-run", action="store_true", help="Only report what would be processed")
+
+    args = parser.parse_args()
+    if args.command == "extract":
+        extract_markdown(args.docx, args.out)
+    else:
+        result = run(args.markdown_dir, args.checkpoint, args.workers,
+                     prune=not args.no_prune, dry_run=args.dry_run)
+        print(json.dumps(result, indent=2))
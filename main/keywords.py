@@ -0,0 +1,155 @@
+from collections import deque
+from cache import normalize_query
+
+# Glossary-term matcher for the router's fast path. Most questions name the
+# concept they are about ("where do I put my stop loss?"), so spotting the
+# term is enough to route them - no embedding, no LLM call.
+#
+# - Terms are compiled once into a word-level Aho-Corasick automaton, so a
+#   query is matched against every term in one left-to-right pass, and only
+#   on whole words ("stop" never matches inside "nonstop").
+# - Light plural folding: "stop losses" matches "stop loss".
+# - Typos: query words not in the glossary vocabulary are corrected to a
+#   vocabulary word at edit distance 1 (found through a precomputed
+#   single-deletion index), then matched the same way.
+# - Everyday words that double as glossary terms ("short", "long", "call")
+#   say nothing on their own ("a short question"), so they are left out of
+#   the automaton and the typo vocabulary; such queries take the embedding
+#   route, which sees the rest of the sentence.
+
+
+def fold_plural(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith("sses"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def words(text: str) -> list:
+    return [fold_plural(w) for w in normalize_query(text).split()]
+
+
+def _deletes(word: str) -> set:
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """Levenshtein distance <= 1, or one adjacent transposition."""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diff = [i for i in range(la) if a[i] != b[i]]
+        if len(diff) == 1:
+            return True
+        return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+    if la > lb:
+        a, b = b, a
+    # b is one longer: skipping one char of b must give a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+class KeywordMatcher:
+    """
+    match(query) -> (terms, fuzzy): glossary terms found in the query, longest
+    first, with terms nested inside a longer match dropped ("loss" inside
+    "stop loss"). fuzzy is True when a typo correction was needed. Terms
+    listed in `ambiguous` are never matched.
+    """
+
+    def __init__(self, terms, min_fuzzy_length=5, ambiguous=()):
+        self.terms = list(terms)
+        self.min_fuzzy_length = min_fuzzy_length
+        skip = {" ".join(words(t)) for t in ambiguous}
+
+        # Trie over words: goto[state][word] -> state; out[state] = term indexes ending here
+        self.goto = [{}]
+        self.out = [[]]
+        self.vocabulary = set()
+        for index, term in enumerate(self.terms):
+            if " ".join(words(term)) in skip:
+                continue
+            state = 0
+            for word in words(term):
+                self.vocabulary.add(word)
+                nxt = self.goto[state].get(word)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][word] = nxt
+                    self.goto.append({})
+                    self.out.append([])
+                state = nxt
+            if state:
+                self.out[state].append(index)
+        self.term_lengths = [len(words(t)) for t in self.terms]
+        self._build_failure_links()
+
+        # Single-deletion index for typo correction
+        self.deletion_index = {}
+        for word in self.vocabulary:
+            if len(word) >= self.min_fuzzy_length - 1:
+                for key in _deletes(word) | {word}:
+                    self.deletion_index.setdefault(key, set()).add(word)
+
+    def _build_failure_links(self):
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and word not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(word, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def _correct(self, word):
+        if word in self.vocabulary or len(word) < self.min_fuzzy_length:
+            return word
+        candidates = set()
+        for key in _deletes(word) | {word}:
+            candidates |= self.deletion_index.get(key, set())
+        matches = sorted(c for c in candidates if _within_one_edit(word, c))
+        return matches[0] if len(matches) == 1 else word  # Ambiguous: leave it alone
+
+    def _scan(self, query_words):
+        """[(start, end, term_index)] for every term occurrence."""
+        hits = []
+        state = 0
+        for pos, word in enumerate(query_words):
+            while state and word not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(word, 0)
+            for index in self.out[state]:
+                hits.append((pos + 1 - self.term_lengths[index], pos + 1, index))
+        return hits
+
+    def match(self, query: str):
+        query_words = words(query)
+        hits = self._scan(query_words)
+        fuzzy = False
+        if not hits:
+            corrected = [self._correct(w) for w in query_words]
+            if corrected != query_words:
+                hits = self._scan(corrected)
+                fuzzy = bool(hits)
+
+        # Longest first; drop terms nested inside a longer match
+        hits.sort(key=lambda h: (-(h[1] - h[0]), h[0]))
+        kept, spans, seen = [], [], set()
+        for start, end, index in hits:
+            if index in seen or any(s <= start and end <= e for s, e in spans):
+                continue
+            seen.add(index)
+            spans.append((start, end))
+            kept.append(self.terms[index])
+        return kept, fuzzy
@@ -0,0 +1,110 @@
+import heapq
+import math
+import re
+from collections import defaultdict
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "is", "are", "was",
+    "be", "it", "this", "that", "with", "as", "by", "at", "from", "what", "how", "why",
+    "do", "does", "i", "my", "me", "you", "your", "can", "should", "when", "which",
+}
+
+
+def tokenize(text: str) -> list:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def reciprocal_rank_fusion(rankings, k=60) -> list:
+    """
+    rankings: lists of ids, best first. Returns ids ordered by sum(1 / (k + rank)).
+    An id appearing in several lists is counted once per list, i.e. deduplicated.
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25 over the knowledge-base chunks, plus a tag -> chunk
+    postings list so tag filtering can be done without asking Chroma.
+    Built once at startup; the corpus is a book, so this fits comfortably in RAM.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self.docs = []
+        self.metas = []
+        self.id_to_idx = {}
+        self.postings = {}  # term -> {doc_idx: term_frequency}
+        self.idf = {}
+        self.doc_len = []
+        self.avg_len = 0.0
+        self.tag_postings = defaultdict(set)  # tag -> {doc_idx}
+
+    def build(self, ids, docs, metas, tag_fn):
+        self.ids = list(ids)
+        self.docs = list(docs)
+        self.metas = list(metas)
+        self.id_to_idx = {chunk_id: i for i, chunk_id in enumerate(self.ids)}
+
+        postings = defaultdict(dict)
+        self.doc_len = []
+        for idx, doc in enumerate(self.docs):
+            tokens = tokenize(doc or "")
+            self.doc_len.append(len(tokens))
+            for token in tokens:
+                postings[token][idx] = postings[token].get(idx, 0) + 1
+            for tag in tag_fn(self.metas[idx]):
+                self.tag_postings[tag].add(idx)
+        self.postings = dict(postings)
+
+        n = len(self.docs)
+        self.avg_len = (sum(self.doc_len) / n) if n else 0.0
+        self.idf = {
+            term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in self.postings.items()
+        }
+        return self
+
+    def __len__(self):
+        return len(self.ids)
+
+    def ids_for_tags(self, tags) -> set:
+        """Chroma ids of every chunk carrying any of the tags."""
+        found = set()
+        for tag in tags:
+            found |= self.tag_postings.get(tag, set())
+        return {self.ids[i] for i in found}
+
+    def search(self, query: str, top_n: int, allowed_ids=None) -> list:
+        """Returns up to top_n chroma ids, best BM25 score first."""
+        if not self.ids:
+            return []
+        allowed = None
+        if allowed_ids is not None:
+            allowed = {self.id_to_idx[i] for i in allowed_ids if i in self.id_to_idx}
+
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = self.idf[term]
+            for idx, tf in posting.items():
+                if allowed is not None and idx not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[idx] / self.avg_len)
+                scores[idx] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        best = heapq.nlargest(top_n, scores.items(), key=lambda kv: kv[1])
+        return [self.ids[idx] for idx, _ in best]
+
+    def get(self, chunk_id):
+        idx = self.id_to_idx[chunk_id]
+        return self.docs[idx], self.metas[idx]
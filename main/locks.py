@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+import config
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so only single-worker deployments are safe
+    fcntl = None
+
+# Cross-process locking for running several uvicorn workers against the same
+# session log / profile DB. flock() locks belong to an open file description,
+# so every acquire opens its own handle: that makes them exclusive between
+# threads of one worker as well as between workers.
+
+
+@contextmanager
+def file_lock(path, exclusive=True):
+    """Blocking flock on `path` (created if missing). A no-op without fcntl."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a+b") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class UserLockTimeout(Exception):
+    """A user's lock stayed taken for USER_LOCK_TIMEOUT_SECONDS. The server answers 503."""
+    pass
+
+
+class UserLocks:
+    """
+    Per-user locks shared by all workers, held while a turn reads the
+    student's history and again while it appends the answer, so a reload
+    never sees half a turn and appends don't interleave. The Gemini call
+    runs unlocked (UserScheduler keeps a worker's turns for a user in order).
+
+    - Users are striped over a fixed number of lock files; two users in the
+      same stripe wait for each other, but only for a history read / append.
+    - A contended lock is waited for with a blocking flock on a helper
+      thread. If it can't be had within `timeout`, UserLockTimeout is raised.
+    """
+
+    def __init__(self, enabled=config.WORKERS > 1, directory=config.USER_LOCK_DIR,
+                 stripes=config.USER_LOCK_STRIPES, timeout=config.USER_LOCK_TIMEOUT_SECONDS):
+        self.directory = directory
+        self.stripes = stripes
+        self.timeout = timeout
+        self.enabled = enabled and fcntl is not None
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+
+        self.stats_lock = threading.Lock()
+        self.stats = {"acquired": 0, "contended": 0, "timeouts": 0, "wait_seconds": 0.0}
+
+    def _path(self, user_id):
+        stripe = zlib.crc32(str(user_id).encode("utf-8")) % self.stripes
+        return os.path.join(self.directory, f"user-{stripe}.lock")
+
+    @contextmanager
+    def hold(self, user_id):
+        if not self.enabled:
+            yield
+            return
+
+        start = time.monotonic()
+        f = open(self._path(user_id), "a+b")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            contended = False
+        except BlockingIOError:
+            contended = True
+            if not self._wait(f):
+                self._record(start, contended, locked=False)
+                raise UserLockTimeout(f"User lock for {user_id} still taken after {self.timeout}s") from None
+        except BaseException:
+            f.close()
+            raise
+
+        self._record(start, contended, locked=True)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            f.close()
+
+    def _wait(self, f):
+        """
+        Blocking flock on a helper thread, given up after `timeout`. Returns
+        True if we hold the lock; otherwise `f` is closed, by the helper once
+        its flock returns if we stopped waiting (dropping a lock taken late).
+        """
+        state = {"locked": False, "abandoned": False}
+        guard = threading.Lock()
+        done = threading.Event()
+
+        def take():
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                locked = True
+            except OSError:
+                locked = False
+            with guard:
+                if state["abandoned"]:
+                    f.close()  # Drops the lock too
+                else:
+                    state["locked"] = locked
+                    done.set()
+
+        threading.Thread(target=take, name="sensei-user-lock", daemon=True).start()
+        done.wait(self.timeout)
+        with guard:
+            if not done.is_set():
+                state["abandoned"] = True
+                return False
+        if not state["locked"]:
+            f.close()
+        return state["locked"]
+
+    def _record(self, start, contended, locked):
+        with self.stats_lock:
+            self.stats["acquired" if locked else "timeouts"] += 1
+            self.stats["contended"] += int(contended)
+            self.stats["wait_seconds"] += time.monotonic() - start
+
+    def get_stats(self):
+        with self.stats_lock:
+            return {**self.stats, "enabled": self.enabled, "stripes": self.stripes}
@@ -0,0 +1,271 @@
+import sys
+import threading
+from collections import OrderedDict
+
+# Stored user turns from older versions contained the whole RAG chunk.
+LEGACY_CONTEXT_MARKER = "REFERENCE CONTEXT:"
+LEGACY_QUESTION_MARKER = "USER QUESTION:\n"
+
+SUMMARY_PREFIX = "Summary of our earlier lessons:\n"
+SUMMARY_ACK = "Understood. I remember."
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 chars per token for English). Good enough for budgeting."""
+    return max(1, len(text) // 4)
+
+
+def strip_legacy_context(turn: dict) -> dict:
+    """Old turns stored 'REFERENCE CONTEXT ... USER QUESTION: q'. Keep only the question."""
+    text = turn["text"]
+    if turn["role"] == "user" and text.startswith(LEGACY_CONTEXT_MARKER) and LEGACY_QUESTION_MARKER in text:
+        return {"role": "user", "text": text.split(LEGACY_QUESTION_MARKER, 1)[1]}
+    return turn
+
+
+class Turn:
+    """
+    One message of a conversation, as kept in memory.
+
+    Slotted (no per-instance dict), role interned (every turn shares the
+    same two strings), token estimate computed once. The Gemini Content
+    object is only built the first time the turn is actually sent, then
+    reused for every later request that still has it in its window.
+    """
+
+    __slots__ = ("role", "text", "tokens", "_content")
+
+    def __init__(self, role, text):
+        self.role = sys.intern(role)
+        self.text = text
+        self.tokens = estimate_tokens(text)
+        self._content = None
+
+    @classmethod
+    def from_dict(cls, turn: dict):
+        turn = strip_legacy_context(turn)
+        return cls(turn["role"], turn["text"])
+
+    def to_dict(self) -> dict:
+        return {"role": self.role, "text": self.text}
+
+    def content(self):
+        if self._content is None:
+            from google.genai import types
+            self._content = types.Content(role=self.role, parts=[types.Part(text=self.text)])
+        return self._content
+
+    def nbytes(self) -> int:
+        return sys.getsizeof(self) + sys.getsizeof(self.text)
+
+
+class Session:
+    """A user's history in memory: turns, the store version it matches, and the rolling summary."""
+
+    __slots__ = ("turns", "version", "tokens", "nbytes", "summary")
+
+    def __init__(self, turns=(), version=None):
+        self.turns = []
+        self.version = version
+        self.tokens = 0
+        self.nbytes = sys.getsizeof(self) + sys.getsizeof(self.turns)
+        self.summary = (0, "", ())  # (messages_folded, summary_text, (user Turn, model Turn))
+        self.extend(turns)
+
+    @classmethod
+    def from_dicts(cls, turns, version=None):
+        return cls((Turn.from_dict(t) for t in turns), version)
+
+    def extend(self, turns):
+        for turn in turns:
+            self.turns.append(turn)
+            self.tokens += turn.tokens
+            self.nbytes += turn.nbytes() + 8  # + list slot
+
+    def __len__(self):
+        return len(self.turns)
+
+
+class SessionCache:
+    """
+    LRU of in-memory sessions. Only the `max_sessions` most recently active
+    users stay resident; the rest are reloaded from the session store on
+    their next turn (and re-summarized, since the summary lives here too).
+    """
+
+    def __init__(self, max_sessions):
+        self.max_sessions = max_sessions
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()  # user_id -> Session, least recently used first
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0}
+
+    def get(self, user_id):
+        with self.lock:
+            session = self.sessions.get(user_id)
+            if session is not None:
+                self.sessions.move_to_end(user_id)
+                self.stats["hits"] += 1
+            return session
+
+    def put(self, user_id, session):
+        with self.lock:
+            self.sessions[user_id] = session
+            self.sessions.move_to_end(user_id)
+            self.stats["loads"] += 1
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def memory_report(self, top=10):
+        """Approximate resident bytes of history text + turn records (Gemini objects not included)."""
+        with self.lock:
+            sizes = [(uid, s.nbytes, len(s)) for uid, s in self.sessions.items()]
+            stats = dict(self.stats)
+        total = sum(n for _, n, _ in sizes)
+        largest = sorted(sizes, key=lambda x: x[1], reverse=True)[:top]
+        return {
+            **stats,
+            "resident_sessions": len(sizes),
+            "max_sessions": self.max_sessions,
+            "resident_bytes": total,
+            "bytes_per_active_user": round(total / len(sizes)) if sizes else 0,
+            "largest": [{"user_id": uid, "bytes": n, "turns": t} for uid, n, t in largest],
+        }
+
+
+class HistoryWindow:
+    """
+    Decides which part of a user's history is sent to Gemini.
+
+    - The last `max_turns` messages are kept verbatim, as long as they fit in `token_budget`.
+    - Everything older is folded into a rolling per-user summary. Folding costs an
+      LLM call, so we only do it once `fold_batch` messages have fallen out of the window,
+      and never on the request path: schedule_fold() runs after the reply is recorded,
+      through `submit_fn` (the I/O pool), and installs Session.summary when it lands.
+      Until then the unfolded messages are still sent verbatim.
+    - The summary exists only in memory (Session.summary). It is lost when the
+      session is evicted from the SessionCache or the server restarts, so the first
+      turn afterwards schedules a fold of up to `max_fold_input` messages.
+    - Tracks how many prompt tokens the window saved compared to sending everything.
+    """
+
+    def __init__(self, summarize_fn, max_turns, token_budget, fold_batch, max_fold_input, submit_fn=None):
+        self.summarize_fn = summarize_fn  # (previous_summary: str, turns: list) -> str or None
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.fold_batch = fold_batch
+        self.max_fold_input = max_fold_input
+        self.submit_fn = submit_fn  # submit_fn(fn) runs fn in the background; None folds inline
+
+        self.lock = threading.Lock()
+        self.folding = set()  # user_ids with a fold in flight
+        self.stats = {
+            "turns": 0,
+            "folds": 0,
+            "history_tokens_full": 0,
+            "history_tokens_sent": 0,
+            "tokens_saved": 0,
+        }
+
+    def build(self, user_id, session):
+        """
+        Returns (turns_to_send, info) where turns_to_send is a list of Turn
+        records (see Turn.content()) starting with a user turn.
+        """
+        turns = session.turns
+        full_tokens = session.tokens
+        tail_start = self._tail_start(turns)
+
+        # Assemble: [summary pair] + not-yet-folded messages + verbatim tail. At most
+        # 2 * fold_batch - 1 unfolded messages ride along: a batch whose fold is still
+        # in flight plus the next, partial one. If folding keeps failing, older ones drop out.
+        start = max(session.summary[0], tail_start - 2 * self.fold_batch + 1)
+        while start < tail_start and turns[start].role != "user":
+            start += 1
+        window = list(session.summary[2])
+        window.extend(turns[start:])
+
+        sent_tokens = sum(t.tokens for t in window)
+        saved = max(0, full_tokens - sent_tokens)
+
+        with self.lock:
+            self.stats["turns"] += 1
+            self.stats["history_tokens_full"] += full_tokens
+            self.stats["history_tokens_sent"] += sent_tokens
+            self.stats["tokens_saved"] += saved
+
+        info = {
+            "history_tokens_full": full_tokens,
+            "history_tokens_sent": sent_tokens,
+            "tokens_saved": saved,
+            "verbatim_turns": len(turns) - start,
+        }
+        return window, info
+
+    def _tail_start(self, turns):
+        """Index of the first message in the verbatim tail."""
+        # Walk back from the newest message until we hit the turn or token limit
+        tail_start = len(turns)
+        used = 0
+        while tail_start > 0 and len(turns) - tail_start < self.max_turns:
+            cost = turns[tail_start - 1].tokens
+            if used + cost > self.token_budget:
+                break
+            used += cost
+            tail_start -= 1
+
+        # Gemini expects history to start with a user turn
+        while tail_start < len(turns) and turns[tail_start].role != "user":
+            tail_start += 1
+        return tail_start
+
+    def schedule_fold(self, user_id, session):
+        """
+        Call after a turn is recorded: folds the messages that fell out of the
+        window once there are `fold_batch` of them. One fold per user at a time.
+        """
+        tail_start = self._tail_start(session.turns)
+        pending = session.turns[session.summary[0]:tail_start]
+        if len(pending) < self.fold_batch:
+            return
+        with self.lock:
+            if user_id in self.folding:
+                return
+            self.folding.add(user_id)
+
+        def fold():
+            try:
+                self._fold(user_id, session, pending, tail_start)
+            finally:
+                with self.lock:
+                    self.folding.discard(user_id)
+
+        if self.submit_fn is None:
+            fold()
+            return
+        try:
+            self.submit_fn(fold)
+        except RuntimeError as e:  # Pool shut down
+            print(f"[Memory] Could not schedule a fold for {user_id}: {e}")
+            with self.lock:
+                self.folding.discard(user_id)
+
+    def _fold(self, user_id, session, pending, new_folded):
+        # Long backlogs (e.g. first turn after a restart) are capped to the most recent part
+        pending = pending[-self.max_fold_input:]
+        try:
+            new_summary = self.summarize_fn(session.summary[1], pending)
+        except Exception as e:
+            print(f"[Memory] Summarization failed for {user_id}: {e}")
+            return
+        if not new_summary or new_folded <= session.summary[0]:
+            return
+
+        pair = (Turn("user", SUMMARY_PREFIX + new_summary), Turn("model", SUMMARY_ACK))
+        session.summary = (new_folded, new_summary, pair)
+        with self.lock:
+            self.stats["folds"] += 1
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
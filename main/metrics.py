@@ -0,0 +1,177 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Prometheus text exposition, without pulling in prometheus_client.
+# Metrics register themselves in REGISTRY; COLLECTORS are callbacks that
+# produce samples at scrape time (cache / batcher / key-pool counters).
+REGISTRY = []
+COLLECTORS = []
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Per-request stage timings (ms) for the opt-in response breakdown
+_breakdown = contextvars.ContextVar("sensei_breakdown", default=None)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{str(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in self.values.items():
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge:
+    """Either set() explicitly or computed at scrape time from `fn`."""
+
+    def __init__(self, name, documentation, fn=None):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.value = 0
+        REGISTRY.append(self)
+
+    def set(self, value):
+        self.value = value
+
+    def render(self):
+        value = self.value
+        if self.fn:
+            try:
+                value = self.fn()
+            except Exception:
+                value = 0
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [bucket_counts, sum, count]
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total, count) in self.series.items():
+                for bound, c in zip(self.buckets, counts):
+                    labels = _format_labels(self.labelnames, key, ("le", bound))
+                    lines.append(f"{self.name}_bucket{labels} {c}")
+                labels = _format_labels(self.labelnames, key, ("le", "+Inf"))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                plain = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{plain} {total}")
+                lines.append(f"{self.name}_count{plain} {count}")
+        return lines
+
+
+#  METRICS 
+STAGE_SECONDS = Histogram("sensei_stage_seconds", "Time spent in each pipeline stage", ["stage"])
+REQUEST_SECONDS = Histogram("sensei_request_seconds", "End-to-end request latency", ["endpoint"])
+REQUESTS = Counter("sensei_requests_total", "Requests by endpoint and outcome", ["endpoint", "status"])
+ROUTER_DECISIONS = Counter("sensei_router_decisions_total", "How each query was routed", ["path"])
+ROUTER_PATH_SECONDS = Histogram("sensei_router_path_seconds", "Routing latency per path (keyword / local / llm)", ["path"])
+GEMINI_TOKENS = Counter("sensei_gemini_tokens_total", "Gemini tokens reported by usage metadata", ["kind"])
+GEMINI_KEY_EVENTS = Counter("sensei_gemini_key_events_total", "Per-key call outcomes", ["key", "event"])
+SPECULATION = Counter("sensei_speculative_retrieval_total", "Prefetched candidates used locally vs re-queried", ["outcome"])
+CANDIDATE_LOOKUPS = Counter("sensei_candidate_index_total", "Routes served from the precomputed candidate index vs falling back to ANN", ["outcome"])
+RERANK_PATHS = Counter("sensei_rerank_path_total", "Adaptive reranking decisions", ["path"])
+PROMPT_TOKENS = Counter("sensei_prompt_tokens_total", "Input tokens per caller, served from a prompt cache or not", ["source", "kind"])
+HISTORY_TOKENS = Counter("sensei_history_tokens_total", "Estimated history tokens (full vs sent vs saved)", ["kind"])
+SCHEDULER_EVENTS = Counter("sensei_scheduler_events_total", "Chat turns executed vs joined to an identical in-flight turn", ["event"])
+REJECTIONS = Counter("sensei_rejections_total", "Off-topic rejections served from the pool, generated live or short-circuited", ["path"])
+
+
+def register_collector(fn):
+    """fn() -> list of exposition lines, evaluated on every scrape."""
+    COLLECTORS.append(fn)
+
+
+def dict_collector(prefix, label, fetch):
+    """
+    Turns {name: {field: number}} (e.g. cache_stats()) into one series per field:
+    sensei_<prefix>_<field>{<label>="name"} value
+    """
+    def collect():
+        lines = []
+        for name, fields in fetch().items():
+            for field, value in fields.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f'sensei_{prefix}_{field}{{{label}="{name}"}} {value}')
+        return lines
+    return collect
+
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for collector in COLLECTORS:
+        try:
+            lines.extend(collector())
+        except Exception as e:
+            lines.append(f"# collector error: {e}")
+    return "\n".join(lines) + "\n"
+
+
+def start_request_breakdown():
+    """Begin collecting stage timings for the current request (context-local)."""
+    breakdown = {}
+    _breakdown.set(breakdown)
+    return breakdown
+
+
+@contextmanager
+def timed(stage):
+    """Records the block's duration in sensei_stage_seconds and the request breakdown."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        breakdown = _breakdown.get()
+        if breakdown is not None:
+            breakdown[stage] = round(breakdown.get(stage, 0.0) + elapsed * 1000, 2)
@@ -0,0 +1,144 @@
+import asyncio
+import config
+import metrics
+from scheduler import UserScheduler, request_key
+
+
+def brain_state(profile: dict) -> dict:
+    """Flat profile (as stored / sent by the frontend) -> the state dict SenseiBrain expects."""
+    return {
+        "learning_progress": {
+            "current_chapter": profile["current_chapter"],
+            "finished_chapters": profile["finished_chapters"],
+            "unfinished_chapters": profile["unfinished_chapters"]
+        },
+        "trade_metrics": {
+            "win_rate": profile["win_rate"]
+        }
+    }
+
+
+def student_chapters(profile: dict) -> list:
+    """The chapters an untagged question most likely belongs to: current + upcoming."""
+    return [profile["current_chapter"]] + list(profile["unfinished_chapters"])
+
+
+class ChatPipeline:
+    """
+    Python API over the loaded components for jobs that send many queries at
+    once (evaluation runs, nightly lesson recaps), used by /chat/batch.
+
+    - All queries are routed together, embedded in one pass and reranked in
+      one Cross-Encoder call (SemanticRouter / RAGPipeline batch methods).
+    - Gemini calls run with at most `concurrency` in flight. Turns for the
+      same user keep their input order so history stays consistent, also
+      against the same user's /chat traffic when the server's UserScheduler
+      is passed in; identical (user, query) items share one Gemini call.
+    - Results come back in input order; a failing item gets an "error"
+      instead of failing the whole batch.
+    """
+
+    def __init__(self, router, rag, brain, profiles, executor,
+                 concurrency=config.BATCH_GEMINI_CONCURRENCY, scheduler=None):
+        self.router = router
+        self.rag = rag
+        self.brain = brain
+        self.profiles = profiles
+        self.executor = executor
+        self.concurrency = concurrency
+        self.scheduler = scheduler or UserScheduler()
+
+    @classmethod
+    def from_components(cls, components, **kwargs):
+        """Builds a pipeline from the server's ml_models dict."""
+        kwargs.setdefault("scheduler", components.get("scheduler"))
+        return cls(components["router"], components["rag"], components["brain"],
+                   components["profiles"], components["executor"], **kwargs)
+
+    async def run_batch(self, items: list) -> list:
+        """
+        items: [{"user_id", "query", "user_state": {current_chapter, finished_chapters,
+        unfinished_chapters, win_rate}}, ...]
+        Returns one {"answer", "sources", "context", "error"} per item.
+        """
+        results = [{"answer": None, "sources": [], "context": None, "error": None} for _ in items]
+
+        # 1. Registered users only; sync their profiles.
+        # An unknown id may have just registered on another worker.
+        if any(not self.profiles.exists(item["user_id"]) for item in items):
+            await self.executor.run_io(self.profiles.refresh_if_stale)
+        valid = []
+        for i, item in enumerate(items):
+            if not self.profiles.exists(item["user_id"]):
+                results[i]["error"] = f"User '{item['user_id']}' not registered in Sensei DB."
+                continue
+            valid.append(i)
+        if not valid:
+            return results
+
+        # One pass (and in "sync" mode one disk write) for the whole batch, off the event loop
+        with metrics.timed("profile_write"):
+            await self.executor.run_io(
+                self.profiles.update_many, [(items[i]["user_id"], items[i]["user_state"]) for i in valid]
+            )
+
+        # 2. Routing + retrieval for the whole batch
+        queries = [items[i]["query"] for i in valid]
+        tags_list = [[] for _ in queries]
+        contexts = [None] * len(queries)
+        on_topic = [j for j, q in enumerate(queries) if not self.brain.rejections.is_off_topic(q)]
+        if on_topic:
+            kept = [queries[j] for j in on_topic]
+            kept_tags = await self._route_batch(kept)
+            kept_chapters = [student_chapters(items[valid[j]]["user_state"]) for j in on_topic]
+            kept_contexts = await self.executor.run_cpu(
+                self.rag.search_batch, kept, kept_tags, chapters_list=kept_chapters
+            )
+            for j, tags, context in zip(on_topic, kept_tags, kept_contexts):
+                tags_list[j] = tags
+                contexts[j] = context
+
+        # 3. Generation, bounded
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def generate(i, tags, context):
+            item = items[i]
+
+            async def call_gemini():
+                async with semaphore:
+                    return await self.executor.run_io(
+                        self.brain.generate_response,
+                        user_id=item["user_id"],
+                        user_query=item["query"],
+                        rag_context=context,
+                        user_state=brain_state(item["user_state"])
+                    )
+
+            key = request_key("batch", item["user_id"], item["query"], item["user_state"])
+            answer = await self.scheduler.run(item["user_id"], key, call_gemini)
+            results[i].update(answer=answer, sources=tags if tags else ["General Logic"], context=context)
+
+        outcomes = await asyncio.gather(
+            *(generate(i, tags, context) for i, tags, context in zip(valid, tags_list, contexts)),
+            return_exceptions=True
+        )
+        for i, outcome in zip(valid, outcomes):
+            if isinstance(outcome, Exception):
+                results[i]["error"] = f"Generation failed: {outcome}"
+        return results
+
+    def run_batch_sync(self, items: list) -> list:
+        """Blocking run_batch() for scripts that don't have an event loop."""
+        return asyncio.run(self.run_batch(items))
+
+    async def _route_batch(self, queries):
+        # Local routing is one matrix product; LLM routing is one Groq call per query
+        if config.ROUTER_MODE == "local":
+            return await self.executor.run_cpu(self.router.get_relevant_tags_batch, queries)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def route(query):
+            async with semaphore:
+                return await self.executor.run_io(self.router.get_relevant_tags, query)
+
+        return list(await asyncio.gather(*(route(q) for q in queries)))
@@ -0,0 +1,313 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import config
+from locks import file_lock
+
+
+class ProfileBackend:
+    """
+    Where profiles are persisted. `save_many` gets only the dirty ones, with
+    the time each was last updated: with several workers sharing a backend,
+    the most recent update of a profile wins, whichever worker flushes last.
+    """
+
+    def load_all(self) -> dict:
+        raise NotImplementedError
+
+    def save_many(self, profiles: dict, updated_at: dict):
+        raise NotImplementedError
+
+    def load_changed(self):
+        """Profiles written (by any worker) since the previous call: {user_id: profile}."""
+        return {}
+
+    def close(self):
+        pass
+
+
+class SqliteProfileBackend(ProfileBackend):
+    """One row per user, so a flush touches only the users that changed."""
+
+    def __init__(self, path=config.PROFILE_DB_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            " user_id TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " updated_at REAL NOT NULL DEFAULT 0,"
+            " seq INTEGER NOT NULL DEFAULT 0)"
+        )
+        # updated_at: when the profile changed (newest wins); seq: commit order, for load_changed()
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(profiles)")]
+        if "updated_at" not in columns:
+            self.conn.execute("ALTER TABLE profiles ADD COLUMN updated_at REAL NOT NULL DEFAULT 0")
+        if "seq" not in columns:
+            self.conn.execute("ALTER TABLE profiles ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_profiles_seq ON profiles(seq)")
+        self.conn.commit()
+        self._seed_from_json(config.USERS_DB_PATH)
+        self.seen_seq = 0
+
+    def _seed_from_json(self, path):
+        """users_db.json stays the registration list: new users in it are imported, existing rows win."""
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                seed = json.load(f)
+        except Exception as e:
+            print(f"[System] Could not read {path} for seeding: {e}")
+            return
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO profiles (user_id, data, seq) "
+                "VALUES (?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM profiles))",
+                [(uid, json.dumps(p)) for uid, p in seed.items()]
+            )
+            self.conn.commit()
+
+    def load_all(self) -> dict:
+        with self.lock:
+            rows = self.conn.execute("SELECT user_id, data, seq FROM profiles").fetchall()
+        self.seen_seq = max((r[2] for r in rows), default=0)
+        return {uid: json.loads(data) for uid, data, _ in rows}
+
+    def save_many(self, profiles: dict, updated_at: dict):
+        # A row only moves forward in time, so a worker flushing an older update can't clobber a newer one
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO profiles (user_id, data, updated_at, seq) "
+                "VALUES (?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM profiles)) "
+                "ON CONFLICT(user_id) DO UPDATE SET "
+                "data = excluded.data, updated_at = excluded.updated_at, seq = excluded.seq "
+                "WHERE excluded.updated_at >= profiles.updated_at",
+                [(uid, json.dumps(p), updated_at[uid]) for uid, p in profiles.items()]
+            )
+            self.conn.commit()
+
+    def load_changed(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT user_id, data, seq FROM profiles WHERE seq > ?", (self.seen_seq,)
+            ).fetchall()
+        if rows:
+            self.seen_seq = max(r[2] for r in rows)
+        return {uid: json.loads(data) for uid, data, _ in rows}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class JsonProfileBackend(ProfileBackend):
+    """
+    Original users_db.json format. A flush still rewrites the file, but only
+    from the flush thread and atomically (temp file + os.replace).
+    Workers flush under an flock and re-read the file first, so each one
+    only overwrites the users it changed.
+    """
+
+    def __init__(self, path=config.USERS_DB_PATH):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.snapshot = {}
+        self.mtime = None
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            self.snapshot, self.mtime = {}, None
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            self.snapshot = json.load(f)
+        self.mtime = os.stat(self.path).st_mtime_ns
+
+    def load_all(self) -> dict:
+        with file_lock(self.lock_path, exclusive=False):
+            self._read()
+        return dict(self.snapshot)
+
+    def save_many(self, profiles: dict, updated_at: dict):
+        with file_lock(self.lock_path):
+            self._read()
+            self.snapshot.update(profiles)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.mtime = os.stat(self.path).st_mtime_ns
+
+    def load_changed(self):
+        # No per-user timestamps in this format: if the file moved, hand back
+        # everything and let the store skip what it already has
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if mtime == self.mtime:
+            return {}
+        with file_lock(self.lock_path, exclusive=False):
+            self._read()
+        return dict(self.snapshot)
+
+
+class UserProfileStore:
+    """
+    In-memory profile cache with write-behind persistence.
+
+    - update() is a no-op when the incoming profile equals what we have.
+    - Changed profiles are marked dirty and flushed in one batch, either
+      immediately ("sync"), every flush_interval seconds ("interval"),
+      or only on close() ("shutdown").
+    - With several workers (shared=True) each one also pulls the profiles
+      the others wrote every refresh_interval seconds; our own unflushed
+      changes are kept over theirs.
+    - exists() never touches the backend. For an unknown id, callers may run
+      refresh_if_stale() (off the event loop) and ask again; it reads the
+      backend at most once per refresh_interval, whatever ids are sent.
+    """
+
+    def __init__(self, backend=None, durability=config.PROFILE_DURABILITY,
+                 flush_interval=config.PROFILE_FLUSH_INTERVAL_SECONDS,
+                 shared=config.WORKERS > 1, refresh_interval=config.PROFILE_REFRESH_SECONDS):
+        self.backend = backend or create_profile_backend()
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.shared = shared
+        self.refresh_interval = refresh_interval
+
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.profiles = self.backend.load_all()
+        self.dirty = set()
+        self.updated_at = {}  # user_id -> time of the pending (dirty) update
+        self.stats = {"updates": 0, "unchanged": 0, "flushes": 0, "profiles_written": 0, "pulled": 0}
+        self.last_refresh = time.monotonic()
+
+        self._stop = threading.Event()
+        self._flusher = None
+        if self.durability == "interval" or self.shared:
+            self._flusher = threading.Thread(target=self._flush_loop, name="profile-flusher", daemon=True)
+            self._flusher.start()
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def exists(self, user_id) -> bool:
+        return user_id in self.profiles
+
+    def get(self, user_id):
+        with self.lock:
+            profile = self.profiles.get(user_id)
+            return dict(profile) if profile is not None else None
+
+    def update(self, user_id, profile: dict) -> bool:
+        """Returns True if the profile actually changed."""
+        return self.update_many([(user_id, profile)]) == 1
+
+    def update_many(self, updates) -> int:
+        """
+        [(user_id, profile), ...] applied together, with at most one flush in
+        "sync" mode. Returns how many profiles actually changed.
+        """
+        changed = 0
+        with self.lock:
+            for user_id, profile in updates:
+                if self.profiles.get(user_id) == profile:
+                    self.stats["unchanged"] += 1
+                    continue
+                self.profiles[user_id] = dict(profile)
+                self.dirty.add(user_id)
+                self.updated_at[user_id] = time.time()
+                self.stats["updates"] += 1
+                changed += 1
+
+        if changed and self.durability == "sync":
+            self.flush()
+        return changed
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                batch = {uid: dict(self.profiles[uid]) for uid in self.dirty}
+                stamps = {uid: self.updated_at.pop(uid) for uid in self.dirty}
+                self.dirty.clear()
+            try:
+                self.backend.save_many(batch, stamps)
+            except Exception as e:
+                print(f"[System] Profile flush failed: {e}. Will retry.")
+                with self.lock:
+                    for uid, stamp in stamps.items():
+                        if uid not in self.dirty:
+                            self.dirty.add(uid)
+                            self.updated_at[uid] = stamp
+                return
+            with self.lock:
+                self.stats["flushes"] += 1
+                self.stats["profiles_written"] += len(batch)
+
+    def refresh_if_stale(self):
+        """refresh(), unless one ran in the last refresh_interval seconds. Blocking."""
+        if not self.shared:
+            return
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_refresh < self.refresh_interval:
+                return
+            self.last_refresh = now
+        self.refresh()
+
+    def refresh(self):
+        """Pulls profiles written by other workers."""
+        self.last_refresh = time.monotonic()
+        try:
+            changed = self.backend.load_changed()
+        except Exception as e:
+            print(f"[System] Profile refresh failed: {e}")
+            return
+        with self.lock:
+            for uid, profile in changed.items():
+                if uid in self.dirty or self.profiles.get(uid) == profile:
+                    continue
+                self.profiles[uid] = profile
+                self.stats["pulled"] += 1
+
+    def _flush_loop(self):
+        if self.durability == "interval" and self.shared:
+            interval = min(self.flush_interval, self.refresh_interval)
+        else:
+            interval = self.flush_interval if self.durability == "interval" else self.refresh_interval
+        while not self._stop.wait(interval):
+            if self.durability == "interval":
+                self.flush()
+            if self.shared:
+                self.refresh()
+
+    def get_stats(self):
+        with self.lock:
+            return {**self.stats, "users": len(self.profiles), "dirty": len(self.dirty),
+                    "durability": self.durability, "shared": self.shared}
+
+    def close(self):
+        self._stop.set()
+        if self._flusher:
+            self._flusher.join(timeout=max(self.flush_interval, self.refresh_interval) + 1)
+        self.flush()
+        self.backend.close()
+
+
+def create_profile_backend(backend=config.PROFILE_BACKEND) -> ProfileBackend:
+    if backend == "sqlite":
+        return SqliteProfileBackend()
+    if backend == "json":
+        return JsonProfileBackend()
+    raise ValueError(f"Unknown PROFILE_BACKEND: {backend}")
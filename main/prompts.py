@@ -0,0 +1,128 @@
+import threading
+from collections import deque
+import metrics
+
+# Prompt assembly. Everything that is the same for every student lives in
+# module-level constants (the static prefix), so it is byte-identical on
+# every call and can be served from a prompt cache: Gemini's implicit and
+# Groq's automatic prefix caching. The per-student
+# fields go into the user turn instead of the system instruction.
+
+SENSEI_SYSTEM_PREFIX = """
+        You are "The Sensei", a wise, slightly strict, but caring trading mentor.
+
+        Every student message starts with a STUDENT PROFILE block (recent win rate,
+        current lesson, completed modules, future modules), followed by the
+        REFERENCE CONTEXT and the USER QUESTION.
+
+        === INSTRUCTIONS ===
+        1. **Source of Truth:** Answer using ONLY the provided REFERENCE CONTEXT. If the answer is not there, admit ignorance.
+        2. **Contextual Teaching:**
+           - If the user asks about a topic in "Completed Modules", remind them they should already know this (be slightly disappointed).
+           - If the user asks about a topic in "Future Modules", tell them to be patient, as they will learn it soon.
+           - If the win rate is low (<50%), emphasize risk management and discipline.
+        3. **Tone:** concise (under 150 words), authoritative, using trading metaphors.
+        """
+
+REJECTION_INSTRUCTION = """
+        You are "The Sensei". The student has asked a question that is OUTSIDE the "Scrolls of Knowledge" (your database).
+
+        TASK:
+        Refuse to answer. You must be HUMOROUS, STERN, and use TRADING METAPHORS.
+
+        Examples of style:
+        - "Focus! That question is like buying the top of a meme coin - foolish."
+        - "We are here to study charts, not the weather. Your focus is drifting like a loose stop-loss."
+
+        Do NOT answer the question. Just scold them wittily.
+        """
+
+SUMMARY_INSTRUCTION = (
+    "You maintain a short running summary of a tutoring conversation between a "
+    "trading student and their mentor. Keep what the student struggles with, "
+    "topics already explained and any commitments made. Max 120 words, plain text."
+)
+
+
+def student_profile_block(user_state) -> str:
+    """The dynamic, per-student part of the Sensei prompt."""
+    trade_metrics = user_state.get('trade_metrics', {})
+    win_rate = trade_metrics.get('win_rate', 'unknown')
+
+    progress = user_state.get('learning_progress', {})
+    current = progress.get('current_chapter', 'Unknown')
+
+    finished_list = progress.get('finished_chapters', [])
+    finished_str = ", ".join(finished_list) if finished_list else "None"
+
+    unfinished_list = progress.get('unfinished_chapters', [])
+    unfinished_str = ", ".join(unfinished_list) if unfinished_list else "None"
+
+    return (
+        "STUDENT PROFILE:\n"
+        f"• Recent Win Rate: {win_rate}\n"
+        f"• Current Lesson:  {current}\n"
+        f"• Completed Modules: [{finished_str}]\n"
+        f"• Future Modules:    [{unfinished_str}]"
+    )
+
+
+def sensei_turn_input(user_state, rag_text, user_query) -> str:
+    """Profile + context + question as one user block."""
+    return (
+        f"{student_profile_block(user_state)}\n\n"
+        f"REFERENCE CONTEXT:\n{rag_text}\n\n"
+        f"USER QUESTION:\n{user_query}"
+    )
+
+
+def router_system_prompt(valid_tags) -> str:
+    """The router's glossary prompt (SemanticRouter builds it once and reuses it)."""
+    glossary_string = ", ".join(valid_tags)
+    return (
+        "You are a strict query classifier. "
+        "Your job is to map the USER QUERY to the most relevant tags from the GLOSSARY list.\n"
+        f"GLOSSARY: {glossary_string}\n\n"
+        "RULES:\n"
+        "1. Return ONLY a JSON object of the form {\"tags\": [\"tag1\", \"tag2\"]}.\n"
+        "2. Use ONLY tags from the glossary, spelled exactly as listed.\n"
+        "3. If unrelated, return {\"tags\": []}."
+    )
+
+
+class PromptUsage:
+    """Cached vs uncached input tokens, per caller ("answer", "router", ...) and per recent call."""
+
+    def __init__(self, recent=100):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.recent = deque(maxlen=recent)
+
+    def record(self, source, prompt_tokens, cached_tokens):
+        prompt_tokens = prompt_tokens or 0
+        cached_tokens = cached_tokens or 0
+        uncached = max(prompt_tokens - cached_tokens, 0)
+        metrics.PROMPT_TOKENS.inc(cached_tokens, source=source, kind="cached")
+        metrics.PROMPT_TOKENS.inc(uncached, source=source, kind="uncached")
+        with self.lock:
+            totals = self.totals.setdefault(source, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0})
+            totals["calls"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["cached_tokens"] += cached_tokens
+            self.recent.append({"source": source, "prompt_tokens": prompt_tokens,
+                                "cached_tokens": cached_tokens, "uncached_tokens": uncached})
+
+    def get_stats(self):
+        with self.lock:
+            sources = {
+                source: {
+                    **t,
+                    "uncached_tokens": t["prompt_tokens"] - t["cached_tokens"],
+                    "cached_ratio": round(t["cached_tokens"] / t["prompt_tokens"], 4) if t["prompt_tokens"] else 0.0,
+                }
+                for source, t in self.totals.items()
+            }
+            return {"sources": sources, "recent_calls": list(self.recent)}
+
+
+USAGE = PromptUsage()
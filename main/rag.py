@@ -1,8 +1,16 @@
 import chromadb
-from chromadb.utils import embedding_functions
-from sentence_transformers import CrossEncoder
 import config
+import encoders
+import inference
+from cache import TTLCache, SemanticCache, MISS, normalize_query
+from batcher import MicroBatcher
+from lexical import BM25Index, reciprocal_rank_fusion
+from candidates import CandidateIndex, chapter_key, collection_digest, read_collection
+from ingest import tag_filter
+import metrics
 import os
+import threading
+import numpy as np
 
 # --- SILENCE WARNINGS ---
 # Hide the "Not Authenticated" warning
@@ -17,73 +25,529 @@ import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 # ------------------------
 
+def open_collection(path=None):
+    """
+    The trading_knowledge collection, opened the same way everywhere
+    (server, ingestion, benchmarks). No embedding function: every add and
+    query passes vectors from the shared `encoders` embedder, so Chroma must
+    not load a second copy of the model.
+    """
+    chroma_client = chromadb.PersistentClient(path=path or config.DB_PATH)
+    return chroma_client.get_or_create_collection(
+        name=config.COLLECTION_NAME,
+        embedding_function=None
+    )
+
 class RAGPipeline:
     def __init__(self):
         # 1. Setup Chroma
-        self.chroma_client = chromadb.PersistentClient(path=config.DB_PATH)
-        self.embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name=config.EMBEDDING_MODEL
-        )
-        self.collection = self.chroma_client.get_or_create_collection(
-            name=config.COLLECTION_NAME,
-            embedding_function=self.embedding_fn
-        )
+        self.collection = open_collection()
 
         # 2. Setup Reranker (Cross-Encoder)
         # We load this once on startup because it's heavy
-        print(f"Loading Reranker: {config.RERANKER_MODEL}...")
-        self.reranker = CrossEncoder(config.RERANKER_MODEL)
+        self.reranker = inference.load_reranker()
         print("Reranker Ready.")
 
-    def search(self, query: str, tags: list = None, top_k_retrieval=5) -> dict:
+        # Pairs from concurrent requests share one Cross-Encoder forward pass
+        self.rerank_batcher = None
+        if config.MICRO_BATCHING_ENABLED:
+            self.rerank_batcher = MicroBatcher(
+                "rerank", self._predict_scores, config.RERANK_MAX_BATCH, config.RERANK_MAX_WAIT_MS
+            )
+
+        # Distance metric of the collection (needed to turn distances back into similarities)
+        self.distance_space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+
+        # Adaptive rerank report (only filled when ADAPTIVE_RERANK_REPORT is on)
+        self.report_lock = threading.Lock()
+        self.rerank_report = {}
+        self.calibration_samples = []
+
+        # 3. BM25 + tag postings over the whole collection (hybrid mode)
+        self._chunks = None  # (ids, docs, metas), read at most once during startup
+        self.lexical = None
+        if config.RETRIEVAL_MODE == "hybrid":
+            self.lexical = self._build_lexical_index()
+
+        # 4. Precomputed per-tag / per-chapter candidates (python candidates.py build)
+        self.candidate_index = None
+        if config.CANDIDATE_INDEX_ENABLED:
+            self.candidate_index = CandidateIndex.load(
+                expected_digest=lambda: collection_digest(*self._collection_chunks())
+            )
+        self._chunks = None
+
+        # 5. Caches: exact (query, tags) and, optionally, near-duplicate queries
+        self.cache = TTLCache("retrieval", config.RETRIEVAL_CACHE_SIZE, config.CACHE_TTL_SECONDS)
+        self.semantic_cache = None
+        if config.SEMANTIC_CACHE_ENABLED:
+            self.semantic_cache = SemanticCache(
+                "retrieval_semantic",
+                config.SEMANTIC_CACHE_SIZE,
+                config.CACHE_TTL_SECONDS,
+                config.SEMANTIC_CACHE_THRESHOLD
+            )
+
+    def _collection_chunks(self):
+        if self._chunks is None:
+            self._chunks = read_collection(self.collection)
+        return self._chunks
+
+    def _build_lexical_index(self):
+        """Reads every chunk out of Chroma once and indexes it in memory."""
+        ids, docs, metas = self._collection_chunks()
+        index = BM25Index().build(ids, docs, metas, self.chunk_tags)
+        print(f"[RAG] BM25 index ready ({len(index)} chunks, {len(index.tag_postings)} tags).")
+        return index
+
+    def search(self, query: str, tags: list = None, top_k_retrieval=5, prefetched=None, chapters=None) -> dict:
         """
         Orchestrates the Retrieval -> Reranking pipeline.
+        `prefetched` is the output of prefetch() started while routing ran.
+        `chapters` (the student's current + upcoming ones) scope untagged
+        queries when the candidate index has them.
         Returns: Best document dict or None.
         """
-        
-        # --- A. RETRIEVAL (Vector Search) ---
-        where_filter = None
-        if tags:
-            # If 1 tag, strict match. If multiple, match ANY in list ($in)
-            if len(tags) == 1:
-                where_filter = {"tags": tags[0]}
+        tag_key = tuple(sorted(tags)) if tags else ()
+        scope = self._chapter_scope(tags, chapters)
+        cache_key = (normalize_query(query), tag_key, top_k_retrieval, scope)
+        cached = self.cache.get(cache_key)
+        if cached is not MISS:
+            return cached
+
+        query_vec = encoders.encode_query(query)
+        if self.semantic_cache:
+            cached = self.semantic_cache.get(query_vec, scope=(tag_key, top_k_retrieval, scope))
+            if cached is not MISS:
+                return cached
+
+        result = self._search_uncached(query, query_vec, tags, top_k_retrieval, prefetched, scope)
+        if result is None and scope:
+            # Nothing good enough in the student's chapters: search the whole book
+            result = self._search_uncached(query, query_vec, tags, top_k_retrieval, prefetched)
+
+        self.cache.set(cache_key, result)
+        if self.semantic_cache:
+            self.semantic_cache.set(query_vec, result, scope=(tag_key, top_k_retrieval, scope))
+        return result
+
+    def _chapter_scope(self, tags, chapters) -> tuple:
+        """Chapter keys to search within (only for untagged queries), or () for no scoping."""
+        if tags or not chapters or self.candidate_index is None or not config.CANDIDATE_CHAPTER_SCOPE:
+            return ()
+        return tuple(sorted({chapter_key(c) for c in chapters if self.candidate_index.has_chapter(c)}))
+
+    def search_batch(self, queries: list, tags_list: list, top_k_retrieval=5, chapters_list=None) -> list:
+        """
+        search() for many queries at once: one embedding pass, one unfiltered
+        Chroma query for all of them, and one Cross-Encoder call over every
+        (query, candidate) pair in the batch. chapters_list holds each query's
+        `chapters`, scoped (with the whole-book fallback) as in search().
+        Results come back in input order.
+        """
+        chapters_list = chapters_list or [None] * len(queries)
+        scopes = [self._chapter_scope(tags, chapters) for tags, chapters in zip(tags_list, chapters_list)]
+        results = [None] * len(queries)
+        todo = []
+        for i, (query, tags) in enumerate(zip(queries, tags_list)):
+            tag_key = tuple(sorted(tags)) if tags else ()
+            cached = self.cache.get((normalize_query(query), tag_key, top_k_retrieval, scopes[i]))
+            if cached is MISS:
+                todo.append((i, tag_key))
             else:
-                where_filter = {"tags": {"$in": tags}}
+                results[i] = cached
+        if not todo:
+            return results
+
+        query_vecs = encoders.encode_queries([queries[i] for i, _ in todo])
+        if self.semantic_cache:
+            remaining = []
+            for (i, tag_key), query_vec in zip(todo, query_vecs):
+                cached = self.semantic_cache.get(query_vec, scope=(tag_key, top_k_retrieval, scopes[i]))
+                if cached is MISS:
+                    remaining.append(((i, tag_key), query_vec))
+                else:
+                    results[i] = cached
+            todo = [item for item, _ in remaining]
+            query_vecs = [vec for _, vec in remaining]
+            if not todo:
+                return results
 
+        # --- A. RETRIEVAL: one over-fetch for the whole batch, tags applied locally ---
+        # (queries whose route or chapter scope is in the candidate index don't need it)
+        needs_ann = [
+            self.candidate_index is None or self.candidate_index.rows_for(tags_list[i], scopes[i]) is None
+            for i, _ in todo
+        ]
+        prefetched = [None] * len(todo)
+        if any(needs_ann):
+            with metrics.timed("prefetch"):
+                fetched = iter(self._dense_fetch_many(
+                    [vec for vec, ann in zip(query_vecs, needs_ann) if ann], self._prefetch_size()
+                ))
+            prefetched = [next(fetched) if ann else None for ann in needs_ann]
+
+        plans = []
+        for (i, tag_key), query_vec, fetched in zip(todo, query_vecs, prefetched):
+            query, tags = queries[i], tags_list[i]
+            candidates = self._candidates(query, query_vec, tags, top_k_retrieval, fetched, scopes[i])
+            if not candidates:
+                plans.append((i, tag_key, query_vec, None, None, []))
+                continue
+            path, pool = self._plan_rerank(query, query_vec, tags, candidates, fetched, scopes[i])
+            plans.append((i, tag_key, query_vec, candidates, path, pool))
+
+        # --- B. RERANKING: every pair in one Cross-Encoder call ---
+        to_score = [(queries[i], pool) for i, _, _, _, _, pool in plans if pool]
+        scored_lists = iter(self._score_many(to_score))
+
+        for i, tag_key, query_vec, candidates, path, pool in plans:
+            result = None
+            if candidates:
+                scored = next(scored_lists) if pool else []
+                result = self._pick_best(queries[i], path, candidates, scored)
+            if result is None and scopes[i]:
+                # Nothing good enough in the student's chapters: search the whole book
+                result = self._search_uncached(queries[i], query_vec, tags_list[i], top_k_retrieval)
+            results[i] = result
+            self.cache.set((normalize_query(queries[i]), tag_key, top_k_retrieval, scopes[i]), result)
+            if self.semantic_cache:
+                self.semantic_cache.set(query_vec, result, scope=(tag_key, top_k_retrieval, scopes[i]))
+        return results
+
+    def prefetch(self, query: str, n_results=None) -> dict:
+        """
+        Speculative, unfiltered vector search (run while the router is still working).
+        Returns {"candidates", "exhaustive"}, candidates ordered by distance.
+        """
+        if n_results is None:
+            n_results = self._prefetch_size()
+        query_vec = encoders.encode_query(query)
+        with metrics.timed("prefetch"):
+            return self._dense_fetch(query_vec, n_results)
+
+    def _prefetch_size(self):
+        if self.lexical is not None:
+            return max(config.SPECULATIVE_OVERFETCH, config.HYBRID_DENSE_FETCH)
+        return config.SPECULATIVE_OVERFETCH
+
+    def _dense_fetch(self, query_vec, n_results, where_filter=None) -> dict:
+        """
+        One Chroma query. Each candidate is {"id", "text", "metadata", "similarity"}
+        where similarity is the cosine similarity recovered from Chroma's distance.
+        """
+        return self._dense_fetch_many([query_vec], n_results, where_filter)[0]
+
+    def _dense_fetch_many(self, query_vecs, n_results, where_filter=None) -> list:
+        """Same as _dense_fetch(), for several query vectors in one Chroma call."""
+        # Embed with the shared (cached) encoder rather than the collection's own copy
         results = self.collection.query(
-            query_texts=[query],
-            n_results=top_k_retrieval,
-            where=where_filter
+            query_embeddings=[vec.tolist() for vec in query_vecs],
+            n_results=n_results,
+            where=where_filter,
+            include=["documents", "metadatas", "distances"]
         )
+        fetched = []
+        for q in range(len(query_vecs)):
+            candidates = [
+                {"id": chunk_id, "text": doc, "metadata": meta, "similarity": self._to_similarity(dist)}
+                for chunk_id, doc, meta, dist in zip(
+                    results['ids'][q], results['documents'][q],
+                    results['metadatas'][q], results['distances'][q]
+                )
+            ]
+            fetched.append({
+                "candidates": candidates,
+                # Fewer hits than asked for = we have the whole (filtered) collection
+                "exhaustive": len(candidates) < n_results,
+            })
+        return fetched
+
+    def _to_similarity(self, distance):
+        """
+        Chroma distance -> cosine similarity. Embeddings are L2-normalised, so
+        for the default "l2" space (squared L2) cos = 1 - d / 2.
+        """
+        if self.distance_space == "l2":
+            return 1.0 - distance / 2.0
+        return 1.0 - distance  # "cosine" and "ip"
 
-        raw_docs = results['documents'][0]
-        raw_metas = results['metadatas'][0]
+    @staticmethod
+    def chunk_tags(metadata) -> set:
+        """Chunk tags may be stored as a list or a comma-separated string."""
+        raw = (metadata or {}).get("tags")
+        if not raw:
+            return set()
+        if isinstance(raw, str):
+            return {t.strip() for t in raw.split(",") if t.strip()}
+        return set(raw)
 
-        if not raw_docs:
+    def _filter_prefetched(self, prefetched, tags, need, limit):
+        """
+        Applies the tag filter locally (via the tag postings when we have them).
+        Because candidates are sorted by distance, the first matches ARE the
+        nearest tagged chunks - exactly what the filtered Chroma query would
+        return. If fewer than `need` match and the over-fetch wasn't
+        exhaustive we can't know that, so return None.
+        """
+        if not tags:
+            matches = lambda c: True
+        elif self.lexical is not None:
+            allowed = self.lexical.ids_for_tags(tags)
+            matches = lambda c: c["id"] in allowed
+        else:
+            wanted = set(tags)
+            matches = lambda c: bool(self.chunk_tags(c["metadata"]) & wanted)
+
+        kept = [c for c in prefetched["candidates"] if matches(c)][:limit]
+        if len(kept) >= need or prefetched["exhaustive"]:
+            return kept
+        return None
+
+    def _search_uncached(self, query, query_vec, tags, top_k_retrieval, prefetched=None, chapters=None):
+        # --- A. RETRIEVAL (Vector Search [+ BM25]) ---
+        candidates = self._candidates(query, query_vec, tags, top_k_retrieval, prefetched, chapters)
+        if not candidates:
             return None
 
-        # --- B. RERANKING (Cross-Encoder) ---
+        # --- B. RERANKING (Cross-Encoder, adaptive) ---
+        path, pool = self._plan_rerank(query, query_vec, tags, candidates, prefetched, chapters)
+        scored = self._score_candidates(query, pool) if pool else []
+        return self._pick_best(query, path, candidates, scored)
+
+    def _candidates(self, query, query_vec, tags, top_k_retrieval, prefetched=None, chapters=None):
+        candidates = self._dense_candidates(query_vec, tags, top_k_retrieval, prefetched, chapters)
+        if self.lexical is not None:
+            candidates = self._fuse_with_lexical(query, tags, top_k_retrieval, candidates)
+        return candidates[:top_k_retrieval]
+
+    def _dense_candidates(self, query_vec, tags, top_k_retrieval, prefetched, chapters=None):
+        # Hybrid mode keeps a longer dense list for fusion; dense mode needs exactly k
+        limit = max(config.HYBRID_DENSE_FETCH, top_k_retrieval) if self.lexical is not None else top_k_retrieval
+
+        # Known route: rank the precomputed candidate set instead of searching the collection
+        if self.candidate_index is not None and (tags or chapters):
+            rows = self.candidate_index.rows_for(tags, chapters)
+            if rows is not None:
+                metrics.CANDIDATE_LOOKUPS.inc(outcome="tag_hit" if tags else "chapter_hit")
+                with metrics.timed("retrieval"):
+                    return self.candidate_index.nearest(query_vec, rows, limit)
+            metrics.CANDIDATE_LOOKUPS.inc(outcome="miss")
+
+        speculative = prefetched is not None
+
+        if prefetched is None and self.lexical is not None:
+            # Hybrid: tag filtering happens on our postings, not in Chroma
+            with metrics.timed("retrieval"):
+                prefetched = self._dense_fetch(query_vec, limit)
+
+        if prefetched is not None:
+            local = self._filter_prefetched(prefetched, tags, top_k_retrieval, limit)
+            if local is not None:
+                if speculative:
+                    metrics.SPECULATION.inc(outcome="hit")
+                return local
+            if speculative:
+                metrics.SPECULATION.inc(outcome="requery")
+
+        return self._retrieve(query_vec, tags, limit)
+
+    def _fuse_with_lexical(self, query, tags, top_k_retrieval, dense):
+        """
+        Reciprocal rank fusion of the dense list and a BM25 list, deduplicated
+        (by id and by identical text), cut to top_k_retrieval for the reranker.
+        BM25-only hits have no dense similarity (None).
+        """
+        allowed = None
+        if tags and not config.HYBRID_LEXICAL_IGNORES_TAGS:
+            allowed = self.lexical.ids_for_tags(tags)
+        with metrics.timed("lexical"):
+            lexical_ids = self.lexical.search(query, config.HYBRID_LEXICAL_FETCH, allowed)
+
+        dense_lookup = {c["id"]: c for c in dense}
+        fused = []
+        seen_text = set()
+        for chunk_id in reciprocal_rank_fusion([[c["id"] for c in dense], lexical_ids], k=config.RRF_K):
+            candidate = dense_lookup.get(chunk_id)
+            if candidate is None:
+                doc, meta = self.lexical.get(chunk_id)
+                candidate = {"id": chunk_id, "text": doc, "metadata": meta, "similarity": None}
+            if candidate["text"] in seen_text:
+                continue
+            seen_text.add(candidate["text"])
+            fused.append(candidate)
+            if len(fused) == top_k_retrieval:
+                break
+        return fused
+
+    def _retrieve(self, query_vec, tags, top_k_retrieval):
+        """Filtered Chroma query (the original path): chunks carrying ANY of the tags."""
+        with metrics.timed("retrieval"):
+            return self._dense_fetch(query_vec, top_k_retrieval, tag_filter(tags))["candidates"]
+
+    def _score_candidates(self, query, candidates):
+        """Cross-Encoder scores, best first: [{"score", "text", "metadata"}, ...]."""
+        return self._score_many([(query, candidates)])[0]
+
+    def _score_many(self, batch):
+        """
+        [(query, candidates), ...] -> one sorted score list per entry, from a
+        single Cross-Encoder call over all the pairs.
+        """
+        if not batch:
+            return []
+
         # Pair up [Query, Document]
-        pairs = [[query, doc] for doc in raw_docs]
+        pairs = [[query, c["text"]] for query, candidates in batch for c in candidates]
         
         # Predict scores
-        scores = self.reranker.predict(pairs)
-
-        # Zip everything together
-        candidates = []
-        for i in range(len(scores)):
-            candidates.append({
-                "score": float(scores[i]),
-                "text": raw_docs[i],
-                "metadata": raw_metas[i]
-            })
+        with metrics.timed("rerank"):
+            scores = self.rerank(pairs)
+
+        # Zip everything together, per query
+        results = []
+        offset = 0
+        for _, candidates in batch:
+            scored = []
+            for i, candidate in enumerate(candidates):
+                scored.append({
+                    "score": float(scores[offset + i]),
+                    "text": candidate["text"],
+                    "metadata": candidate["metadata"],
+                    "id": candidate["id"],
+                })
+            offset += len(candidates)
 
-        # Sort descending
-        candidates.sort(key=lambda x: x['score'], reverse=True)
-        best_match = candidates[0]
+            # Sort descending
+            scored.sort(key=lambda x: x['score'], reverse=True)
+            results.append(scored)
+        return results
 
+    @staticmethod
+    def _threshold(best):
         # --- C. THRESHOLD CHECK ---
-        if best_match['score'] > config.LOGIT_THRESHOLD:
-            return best_match
-        
-        return None
\ No newline at end of file
+        if best and best['score'] > config.LOGIT_THRESHOLD:
+            return {"score": best["score"], "text": best["text"], "metadata": best["metadata"]}
+        return None
+
+    # --- ADAPTIVE RERANKING ---
+
+    @staticmethod
+    def calibrated_score(similarity):
+        """Maps a bi-encoder cosine similarity onto the Cross-Encoder logit scale."""
+        return config.CALIBRATION_SLOPE * similarity + config.CALIBRATION_INTERCEPT
+
+    @staticmethod
+    def by_similarity(candidates) -> list:
+        """Candidates in dense order (best cosine similarity first); BM25-only ones last."""
+        return sorted(candidates, key=lambda c: -c["similarity"] if c["similarity"] is not None else float("inf"))
+
+    def choose_rerank_path(self, candidates):
+        """
+        Decided on the dense top-2 (fusion may have reordered the list):
+        "skip"     - top dense hit is strong and well ahead of #2: trust it
+                     (only once the calibration has been fitted)
+        "partial"  - clear leader: rerank only the top ADAPTIVE_TOP_M
+        "escalate" - weak top hit: rerank a bigger pool
+        "full"     - otherwise
+        BM25-only candidates (no similarity) in the fused top 2 force "full".
+        """
+        if not candidates or any(c["similarity"] is None for c in candidates[:2]):
+            return "full"
+        sims = [c["similarity"] for c in self.by_similarity(candidates) if c["similarity"] is not None]
+        top = sims[0]
+        gap = top - sims[1] if len(sims) > 1 else 1.0
+
+        calibrated = config.CALIBRATION_SLOPE is not None and config.CALIBRATION_INTERCEPT is not None
+        if calibrated and top >= config.ADAPTIVE_SKIP_MIN_SIMILARITY and gap >= config.ADAPTIVE_SKIP_MIN_GAP:
+            return "skip"
+        if top <= config.ADAPTIVE_ESCALATE_MAX_SIMILARITY:
+            return "escalate"
+        if gap >= config.ADAPTIVE_PARTIAL_MIN_GAP and len(sims) > config.ADAPTIVE_TOP_M:
+            return "partial"
+        return "full"
+
+    def _plan_rerank(self, query, query_vec, tags, candidates, prefetched=None, chapters=None):
+        """
+        Returns (path, pool): the candidates the Cross-Encoder has to score.
+        The pool is empty for "skip". Without ADAPTIVE_RERANK it's always a full rerank.
+        "escalate" re-fetches with the same prefetch and chapter scope as the first pass.
+        """
+        if not config.ADAPTIVE_RERANK:
+            return "full", candidates
+
+        path = self.choose_rerank_path(candidates)
+        metrics.RERANK_PATHS.inc(path=path)
+
+        if path == "skip":
+            return path, []
+        if path == "partial":
+            return path, self.by_similarity(candidates)[:config.ADAPTIVE_TOP_M]
+        if path == "escalate":
+            return path, self._candidates(query, query_vec, tags, config.ADAPTIVE_ESCALATE_K, prefetched, chapters)
+        return path, candidates
+
+    def _pick_best(self, query, path, candidates, scored):
+        """Best candidate for the planned path (scored = the pool's rerank), after the threshold."""
+        if path == "skip":
+            top = self.by_similarity(candidates)[0]
+            best = {
+                "score": self.calibrated_score(top["similarity"]),
+                "text": top["text"], "metadata": top["metadata"], "id": top["id"],
+            }
+        else:
+            best = scored[0]
+
+        if config.ADAPTIVE_RERANK and config.ADAPTIVE_RERANK_REPORT:
+            self._report(query, path, best, candidates)
+
+        return self._threshold(best)
+
+    def _report(self, query, path, best, candidates):
+        """Compares the adaptive choice with a full rerank of the normal candidate pool."""
+        full = self._score_candidates(query, candidates)
+        with self.report_lock:
+            stats = self.rerank_report.setdefault(path, {"count": 0, "top1_agree": 0})
+            stats["count"] += 1
+            stats["top1_agree"] += int(full[0]["id"] == best["id"])
+            # (similarity, logit) pairs for fitting CALIBRATION_SLOPE / _INTERCEPT
+            by_id = {c["id"]: c["similarity"] for c in candidates}
+            for scored in full:
+                similarity = by_id.get(scored["id"])
+                if similarity is not None:
+                    self.calibration_samples.append((similarity, scored["score"]))
+            del self.calibration_samples[:-5000]
+
+    def rerank_report_stats(self):
+        """Per-path counts, top-1 agreement with full reranking, and a suggested calibration fit."""
+        with self.report_lock:
+            report = {
+                path: {**s, "agreement": round(s["top1_agree"] / s["count"], 4) if s["count"] else None}
+                for path, s in self.rerank_report.items()
+            }
+            samples = list(self.calibration_samples)
+
+        fit = None
+        if len(samples) >= 10:
+            x = np.array([s for s, _ in samples])
+            y = np.array([l for _, l in samples])
+            slope, intercept = np.polyfit(x, y, 1)
+            fit = {"slope": round(float(slope), 3), "intercept": round(float(intercept), 3), "samples": len(samples)}
+
+        return {
+            "enabled": config.ADAPTIVE_RERANK_REPORT,
+            "paths": report,
+            "suggested_calibration": fit,
+            "current_calibration": {
+                "slope": config.CALIBRATION_SLOPE, "intercept": config.CALIBRATION_INTERCEPT
+            },
+        }
+
+    def rerank(self, pairs):
+        """Cross-Encoder logits for [query, doc] pairs (micro-batched when enabled)."""
+        if self.rerank_batcher:
+            return self.rerank_batcher.submit(pairs)
+        return self._predict_scores(pairs)
+
+    def _predict_scores(self, pairs):
+        return self.reranker.predict(pairs, batch_size=config.RERANK_MAX_BATCH, show_progress_bar=False)
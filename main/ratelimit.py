@@ -0,0 +1,62 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, holding at most `capacity`.
+    Thread-safe; never blocks (callers decide how to wait).
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, n=1) -> bool:
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= n:
+                self.tokens -= n
+                return True
+            return False
+
+    def available(self) -> float:
+        with self.lock:
+            self._refill(time.monotonic())
+            return self.tokens
+
+    def time_until_available(self, n=1) -> float:
+        """Seconds until `n` tokens will be in the bucket (0 if already there)."""
+        with self.lock:
+            self._refill(time.monotonic())
+            missing = n - self.tokens
+            return max(0.0, missing / self.rate) if self.rate > 0 else float("inf")
+
+
+class KeysUnavailableError(Exception):
+    """
+    No API key could take the request: all rate-limited / cooling down past
+    the acquire timeout, or every attempt hit a 5xx. The server answers 503.
+    Lives here rather than in gemini_client so the server can catch it
+    without importing google-genai at startup.
+    """
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"All Gemini API keys are currently unavailable; retry in {retry_after}s.")
+
+
+class GenerationError(Exception):
+    """
+    Gemini rejected the request with an error retrying won't fix (bad
+    request, blocked prompt, invalid key). Raised instead of returning the
+    error text, so it is never shown or stored as an answer. The server
+    answers 502.
+    """
@@ -0,0 +1,160 @@
+import json
+import threading
+import time
+from collections import deque
+import config
+import metrics
+from keywords import fold_plural
+from lexical import tokenize
+
+# Out-of-scope queries get a scolding, not an answer, so there is no need to
+# spend a Gemini call (and a second of latency) on each one. Rejections are
+# pre-generated in the background while the server is idle and served from a
+# rotating pool; obviously off-topic queries skip routing and retrieval too.
+
+FALLBACK_REJECTIONS = [
+    "Focus! That question is like buying the top of a meme coin - foolish.",
+    "We are here to study charts, not the weather. Your focus is drifting like a loose stop-loss.",
+    "That question is outside my scrolls. Chasing it is like revenge trading: loud, costly and pointless.",
+    "Off-topic questions are the overtrading of the mind. Close that position and come back to the charts.",
+    "You wander off the plan like a trader without a journal. Ask me about the markets, student.",
+]
+
+# Words that make a query plausibly about trading even if no glossary term matches
+DOMAIN_WORDS = {
+    "trade", "trades", "trading", "trader", "traders", "market", "markets", "price", "prices",
+    "chart", "charts", "stock", "stocks", "share", "shares", "forex", "fx", "crypto", "bitcoin",
+    "gold", "oil", "money", "profit", "profits", "loss", "losses", "losing", "lose", "win",
+    "winning", "rate", "risk", "buy", "sell", "long", "short", "entry", "exit", "position",
+    "account", "broker", "invest", "investing", "capital", "strategy", "plan", "candle",
+    "candlestick", "indicator", "volume", "trend", "lesson", "chapter", "module", "sensei",
+}
+
+
+class RejectionPool:
+    """
+    - take(): the next pre-generated rejection (round-robin), or None when
+      the pool is empty and the caller has to generate one live.
+    - A background thread tops the pool up with fresh Gemini-written lines,
+      but only when no request has come in for REJECTION_IDLE_SECONDS, and
+      only while the pool is short or its oldest line is stale.
+    - is_off_topic(): a lexical pre-check that lets the server skip routing
+      and retrieval for queries with no trading vocabulary at all.
+    """
+
+    def __init__(self, generate_fn, size=config.REJECTION_POOL_SIZE):
+        self.generate_fn = generate_fn
+        self.size = size
+        self.lines = deque(((line, 0.0) for line in FALLBACK_REJECTIONS), maxlen=size)  # (text, created_at)
+        self.cursor = 0
+        self.lock = threading.Lock()
+        self.last_activity = time.monotonic()
+        self.stats = {"pool_hits": 0, "live_generations": 0, "short_circuits": 0,
+                      "generated": 0, "generation_failures": 0}
+        self.vocabulary = self._load_vocabulary()
+        # DOMAIN_WORDS alone is far too small to call anything off-topic
+        self.short_circuit = config.REJECTION_SHORT_CIRCUIT and self.vocabulary is not None
+        if config.REJECTION_SHORT_CIRCUIT and not self.short_circuit:
+            print("[Sensei] No glossary loaded; off-topic short-circuit disabled.")
+
+        self._stop = threading.Event()
+        self._refresher = None
+        if config.REJECTION_MODE == "pool":
+            self._refresher = threading.Thread(target=self._refresh_loop, name="rejection-pool", daemon=True)
+            self._refresher.start()
+
+    @staticmethod
+    def _terms(text):
+        """Tokens with plurals folded ("stops" -> "stop"), for both sides of the check."""
+        return [fold_plural(t) for t in tokenize(text)]
+
+    @classmethod
+    def _load_vocabulary(cls):
+        """DOMAIN_WORDS + glossary term tokens, or None if the glossary can't be read."""
+        vocabulary = {fold_plural(w) for w in DOMAIN_WORDS}
+        try:
+            with open(config.GLOSSARY_PATH, "r", encoding="utf-8") as f:
+                for term in json.load(f):
+                    vocabulary.update(cls._terms(term))
+        except (OSError, ValueError):
+            return None
+        return vocabulary
+
+    def touch(self):
+        """Marks the server as busy; the refresher only generates while idle."""
+        self.last_activity = time.monotonic()
+
+    def is_off_topic(self, query) -> bool:
+        if not self.short_circuit:
+            return False
+        tokens = self._terms(query)
+        # Too short to judge ("hi", "ok?") - let the normal pipeline decide
+        if len(tokens) < config.REJECTION_MIN_TOKENS:
+            return False
+        if any(t in self.vocabulary for t in tokens):
+            return False
+        with self.lock:
+            self.stats["short_circuits"] += 1
+        metrics.REJECTIONS.inc(path="short_circuit")
+        return True
+
+    def take(self):
+        with self.lock:
+            if not self.lines:
+                return None
+            self.cursor = (self.cursor + 1) % len(self.lines)
+            self.stats["pool_hits"] += 1
+            line = self.lines[self.cursor][0]
+        metrics.REJECTIONS.inc(path="pool")
+        return line
+
+    def record_live(self):
+        with self.lock:
+            self.stats["live_generations"] += 1
+        metrics.REJECTIONS.inc(path="live")
+
+    def _needs_refresh(self):
+        with self.lock:
+            generated = [created for _, created in self.lines if created]
+            if len(generated) < self.size:
+                return True
+            return time.time() - min(generated) > config.REJECTION_MAX_AGE_SECONDS
+
+    def _refresh_loop(self):
+        while not self._stop.wait(config.REJECTION_REFRESH_SECONDS):
+            if time.monotonic() - self.last_activity < config.REJECTION_IDLE_SECONDS:
+                continue
+            if not self._needs_refresh():
+                continue
+            self.refresh_one()
+
+    def refresh_one(self):
+        """Generates one new rejection and pushes out the oldest line."""
+        with self.lock:
+            recent = [line for line, _ in list(self.lines)[-3:]]
+        try:
+            line = self.generate_fn(recent)
+        except Exception as e:
+            line = None
+            print(f"[Sensei] Rejection pool refresh failed: {e}")
+        with self.lock:
+            if not line:
+                self.stats["generation_failures"] += 1
+                return False
+            self.lines.append((line, time.time()))
+            self.stats["generated"] += 1
+        return True
+
+    def get_stats(self):
+        with self.lock:
+            served = self.stats["pool_hits"] + self.stats["live_generations"]
+            return {
+                **self.stats,
+                "mode": config.REJECTION_MODE,
+                "short_circuit": self.short_circuit,
+                "pool_size": len(self.lines),
+                "pool_hit_rate": round(self.stats["pool_hits"] / served, 4) if served else 0.0,
+            }
+
+    def close(self):
+        self._stop.set()
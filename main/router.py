@@ -1,58 +1,305 @@
 import json
-from groq import Groq
+import re
+import threading
+import time
+import numpy as np
 import config  # Import settings from config.py
+import encoders
+from cache import TTLCache, MISS, normalize_query
+from keywords import KeywordMatcher
+import metrics
+import prompts
 
 class SemanticRouter:
-    def __init__(self):
-        self.client = Groq(api_key=config.GROQ_API_KEY)
-        
-        # Load glossary keys only (we don't need definitions for routing)
+    def __init__(self, mode=config.ROUTER_MODE):
+        self.mode = mode
+
+        # Load glossary with definitions (the local router embeds both)
         try:
             with open(config.GLOSSARY_PATH, 'r', encoding='utf-8') as f:
-                self.valid_tags = list(json.load(f).keys())
+                self.glossary = json.load(f)
         except FileNotFoundError:
             print(f"Warning: {config.GLOSSARY_PATH} not found. Router has no tags.")
-            self.valid_tags = []
+            self.glossary = {}
+        self.valid_tags = list(self.glossary.keys())
+        self.tag_lookup = {normalize_query(t): t for t in self.valid_tags}  # LLM replies are matched loosely
+
+        # Fast path: queries that name a glossary term are routed without embeddings or LLM calls
+        self.matcher = KeywordMatcher(self.valid_tags, config.ROUTER_FUZZY_MIN_LENGTH, config.ROUTER_AMBIGUOUS_TERMS) if config.ROUTER_FAST_PATH and self.valid_tags else None
+
+        # Groq is only needed for "llm" mode or as a low-confidence fallback
+        self.client = None
+        if self.mode == "llm" or config.ROUTER_LLM_FALLBACK:
+            from groq import Groq
+            self.client = Groq(api_key=config.GROQ_API_KEY)
+
+        self.stats_lock = threading.Lock()
+        self.path_stats = {}  # path -> {"count", "seconds"}
+        self.llm_stats = {"invalid_replies": 0, "unknown_tags_dropped": 0, "retries": 0}
+        # Built once: an identical prefix on every call is what lets Groq's prompt cache hit
+        self.system_prompt = prompts.router_system_prompt(self.valid_tags)
+        self.cache = TTLCache("router_tags", config.ROUTER_CACHE_SIZE, config.CACHE_TTL_SECONDS)
+
+        if self.mode == "local" and self.valid_tags:
+            self._build_tag_index()
+
+    def _build_tag_index(self):
+        """
+        Precomputes normalised embeddings for every tag, once as the bare term
+        and once as "term: definition". A query scores against a tag by the
+        better of the two, so both short keyword queries and descriptive
+        questions land on the right tag.
+        """
+        print(f"[Router] Embedding {len(self.valid_tags)} glossary tags...")
+        self.name_embeddings = encoders.encode(self.valid_tags)
+        self.definition_embeddings = encoders.encode(
+            [f"{tag}: {self.glossary[tag]}" for tag in self.valid_tags]
+        )
 
     def get_relevant_tags(self, user_query: str) -> list:
         """
         Input: "I keep losing money, help!"
         Output: ["risk management", "psychology"]
-        """ 
+        """
         if not self.valid_tags:
             return []
 
-        # Construct Prompt
-        glossary_string = ", ".join(self.valid_tags)
-        
-        system_prompt = (
-            "You are a strict query classifier. "
-            "Your job is to map the USER QUERY to the most relevant tags from the GLOSSARY list.\n"
-            f"GLOSSARY: {glossary_string}\n\n"
-            "RULES:\n"
-            "1. Return ONLY a JSON list of strings (e.g. [\"tag1\", \"tag2\"]).\n"
-            "2. Use ONLY tags from the glossary.\n"
-            "3. If unrelated, return []."
-        )
+        cache_key = normalize_query(user_query)
+        cached = self.cache.get(cache_key)
+        if cached is not MISS:
+            self._observe("cache", 0.0)
+            return list(cached)
+
+        with metrics.timed("route"):
+            tags = self._route(user_query)
+        if tags is None:
+            return []  # LLM error: don't cache it
+        self.cache.set(cache_key, tuple(tags))
+        return tags
+
+    def get_relevant_tags_batch(self, queries: list) -> list:
+        """
+        get_relevant_tags() for many queries. In local mode every cache miss is
+        embedded in one forward pass and scored in one matrix product.
+        """
+        if not self.valid_tags:
+            return [[] for _ in queries]
+
+        keys = [normalize_query(q) for q in queries]
+        decided = {}
+        pending = {}
+        for key, query in zip(keys, queries):
+            if key in decided or key in pending:
+                continue
+            cached = self.cache.get(key)
+            if cached is not MISS:
+                self._observe("cache", 0.0)
+                decided[key] = list(cached)
+            else:
+                pending[key] = query
+
+        if pending:
+            with metrics.timed("route"):
+                routed = self._route_batch(list(pending.values()))
+            for key, tags in zip(pending, routed):
+                if tags is None:
+                    decided[key] = []  # LLM error: don't cache it
+                    continue
+                self.cache.set(key, tuple(tags))
+                decided[key] = tags
+
+        return [list(decided[key]) for key in keys]
+
+    def _route_batch(self, queries: list) -> list:
+        """Keyword fast path per query; the rest share one embedding pass (local mode)."""
+        routed = [None] * len(queries)
+        rest = []
+        for i, query in enumerate(queries):
+            start = time.perf_counter()
+            fast = self._match_keywords(query)
+            if fast is None:
+                rest.append(i)
+                continue
+            routed[i] = fast[0]
+            self._observe(fast[1], time.perf_counter() - start)
+
+        if rest and self.mode == "local":
+            start = time.perf_counter()
+            decisions = self._route_local_batch([queries[i] for i in rest])
+            per_query = (time.perf_counter() - start) / len(rest)
+            for i, (tags, path) in zip(rest, decisions):
+                routed[i] = tags
+                self._observe(path, per_query)
+        else:
+            for i in rest:
+                routed[i] = self._route(queries[i])
+        return routed
+
+    def _route_local_batch(self, queries: list) -> list:
+        query_vecs = np.stack(encoders.encode_queries(queries))
+        sims = np.maximum(self.name_embeddings @ query_vecs.T, self.definition_embeddings @ query_vecs.T)
+
+        decisions = []
+        for query, column in zip(queries, sims.T):
+            tags, best_score = self._tags_from_scores(column)
+            if self.client and best_score < config.ROUTER_FALLBACK_THRESHOLD:
+                llm_tags = self._route_with_llm(query)
+                decisions.append((tags if llm_tags is None else llm_tags, "llm_fallback"))
+                continue
+            decisions.append((tags, "local"))
+        return decisions
+
+    def _route(self, user_query: str) -> list:
+        start = time.perf_counter()
+        tags, path = self._decide(user_query)
+        self._observe(path, time.perf_counter() - start)
+        return tags
 
+    def _decide(self, user_query: str):
+        """(tags, path). tags is None only when the LLM was the last resort and failed."""
+        fast = self._match_keywords(user_query)
+        if fast is not None:
+            return fast
+
+        if self.mode == "llm":
+            return self._route_with_llm(user_query), "llm"
+
+        tags, best_score = self._route_locally(user_query)
+
+        # Low confidence: optionally let the LLM have a go (keeping the local answer if it fails)
+        if self.client and best_score < config.ROUTER_FALLBACK_THRESHOLD:
+            llm_tags = self._route_with_llm(user_query)
+            return (tags if llm_tags is None else llm_tags), "llm_fallback"
+
+        return tags, "local"
+
+    def _match_keywords(self, user_query: str):
+        """(tags, "keyword" | "keyword_fuzzy"), or None when no glossary term is named."""
+        if self.matcher is None:
+            return None
+        tags, fuzzy = self.matcher.match(user_query)
+        if not tags:
+            return None
+        return tags[:config.ROUTER_TOP_K], "keyword_fuzzy" if fuzzy else "keyword"
+
+    def _observe(self, path, seconds):
+        metrics.ROUTER_DECISIONS.inc(path=path)
+        metrics.ROUTER_PATH_SECONDS.observe(seconds, path=path)
+        with self.stats_lock:
+            entry = self.path_stats.setdefault(path, {"count": 0, "seconds": 0.0})
+            entry["count"] += 1
+            entry["seconds"] += seconds
+
+    def get_stats(self):
+        with self.stats_lock:
+            total = sum(e["count"] for e in self.path_stats.values())
+            paths = {
+                path: {
+                    "count": e["count"],
+                    "share": round(e["count"] / total, 4) if total else 0.0,
+                    "avg_ms": round(e["seconds"] / e["count"] * 1000, 3) if e["count"] else 0.0,
+                }
+                for path, e in self.path_stats.items()
+            }
+            return {"mode": self.mode, "fast_path": self.matcher is not None,
+                    "paths": paths, "llm": dict(self.llm_stats)}
+
+    def _route_locally(self, user_query: str):
+        """
+        Cosine similarity against every tag in one matrix-vector product.
+        Returns (tags above threshold, best similarity).
+        """
+        query_vec = encoders.encode_query(user_query)
+        sims = np.maximum(self.name_embeddings @ query_vec, self.definition_embeddings @ query_vec)
+        return self._tags_from_scores(sims)
+
+    def _tags_from_scores(self, sims):
+        """Top-k tags above ROUTER_SIM_THRESHOLD for one query's score vector."""
+        k = min(config.ROUTER_TOP_K, len(sims))
+        top_idx = np.argpartition(-sims, k - 1)[:k]
+        top_idx = top_idx[np.argsort(-sims[top_idx])]
+
+        tags = [self.valid_tags[i] for i in top_idx if sims[i] >= config.ROUTER_SIM_THRESHOLD]
+        return tags, float(sims[top_idx[0]])
+
+    def _route_with_llm(self, user_query: str):
+        """
+        Returns a list of valid tags, or None if the call failed or the model
+        twice returned something that isn't a tag list.
+        """
+        kwargs = {}
+        if config.ROUTER_LLM_JSON_MODE:
+            kwargs["response_format"] = {"type": "json_object"}
+
+        for attempt in range(2):
+            try:
+                completion = self.client.chat.completions.create(
+                    messages=[
+                        {"role": "system", "content": self.system_prompt},
+                        {"role": "user", "content": f"USER QUERY: {user_query}"}
+                    ],
+                    model=config.ROUTER_LLM_MODEL_NAME,
+                    temperature=0.0,
+                    **kwargs
+                )
+            except Exception as e:
+                print(f"Router Error: {e}")
+                return None
+            self._record_usage(completion)
+
+            tags = self._validate_tags(completion.choices[0].message.content)
+            if tags is not None:
+                return tags
+            with self.stats_lock:
+                self.llm_stats["invalid_replies"] += 1
+                if attempt == 0:
+                    self.llm_stats["retries"] += 1
+        print(f"Router Error: no valid tag list for {user_query!r}")
+        return None
+
+    def _validate_tags(self, response):
+        """
+        Parses {"tags": [...]} (or a bare list) and keeps only glossary tags,
+        matched case / punctuation insensitively. None if it isn't a tag list.
+        """
+        response = (response or "").strip()
+        if "```" in response:
+            response = response.replace("```json", "").replace("```", "").strip()
         try:
-            completion = self.client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"USER QUERY: {user_query}"}
-                ],
-                model=config.ROUTER_LLM_MODEL_NAME,
-                temperature=0.0,
-            )
-
-            response = completion.choices[0].message.content.strip()
-            
-            # Basic cleanup if the model chats too much
-            if "```" in response:
-                response = response.replace("```json", "").replace("```", "")
-            
-            return json.loads(response)
-
-        except Exception as e:
-            print(f"Router Error: {e}")
-            return []
\ No newline at end of file
+            parsed = json.loads(response)
+        except ValueError:
+            # Chatty model: take the first JSON object / list in the reply
+            found = re.search(r"\{.*\}|\[.*\]", response, re.DOTALL)
+            if not found:
+                return None
+            try:
+                parsed = json.loads(found.group(0))
+            except ValueError:
+                return None
+
+        if isinstance(parsed, dict):
+            parsed = parsed.get("tags")
+        if not isinstance(parsed, list):
+            return None
+
+        tags, dropped = [], 0
+        for item in parsed:
+            tag = self.tag_lookup.get(normalize_query(item)) if isinstance(item, str) else None
+            if tag is None:
+                dropped += 1
+            elif tag not in tags:
+                tags.append(tag)
+        if dropped:
+            with self.stats_lock:
+                self.llm_stats["unknown_tags_dropped"] += dropped
+        return tags[:config.ROUTER_TOP_K]
+
+    @staticmethod
+    def _record_usage(completion):
+        """Groq reports prefix-cache hits in usage.prompt_tokens_details.cached_tokens."""
+        usage = getattr(completion, "usage", None)
+        if not usage:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details else None
+        prompts.USAGE.record("router", getattr(usage, "prompt_tokens", 0), cached)
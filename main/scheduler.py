@@ -0,0 +1,170 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+import config
+import metrics
+from cache import normalize_query
+
+_STREAM_END = object()
+
+
+def request_key(kind, user_id, query, user_state=None) -> tuple:
+    """Two requests with the same key produce the same answer and can share one execution."""
+    state = json.dumps(user_state, sort_keys=True, default=str) if user_state is not None else ""
+    return (kind, user_id, normalize_query(query), state)
+
+
+class _SharedStream:
+    """Items of one running stream, replayable from the start by every subscriber."""
+
+    def __init__(self):
+        self.items = []
+        self.changed = asyncio.Event()
+        self.task = None
+        self.error = None
+        self.subscribers = 0
+        self.abandoned = False  # Every subscriber left; the task is being cancelled
+
+    def push(self, item):
+        self.items.append(item)
+        self.changed.set()
+
+    async def subscribe(self):
+        i = 0
+        while True:
+            while i < len(self.items):
+                item = self.items[i]
+                i += 1
+                if item is _STREAM_END:
+                    return
+                yield item
+            self.changed.clear()
+            await self.changed.wait()
+
+
+class UserScheduler:
+    """
+    Per-user ordering and de-duplication of chat turns.
+
+    - Turns for one user_id run one at a time, in arrival order, so history
+      reads and appends never interleave. Different users run in parallel.
+    - A request identical to one already queued or running for the same
+      user (double-submit, client retry) doesn't get a turn of its own: it
+      waits for the first one and gets the same result (or stream).
+    - The shared execution is shielded: if the first caller disconnects,
+      the others still get their answer. A stream nobody reads any more is
+      cancelled, so it stops holding a Gemini key and an I/O worker.
+
+    Only touched from the event loop, so no thread locks. With several
+    workers, locks.UserLocks does the cross-process part.
+    """
+
+    def __init__(self, coalesce=config.SCHEDULER_COALESCE):
+        self.coalesce = coalesce
+        self.user_locks = {}  # user_id -> [asyncio.Lock, waiting + running turns]
+        self.inflight = {}  # request key -> Task (unary) or _SharedStream
+        self.stats = {"executions": 0, "coalesced": 0, "queued": 0, "max_queue_depth": 0}
+
+    @asynccontextmanager
+    async def hold(self, user_id):
+        """The user's turn slot. Entries are dropped once nobody holds or waits for them."""
+        entry = self.user_locks.get(user_id)
+        if entry is None:
+            entry = self.user_locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        if entry[1] > 1:
+            self.stats["queued"] += 1
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], entry[1])
+        try:
+            with metrics.timed("user_queue"):
+                await entry[0].acquire()
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self.user_locks.pop(user_id, None)
+
+    async def run(self, user_id, key, fn):
+        """
+        Awaits fn() (a coroutine function) in the user's turn slot, or joins
+        an identical in-flight call.
+        """
+        task = self.inflight.get(key) if self.coalesce else None
+        if task is not None:
+            self.stats["coalesced"] += 1
+            metrics.SCHEDULER_EVENTS.inc(event="coalesced")
+            return await asyncio.shield(task)
+
+        async def execute():
+            async with self.hold(user_id):
+                return await fn()
+
+        self.stats["executions"] += 1
+        metrics.SCHEDULER_EVENTS.inc(event="executed")
+        task = asyncio.ensure_future(execute())
+        if self.coalesce:
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+        return await asyncio.shield(task)
+
+    async def stream(self, user_id, key, gen_fn):
+        """
+        Streaming version of run(): gen_fn() is an async generator function.
+        Joiners get every item from the start, then the live tail.
+        """
+        shared = self.inflight.get(key) if self.coalesce else None
+        if shared is not None and shared.abandoned:
+            shared = None  # Being cancelled: start over rather than join a cut-off stream
+        if shared is not None:
+            self.stats["coalesced"] += 1
+            metrics.SCHEDULER_EVENTS.inc(event="coalesced")
+        else:
+            shared = _SharedStream()
+
+            async def drive():
+                try:
+                    async with self.hold(user_id):
+                        async for item in gen_fn():
+                            shared.push(item)
+                except Exception as e:
+                    shared.error = e
+                finally:
+                    shared.push(_STREAM_END)
+
+            self.stats["executions"] += 1
+            metrics.SCHEDULER_EVENTS.inc(event="executed")
+            shared.task = asyncio.ensure_future(drive())
+            if self.coalesce:
+                self.inflight[key] = shared
+                shared.task.add_done_callback(lambda _: self._forget(key, shared))
+
+        shared.subscribers += 1
+        finished = False
+        try:
+            async for item in shared.subscribe():
+                yield item
+            finished = True
+        finally:
+            shared.subscribers -= 1
+            if not finished and not shared.subscribers and not shared.task.done():
+                # Every client has gone (disconnect): stop generating
+                shared.abandoned = True
+                shared.task.cancel()
+        # Surface a failure of the shared execution to every subscriber
+        if shared.error is not None:
+            raise shared.error
+
+    def _forget(self, key, entry):
+        if self.inflight.get(key) is entry:
+            del self.inflight[key]
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            "active_users": len(self.user_locks),
+            "inflight": len(self.inflight),
+            "coalesce": self.coalesce,
+        }
@@ -22,17 +22,29 @@ logging.getLogger("huggingface_hub").setLevel(logging.ERROR)
 logging.getLogger("chromadb").setLevel(logging.ERROR)
 
 import uvicorn
+import asyncio
 import time
 import json
+import weakref
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 
-# Internal modules
-from router import SemanticRouter
-from rag import RAGPipeline
-from brain import SenseiBrain
+# Internal modules (router / RAG / brain are imported lazily by the startup manager)
+from startup import StartupManager
+from pipeline import ChatPipeline, brain_state, student_chapters
+from executor import PipelineExecutor, QueueFullError
+from ratelimit import KeysUnavailableError, GenerationError
+from locks import UserLockTimeout
+from scheduler import UserScheduler, request_key
+from profile_store import UserProfileStore
+from cache import cache_stats
+from batcher import batcher_stats
+import metrics
+import prompts
 import config
 
 #  LOGGING SETUP 
@@ -54,51 +66,65 @@ class ChatRequest(BaseModel):
     user_id: str = Field(..., json_schema_extra={"example": "user_123"})
     query: str = Field(..., json_schema_extra={"example": "I keep losing money on gold trades."})
     user_state: UserState
+    debug_timings: bool = False # Opt-in per-stage latency breakdown in the response
 
 class ChatResponse(BaseModel):
     answer: str
     sources: List[str] = []
     context: Optional[Dict[str, Any]] = None 
     latency_ms: float = 0.0
+    breakdown: Optional[Dict[str, float]] = None # Stage -> ms, only if debug_timings
+
+class BatchChatRequest(BaseModel):
+    requests: List[ChatRequest]
+    debug_timings: bool = False
+
+class BatchItemResult(BaseModel):
+    index: int
+    answer: Optional[str] = None
+    sources: List[str] = []
+    context: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None # Set instead of answer when this item failed
+
+class BatchChatResponse(BaseModel):
+    results: List[BatchItemResult]
+    latency_ms: float = 0.0
+    breakdown: Optional[Dict[str, float]] = None
 
 #  GLOBAL STATE 
 ml_models = {}
+startup = None
 
 #  LIFESPAN MANAGER 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Handles the startup and shutdown logic for the application.
-    Initializes heavy ML models once to ensure performance.
+    Cheap services start inline; the heavy ML models load in the background
+    (see StartupManager) so /health and /ready answer immediately.
     """
+    global startup
     logger.info("Initializing application services...")
     
     try:
 
         # 1. Load User Database
         print("   1. Loading User Database...", end=" ", flush=True)
-        if os.path.exists(config.USERS_DB_PATH):
-            with open(config.USERS_DB_PATH, "r", encoding="utf-8") as f:
-                global users_db
-                users_db = json.load(f)
-            print(f"Done ({len(users_db)} users loaded)")
+        ml_models["profiles"] = UserProfileStore()
+        if len(ml_models["profiles"]):
+            print(f"Done ({len(ml_models['profiles'])} users loaded, durability={config.PROFILE_DURABILITY})")
         else:
-            print(f"Warning: {config.USERS_DB_PATH} not found. No users can log in.")
-            users_db = {}
+            print(f"Warning: no users found ({config.USERS_DB_PATH}). No users can log in.")
 
-        # 2. Initialize Router
-        ml_models["router"] = SemanticRouter()
-        logger.info("Semantic Router initialized successfully.")
-        
-        # 3. Initialize RAG Engine
-        ml_models["rag"] = RAGPipeline()
-        logger.info("RAG Engine (ChromaDB + Cross-Encoder) initialized successfully.")
-        
-        # 4. Initialize Brain
-        ml_models["brain"] = SenseiBrain()
-        logger.info("LLM Brain initialized successfully.")
-        
-        logger.info("System is ready to accept requests.")
+        # 2. Worker pools (keeps blocking stages off the event loop)
+        ml_models["executor"] = PipelineExecutor()
+        ml_models["scheduler"] = UserScheduler()
+        logger.info(f"Executor ready: {ml_models['executor'].stats()}")
+
+        # 3. Router, RAG Engine and Brain: parallel load + warmup in the background
+        startup = StartupManager(ml_models)
+        startup.start()
+        logger.info("Loading models in the background. Watch /ready.")
         yield
         
     except Exception as e:
@@ -106,72 +132,205 @@ async def lifespan(app: FastAPI):
         raise e
     finally:
         # Shutdown logic
+        if startup:
+            await startup.stop()
+        if "brain" in ml_models:
+            ml_models["brain"].rejections.close()
+        if "executor" in ml_models:
+            ml_models["executor"].shutdown()
+        if "profiles" in ml_models:
+            ml_models["profiles"].close()  # Final flush of dirty profiles
         ml_models.clear()
         logger.info("Application shutdown complete.")
 
 #  APP INITIALIZATION 
 app = FastAPI(title="Trading Assistant API", lifespan=lifespan)
 
-#  ENDPOINTS 
-@app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
-    start_time = time.time()
-    
-    # 1. VALIDATION: Check if user exists
-    if request.user_id not in users_db:
+#  METRICS 
+# Scrape-time values pulled from the components loaded in lifespan()
+metrics.Gauge(
+    "sensei_queue_depth", "Requests admitted and not yet finished",
+    fn=lambda: ml_models["executor"].pending
+)
+metrics.register_collector(metrics.dict_collector("cache", "cache", cache_stats))
+metrics.register_collector(metrics.dict_collector("batcher", "batcher", batcher_stats))
+metrics.register_collector(metrics.dict_collector(
+    "startup", "phase",
+    lambda: {phase: {"seconds": s} for phase, s in startup.phases.items()}
+))
+metrics.register_collector(metrics.dict_collector(
+    "gemini_key", "key",
+    lambda: {str(k["key"]): k for k in ml_models["brain"].client.stats()}
+))
+
+#  PIPELINE HELPERS 
+def _require_ready():
+    if startup is None or not startup.ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Sensei is still starting up. Please retry shortly.",
+            headers={"Retry-After": str(config.RETRY_AFTER_SECONDS)}
+        )
+
+async def _require_registered(request: ChatRequest):
+    profiles = ml_models["profiles"]
+    if profiles.exists(request.user_id):
+        return
+    # Maybe another worker just registered them (backend read at most once per PROFILE_REFRESH_SECONDS)
+    await ml_models["executor"].run_io(profiles.refresh_if_stale)
+    if not profiles.exists(request.user_id):
         logger.warning(f"Unauthorized access attempt: {request.user_id}")
         raise HTTPException(
             status_code=403, 
             detail=f"User '{request.user_id}' not registered in Sensei DB."
         )
 
+def _keys_unavailable_response(request: ChatRequest, error: KeysUnavailableError):
+    logger.warning(f"No Gemini key for {request.user_id}: {error}")
+    return HTTPException(
+        status_code=503,
+        detail="Sensei's model quota is exhausted. Please retry shortly.",
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+def _generation_failed_response(request: ChatRequest, error: GenerationError):
+    logger.error(f"Gemini rejected the turn for {request.user_id}: {error}")
+    return HTTPException(status_code=502, detail="Sensei could not produce an answer. Please try again.")
+
+def _busy_response(request: ChatRequest, error: Exception):
+    logger.warning(f"Rejecting request from {request.user_id}: {error}")
+    return HTTPException(
+        status_code=503,
+        detail="Sensei is busy. Please retry shortly.",
+        headers={"Retry-After": str(config.RETRY_AFTER_SECONDS)}
+    )
+
+async def _sync_profile(request: ChatRequest, executor: PipelineExecutor):
+    """
+    STATE UPDATE (New Feature!)
+    We compare the incoming payload with our DB. If it's newer/different, we update our DB.
+    This allows the Frontend to say "I finished a chapter!" and the Backend remembers it.
+    Returns the brain-ready state dict.
+    """
+    incoming_state = request.user_state
+    profiles = ml_models["profiles"]
+    
+    # In a real app, you'd have more complex logic here, but for Hackathon, trust the frontend.
+    # The store skips unchanged profiles and batches the rest into periodic flushes.
+    real_profile = {
+        "current_chapter": incoming_state.current_chapter,
+        "finished_chapters": incoming_state.finished_chapters,
+        "unfinished_chapters": incoming_state.unfinished_chapters,
+        "win_rate": incoming_state.win_rate
+    }
+    with metrics.timed("profile_write"):
+        if profiles.durability == "sync":
+            await executor.run_io(profiles.update, request.user_id, real_profile)
+        else:
+            profiles.update(request.user_id, real_profile)
+
+    return brain_state(real_profile)
+
+async def _route_and_retrieve(query: str, executor: PipelineExecutor, chapters=None):
+    """
+    ROUTING & RAG. Returns (tags, context_data).
+    In speculative mode the unfiltered over-fetch runs while the router works,
+    so retrieval mostly costs max(route, search) instead of route + search.
+    With a precomputed candidate index the routed search doesn't touch Chroma,
+    so there is nothing to overlap and we route first.
+    `chapters` (current + upcoming) scope untagged queries, see RAGPipeline.search.
+    """
+    # Obviously off-topic: nothing to find in the KB, the brain answers from its rejection pool
+    if ml_models["brain"].rejections.is_off_topic(query):
+        return [], None
+
+    router = ml_models["router"]
+    rag = ml_models["rag"]
+
+    # Local router + retrieval/rerank are CPU work -> CPU pool. The Groq router is I/O.
+    run_router = executor.run_cpu if config.ROUTER_MODE == "local" else executor.run_io
+
+    if config.PIPELINE_MODE != "speculative" or rag.candidate_index is not None:
+        tags = await run_router(router.get_relevant_tags, query)
+        context_data = await executor.run_cpu(rag.search, query, tags=tags, chapters=chapters)
+        return tags, context_data
+
+    prefetch_task = asyncio.ensure_future(executor.run_cpu(rag.prefetch, query))
+    try:
+        tags = await run_router(router.get_relevant_tags, query)
+    except Exception:
+        prefetch_task.cancel()
+        raise
+    try:
+        prefetched = await prefetch_task
+    except Exception as e:
+        logger.warning(f"Speculative prefetch failed, using filtered query: {e}")
+        prefetched = None
+    context_data = await executor.run_cpu(rag.search, query, tags=tags, prefetched=prefetched, chapters=chapters)
+    return tags, context_data
+
+def _student_chapters(request: ChatRequest) -> list:
+    """The chapters an untagged question most likely belongs to (same as /chat/batch)."""
+    return student_chapters(request.user_state.model_dump())
+
+def _request_key(kind: str, request: ChatRequest) -> tuple:
+    return request_key(kind, request.user_id, request.query, request.user_state.model_dump())
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+#  ENDPOINTS 
+@app.post("/chat", response_model=ChatResponse)
+async def chat_endpoint(request: ChatRequest):
+    start_time = time.time()
+    
+    # 1. VALIDATION: Models loaded? User exists?
+    _require_ready()
+    await _require_registered(request)
+
+    # 2. ADMISSION CONTROL
+    # If too many requests are already in flight, shed load now instead of queueing forever.
+    executor = ml_models["executor"]
+    scheduler = ml_models["scheduler"]
+    try:
+        async with executor.admit():
+            # One turn at a time per student; a double-submit shares the first one's answer
+            response = await scheduler.run(
+                request.user_id, _request_key("chat", request),
+                lambda: _run_chat_pipeline(request, executor, start_time)
+            )
+    except (QueueFullError, UserLockTimeout) as e:
+        metrics.REQUESTS.inc(endpoint="/chat", status="rejected")
+        raise _busy_response(request, e)
+    except KeysUnavailableError as e:
+        metrics.REQUESTS.inc(endpoint="/chat", status="unavailable")
+        raise _keys_unavailable_response(request, e)
+    except GenerationError as e:
+        metrics.REQUESTS.inc(endpoint="/chat", status="error")
+        raise _generation_failed_response(request, e)
+    except HTTPException:
+        metrics.REQUESTS.inc(endpoint="/chat", status="error")
+        raise
+
+    metrics.REQUESTS.inc(endpoint="/chat", status="ok")
+    metrics.REQUEST_SECONDS.observe(time.time() - start_time, endpoint="/chat")
+    return response
+
+async def _run_chat_pipeline(request: ChatRequest, executor: PipelineExecutor, start_time: float):
     print(f"📩 [{request.user_id}] Query: {request.query}")
+    breakdown = metrics.start_request_breakdown()
     
     try:
-        # 2. STATE UPDATE (New Feature!)
-        # We compare the incoming payload with our DB. If it's newer/different, we update our DB.
-        # This allows the Frontend to say "I finished a chapter!" and the Backend remembers it.
-        
-        current_db_profile = users_db[request.user_id]
-        incoming_state = request.user_state
-        
-        # Check if we need to update the DB (Basic check)
-        # In a real app, you'd have more complex logic here, but for Hackathon, trust the frontend.
-        users_db[request.user_id] = {
-            "current_chapter": incoming_state.current_chapter,
-            "finished_chapters": incoming_state.finished_chapters,
-            "unfinished_chapters": incoming_state.unfinished_chapters,
-            "win_rate": incoming_state.win_rate
-        }
-        
-        # Save to JSON file immediately so it persists
-        with open(config.USERS_DB_PATH, "w", encoding="utf-8") as f:
-            json.dump(users_db, f, indent=2)
-            
-        # Use this NEW updated profile for the Brain
-        real_profile = users_db[request.user_id]
-
-        # 3. ROUTING & RAG
-        router = ml_models["router"]
-        rag = ml_models["rag"]
-        brain = ml_models["brain"]
+        # 3. STATE UPDATE
+        state_dict = await _sync_profile(request, executor)
 
-        tags = router.get_relevant_tags(request.query)
-        context_data = rag.search(request.query, tags=tags)
-        
-        # 4. GENERATION
-        state_dict = {
-            "learning_progress": {
-                "current_chapter": real_profile["current_chapter"],
-                "finished_chapters": real_profile["finished_chapters"],
-                "unfinished_chapters": real_profile["unfinished_chapters"]
-            },
-            "trade_metrics": {
-                "win_rate": real_profile["win_rate"]
-            }
-        }
+        # 4. ROUTING & RAG
+        tags, context_data = await _route_and_retrieve(request.query, executor, _student_chapters(request))
         
-        response_text = brain.generate_response(
+        # 5. GENERATION
+        brain = ml_models["brain"]
+        response_text = await executor.run_io(
+            brain.generate_response,
             user_id=request.user_id,
             user_query=request.query,
             rag_context=context_data,
@@ -184,17 +343,259 @@ async def chat_endpoint(request: ChatRequest):
             answer=response_text,
             sources=tags if tags else ["General Logic"],
             latency_ms=round(latency, 2),
-            context=context_data
+            context=context_data,
+            breakdown=breakdown if request.debug_timings else None
         )
 
+    except (KeysUnavailableError, GenerationError, UserLockTimeout):
+        raise
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
+@app.post("/chat/batch", response_model=BatchChatResponse)
+async def chat_batch_endpoint(batch: BatchChatRequest):
+    """
+    Many ChatRequests in one call (evaluation runs, bulk tutoring jobs).
+    Routed, embedded and reranked together; Gemini calls run with bounded
+    concurrency. Results are in request order with per-item errors.
+    """
+    start_time = time.time()
+    _require_ready()
+    if len(batch.requests) > config.BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(batch.requests)} > {config.BATCH_MAX_SIZE} requests."
+        )
+
+    executor = ml_models["executor"]
+    print(f"📦 Batch of {len(batch.requests)} queries")
+    try:
+        async with executor.admit():
+            breakdown = metrics.start_request_breakdown()
+            items = [
+                {"user_id": r.user_id, "query": r.query, "user_state": r.user_state.model_dump()}
+                for r in batch.requests
+            ]
+            results = await ChatPipeline.from_components(ml_models).run_batch(items)
+    except QueueFullError as e:
+        metrics.REQUESTS.inc(endpoint="/chat/batch", status="rejected")
+        logger.warning(f"Rejecting batch: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Sensei is busy. Please retry shortly.",
+            headers={"Retry-After": str(config.RETRY_AFTER_SECONDS)}
+        )
+    except Exception as e:
+        metrics.REQUESTS.inc(endpoint="/chat/batch", status="error")
+        logger.error(f"Error processing batch: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+    latency = time.time() - start_time
+    metrics.REQUESTS.inc(endpoint="/chat/batch", status="ok")
+    metrics.REQUEST_SECONDS.observe(latency, endpoint="/chat/batch")
+    return BatchChatResponse(
+        results=[BatchItemResult(index=i, **r) for i, r in enumerate(results)],
+        latency_ms=round(latency * 1000, 2),
+        breakdown=breakdown if batch.debug_timings else None
+    )
+
+async def _chat_events(request: ChatRequest, executor: PipelineExecutor, start_time: float):
+    """The SSE events for one streamed turn (shared by identical in-flight requests)."""
+    breakdown = metrics.start_request_breakdown()
+    try:
+        state_dict = await _sync_profile(request, executor)
+        tags, context_data = await _route_and_retrieve(request.query, executor, _student_chapters(request))
+        yield _sse("tags", tags if tags else ["General Logic"])
+        yield _sse("context", context_data)
+
+        ttft = None
+        brain = ml_models["brain"]
+        async for chunk in executor.stream_io(
+            brain.generate_response_stream,
+            user_id=request.user_id,
+            user_query=request.query,
+            rag_context=context_data,
+            user_state=state_dict
+        ):
+            if ttft is None:
+                ttft = (time.time() - start_time) * 1000
+                metrics.STAGE_SECONDS.observe(ttft / 1000, stage="ttft")
+            yield _sse("token", {"text": chunk})
+
+        latency = (time.time() - start_time) * 1000
+        metrics.REQUESTS.inc(endpoint="/chat/stream", status="ok")
+        metrics.REQUEST_SECONDS.observe(latency / 1000, endpoint="/chat/stream")
+        logger.info(f"[{request.user_id}] Stream done: ttft={ttft or 0:.0f}ms total={latency:.0f}ms")
+        yield _sse("done", {
+            "latency_ms": round(latency, 2),
+            "ttft_ms": round(ttft, 2) if ttft is not None else None,
+            "breakdown": breakdown if request.debug_timings else None
+        })
+
+    except KeysUnavailableError as e:
+        # Headers are already out (tags / context came first), so the 503 travels in the event
+        logger.warning(f"No Gemini key for {request.user_id}: {e}")
+        metrics.REQUESTS.inc(endpoint="/chat/stream", status="unavailable")
+        yield _sse("error", {"detail": "Sensei's model quota is exhausted. Please retry shortly.",
+                             "status": 503, "retry_after": e.retry_after})
+    except GenerationError as e:
+        logger.error(f"Gemini rejected the turn for {request.user_id}: {e}")
+        metrics.REQUESTS.inc(endpoint="/chat/stream", status="error")
+        yield _sse("error", {"detail": "Sensei could not produce an answer. Please try again.", "status": 502})
+    except UserLockTimeout as e:
+        logger.warning(f"Rejecting stream from {request.user_id}: {e}")
+        metrics.REQUESTS.inc(endpoint="/chat/stream", status="rejected")
+        yield _sse("error", {"detail": "Sensei is busy. Please retry shortly.",
+                             "status": 503, "retry_after": config.RETRY_AFTER_SECONDS})
+    except Exception as e:
+        logger.error(f"Error processing stream: {str(e)}")
+        metrics.REQUESTS.inc(endpoint="/chat/stream", status="error")
+        yield _sse("error", {"detail": "Internal Server Error"})
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Server-Sent Events version of /chat. Event order:
+      tags    -> routed glossary tags
+      context -> the retrieved chunk (or null when out of scope)
+      token   -> one per Gemini chunk: {"text": "..."}
+      done    -> {"latency_ms", "ttft_ms"}   (or "error")
+    """
+    start_time = time.time()
+    _require_ready()
+    await _require_registered(request)
+
+    # The slot is held until the stream finishes, not just until we return.
+    # It is released exactly once: by the body when it ends, by the response's
+    # background task, or when the body is garbage-collected without ever
+    # running (client gone before the first byte; Starlette then skips both).
+    executor = ml_models["executor"]
+    try:
+        slot = executor.acquire()
+    except QueueFullError as e:
+        metrics.REQUESTS.inc(endpoint="/chat/stream", status="rejected")
+        raise _busy_response(request, e)
+    release_slot = slot.release
+
+    print(f"📩 [{request.user_id}] Stream query: {request.query}")
+    scheduler = ml_models["scheduler"]
+
+    async def event_stream():
+        try:
+            async for event in scheduler.stream(
+                request.user_id, _request_key("stream", request),
+                lambda: _chat_events(request, executor, start_time)
+            ):
+                yield event
+        except Exception as e:
+            logger.error(f"Error processing stream: {str(e)}")
+            yield _sse("error", {"detail": "Internal Server Error"})
+        finally:
+            release_slot()
+
+    try:
+        body = event_stream()
+        weakref.finalize(body, release_slot)
+        return StreamingResponse(
+            body,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            background=BackgroundTask(release_slot)
+        )
+    except BaseException:
+        release_slot()
+        raise
+
 @app.get("/health")
 async def health_check():
-    return {"status": "operational", "timestamp": time.time()}
+    """Liveness: the process is up and serving, even while models are still loading."""
+    state = startup.state if startup else "starting"
+    return {"status": "operational" if state == "ready" else state, "timestamp": time.time()}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 200 once every model is loaded and warmed up, 503 before that."""
+    if startup is None:
+        return JSONResponse(status_code=503, content={"state": "starting", "ready": False})
+    return JSONResponse(status_code=200 if startup.ready else 503, content=startup.status())
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus scrape endpoint: stage histograms, caches, key pool, queue depth, tokens."""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats/cache")
+async def cache_stats_endpoint():
+    """Hit / miss / eviction counters for every cache tier."""
+    return cache_stats()
+
+@app.get("/stats/batching")
+async def batching_stats_endpoint():
+    """Micro-batch sizes for the embedder and Cross-Encoder."""
+    return batcher_stats()
+
+@app.get("/stats/rerank")
+async def rerank_stats_endpoint():
+    """Adaptive rerank path counts and (in report mode) top-1 agreement + calibration fit."""
+    _require_ready()
+    return ml_models["rag"].rerank_report_stats()
+
+@app.get("/stats/prompts")
+async def prompt_stats_endpoint():
+    """Cached vs uncached input tokens per caller (answer / rejection / summary / router) and per recent call."""
+    return prompts.USAGE.get_stats()
+
+@app.get("/stats/rejections")
+async def rejection_stats_endpoint():
+    """Rejection pool hits vs live generations, background refreshes and off-topic short-circuits."""
+    _require_ready()
+    return ml_models["brain"].rejections.get_stats()
+
+@app.get("/stats/profiles")
+async def profile_stats_endpoint():
+    """Profile updates vs unchanged skips, flushes and pending dirty profiles."""
+    return ml_models["profiles"].get_stats()
+
+@app.get("/stats/gemini")
+async def gemini_stats_endpoint():
+    """Per-key in-flight load, utilization, cooldown and error counts."""
+    _require_ready()
+    return ml_models["brain"].client.stats()
+
+@app.get("/stats/memory")
+async def memory_stats_endpoint():
+    """Resident chat sessions, bytes per active user, LRU evictions and history-window token savings."""
+    _require_ready()
+    brain = ml_models["brain"]
+    return {"sessions": brain.sessions.memory_report(), "history_window": brain.history_window.get_stats()}
+
+@app.get("/stats/router")
+async def router_stats_endpoint():
+    """Share and average latency of each routing path, plus rejected / retried LLM replies."""
+    _require_ready()
+    return ml_models["router"].get_stats()
+
+@app.get("/stats/scheduler")
+async def scheduler_stats_endpoint():
+    """Per-user turn queueing: executions, coalesced duplicates, queue depth."""
+    return ml_models["scheduler"].get_stats()
+
+@app.get("/stats/workers")
+async def worker_stats_endpoint():
+    """This worker's pid and its share of the cross-worker per-user lock traffic."""
+    _require_ready()
+    return {"pid": os.getpid(), "workers": config.WORKERS,
+            "user_locks": ml_models["brain"].user_locks.get_stats()}
 
 #  ENTRY POINT 
+# Single worker (auto-reload):  python server_main.py
+# Several workers:              SENSEI_WORKERS=4 python server_main.py
+#                               SENSEI_WORKERS=4 uvicorn server_main:app --host 0.0.0.0 --port 8000 --workers 4
+# SENSEI_WORKERS must match --workers: it switches on the per-user locks and
+# profile sync between workers. Each worker loads its own copy of the models.
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    if config.WORKERS > 1:
+        uvicorn.run("server_main:app", host="0.0.0.0", port=8000, workers=config.WORKERS)
+    else:
+        uvicorn.run("server_main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
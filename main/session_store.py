@@ -0,0 +1,358 @@
+import json
+import os
+import sqlite3
+import threading
+import config
+from locks import file_lock
+
+
+class SessionStore:
+    """
+    Interface for chat history persistence.
+    A 'turn' is a dict: {"role": "user" | "model", "text": "..."}
+    """
+
+    def load(self, user_id) -> list:
+        raise NotImplementedError
+
+    def append(self, user_id, turns: list):
+        raise NotImplementedError
+
+    def user_ids(self) -> list:
+        raise NotImplementedError
+
+    def version(self, user_id) -> int:
+        """Changes whenever turns are appended for this user (by any worker)."""
+        raise NotImplementedError
+
+    def compact(self):
+        pass
+
+    def close(self):
+        pass
+
+    def import_legacy(self, path):
+        """One-off migration from the old whole-file chat_sessions.json."""
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except Exception as e:
+            print(f"[System] Could not import legacy history {path}: {e}")
+            return
+        for user_id, turns in legacy.items():
+            self.append(user_id, turns)
+        print(f"[System] Imported {len(legacy)} sessions from {path}.")
+
+
+class JsonlSessionStore(SessionStore):
+    """
+    Append-only log. Each line is:  <json user_id>\\t<json turn>\\n
+
+    - Appending a turn writes only that turn (O(turn size)).
+    - On startup we scan the file once and keep only byte offsets per user,
+      never the text itself. The user_id prefix means we don't need to
+      json-parse each turn just to build the index.
+    - A torn final line (crash mid-write, here or in another worker) is
+      truncated before the next append, so it never merges with a new record.
+    - Compaction only runs when it has something to drop: corrupt records,
+      or turns beyond SESSION_MAX_TURNS_PER_USER. It copies the live records
+      without holding the lock, then briefly takes it to copy what was
+      appended meanwhile and swap the file in.
+    - Several workers can share one log: writes hold an exclusive flock on
+      <path>.lock, and before each read or write the index catches up on
+      whatever the other workers appended (or is rebuilt after one of them
+      compacted the file).
+    """
+
+    def __init__(self, path=config.SESSION_LOG_PATH, compact_every=config.SESSION_COMPACT_EVERY,
+                 max_turns_per_user=config.SESSION_MAX_TURNS_PER_USER):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.compact_every = compact_every
+        self.max_turns_per_user = max_turns_per_user
+        self.lock = threading.RLock()
+        self.index = {}  # user_id -> [(offset, length), ...]
+        self.indexed_end = 0  # Bytes of the log covered by the index
+        self.dead_bytes = 0  # Bytes in the indexed range no record points to (corrupt lines)
+        self.inode = None
+        self.appends_since_compact = 0
+        self._compacting = False
+
+        with self.lock, file_lock(self.lock_path):
+            fresh = not os.path.exists(self.path)
+            self._rebuild_index(truncate=True)
+        print(f"[System] Session index ready ({len(self.index)} users).")
+        if fresh:
+            self.import_legacy(config.LEGACY_HISTORY_FILE)
+
+    def _rebuild_index(self, truncate=False):
+        self.index = {}
+        self.indexed_end = 0
+        self.dead_bytes = 0
+        if not os.path.exists(self.path):
+            open(self.path, "wb").close()
+        self.inode = os.stat(self.path).st_ino
+        self._scan_tail(truncate)
+
+    def _scan_tail(self, truncate=False):
+        """Indexes records from indexed_end to the end of the file."""
+        good_end = self.indexed_end
+        with open(self.path, "rb") as f:
+            f.seek(good_end)
+            offset = good_end
+            for line in f:
+                length = len(line)
+                if not line.endswith(b"\n"):
+                    break  # Torn write from a crash
+                try:
+                    user_part, _ = line.split(b"\t", 1)
+                    user_id = json.loads(user_part)
+                except ValueError:
+                    print(f"[System] Skipping corrupt history record at byte {offset}.")
+                    self.dead_bytes += length
+                    offset += length
+                    good_end = offset
+                    continue
+                self.index.setdefault(user_id, []).append((offset, length))
+                offset += length
+                good_end = offset
+        self.indexed_end = good_end
+        if truncate:
+            self._truncate_torn_tail()
+
+    def _truncate_torn_tail(self):
+        """
+        Drops bytes past the last complete record so the next append starts on
+        a clean line. Only called under the exclusive flock: every writer
+        holds it for its whole write, so an incomplete tail is a crashed write.
+        """
+        if os.path.getsize(self.path) > self.indexed_end:
+            print(f"[System] Truncating torn history record in {self.path}.")
+            with open(self.path, "r+b") as f:
+                f.truncate(self.indexed_end)
+
+    def _refresh(self):
+        """Catches up with appends / compactions from other workers. Caller holds self.lock."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._rebuild_index()
+            return
+        if st.st_ino != self.inode or st.st_size < self.indexed_end:
+            self._rebuild_index()
+        elif st.st_size > self.indexed_end:
+            self._scan_tail()
+
+    @staticmethod
+    def _encode(user_id, turn):
+        record = {"role": turn["role"], "text": turn["text"]}
+        return (
+            json.dumps(user_id, ensure_ascii=False) + "\t" +
+            json.dumps(record, ensure_ascii=False) + "\n"
+        ).encode("utf-8")
+
+    def load(self, user_id) -> list:
+        with self.lock, file_lock(self.lock_path, exclusive=False):
+            self._refresh()
+            locations = list(self.index.get(user_id, []))
+            if not locations:
+                return []
+
+            turns = []
+            with open(self.path, "rb") as f:
+                for offset, length in locations:
+                    f.seek(offset)
+                    line = f.read(length)
+                    turns.append(json.loads(line.split(b"\t", 1)[1]))
+        return turns
+
+    def version(self, user_id) -> int:
+        """End offset of the user's last record: moves on every append and every compaction."""
+        with self.lock, file_lock(self.lock_path, exclusive=False):
+            self._refresh()
+            locations = self.index.get(user_id)
+            return locations[-1][0] + locations[-1][1] if locations else 0
+
+    def append(self, user_id, turns: list):
+        payload = [self._encode(user_id, t) for t in turns]
+        with self.lock:
+            with file_lock(self.lock_path):
+                self._refresh()
+                self._truncate_torn_tail()
+                with open(self.path, "ab") as f:
+                    offset = f.tell()
+                    f.write(b"".join(payload))
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                locations = self.index.setdefault(user_id, [])
+                for chunk in payload:
+                    locations.append((offset, len(chunk)))
+                    offset += len(chunk)
+                self.indexed_end = offset
+
+            self.appends_since_compact += len(turns)
+            if self.compact_every and self.appends_since_compact >= self.compact_every:
+                self.appends_since_compact = 0
+                if self.reclaimable_bytes():
+                    self._compact_in_background()
+
+    def user_ids(self) -> list:
+        with self.lock, file_lock(self.lock_path, exclusive=False):
+            self._refresh()
+            return list(self.index.keys())
+
+    def reclaimable_bytes(self) -> int:
+        """What a compaction would drop: corrupt records + turns beyond the per-user cap."""
+        with self.lock:
+            dropped = self.dead_bytes
+            if self.max_turns_per_user:
+                for locations in self.index.values():
+                    excess = len(locations) - self.max_turns_per_user
+                    if excess > 0:
+                        dropped += sum(length for _, length in locations[:excess])
+            return dropped
+
+    def _compact_in_background(self):
+        if self._compacting:
+            return
+        self._compacting = True
+        threading.Thread(target=self.compact, name="session-compactor", daemon=True).start()
+
+    def _retained(self, locations):
+        if self.max_turns_per_user and len(locations) > self.max_turns_per_user:
+            return locations[-self.max_turns_per_user:]
+        return locations
+
+    @staticmethod
+    def _copy(src, dst, locations, offset):
+        """Copies records to dst (written from `offset`); returns their new locations and the end."""
+        new_locations = []
+        for old_offset, length in locations:
+            src.seek(old_offset)
+            dst.write(src.read(length))
+            new_locations.append((offset, length))
+            offset += length
+        return new_locations, offset
+
+    def compact(self):
+        """
+        Rewrites the log without the dropped records, grouped by user, then
+        atomically swaps it in. Appends and reads only wait for the short
+        second phase (records appended during the copy + the swap).
+        """
+        tmp_path = f"{self.path}.compact-{os.getpid()}"
+        try:
+            # 1. Snapshot the index; the bytes it points to never change (append-only)
+            with self.lock, file_lock(self.lock_path, exclusive=False):
+                self._refresh()
+                if not self.reclaimable_bytes():
+                    return
+                snapshot = {user_id: list(locations) for user_id, locations in self.index.items()}
+                snapshot_end = self.indexed_end
+                inode = self.inode
+                src = open(self.path, "rb")
+
+            # 2. Copy the retained records without holding any lock
+            with src, open(tmp_path, "wb") as dst:
+                new_index, offset = {}, 0
+                for user_id, locations in snapshot.items():
+                    new_index[user_id], offset = self._copy(src, dst, self._retained(locations), offset)
+
+                # 3. Catch up on what was appended meanwhile, then swap
+                with self.lock, file_lock(self.lock_path):
+                    self._refresh()
+                    if self.inode != inode:
+                        return  # Another worker compacted first
+                    # (kept in full; the per-user cap catches up at the next compaction)
+                    for user_id, locations in self.index.items():
+                        appended = [loc for loc in locations if loc[0] >= snapshot_end]
+                        if appended:
+                            moved, offset = self._copy(src, dst, appended, offset)
+                            new_index[user_id] = new_index.get(user_id, []) + moved
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                    os.replace(tmp_path, self.path)
+                    self.index = new_index
+                    self.indexed_end = offset
+                    self.dead_bytes = 0
+                    self.inode = os.stat(self.path).st_ino
+        except Exception as e:
+            print(f"[System] History compaction failed: {e}")
+        finally:
+            self._compacting = False
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    One row per turn with an index on user_id.
+    SQLite's WAL journal gives us crash safety for free; compaction = VACUUM.
+    Workers share the database directly (SQLite serializes the writers).
+    """
+
+    def __init__(self, path=config.SESSION_SQLITE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+
+        # Only the first worker to get here sees a fresh database and imports legacy history
+        with file_lock(self.path + ".lock"):
+            fresh = not os.path.exists(self.path)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS turns ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " user_id TEXT NOT NULL,"
+                " role TEXT NOT NULL,"
+                " text TEXT NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_turns_user ON turns(user_id, id)")
+            self.conn.commit()
+
+        if fresh:
+            self.import_legacy(config.LEGACY_HISTORY_FILE)
+
+    def load(self, user_id) -> list:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT role, text FROM turns WHERE user_id = ? ORDER BY id", (user_id,)
+            ).fetchall()
+        return [{"role": role, "text": text} for role, text in rows]
+
+    def append(self, user_id, turns: list):
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO turns (user_id, role, text) VALUES (?, ?, ?)",
+                [(user_id, t["role"], t["text"]) for t in turns]
+            )
+            self.conn.commit()
+
+    def version(self, user_id) -> int:
+        with self.lock:
+            row = self.conn.execute("SELECT MAX(id) FROM turns WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] or 0
+
+    def user_ids(self) -> list:
+        with self.lock:
+            return [r[0] for r in self.conn.execute("SELECT DISTINCT user_id FROM turns")]
+
+    def compact(self):
+        with self.lock:
+            self.conn.execute("VACUUM")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def create_session_store(backend=config.SESSION_BACKEND) -> SessionStore:
+    if backend == "sqlite":
+        return SqliteSessionStore()
+    if backend == "jsonl":
+        return JsonlSessionStore()
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+import config
+
+logger = logging.getLogger(__name__)
+
+WARMUP_QUERY = "How much of my account should I risk on one trade?"
+WARMUP_DOCUMENT = "Risk a small, fixed fraction of the account per trade and always use a stop loss."
+
+
+#  COMPONENT LOADERS 
+# Heavy libraries (torch, transformers, chromadb, google-genai) are imported
+# here rather than at module import, so the server binds its port at once.
+
+def _load_embedder():
+    import encoders
+    return encoders.get_embedder()
+
+
+def _load_router():
+    from router import SemanticRouter
+    return SemanticRouter()
+
+
+def _load_rag():
+    from rag import RAGPipeline
+    return RAGPipeline()
+
+
+def _load_brain(executor=None):
+    from brain import SenseiBrain
+    return SenseiBrain(io_pool=executor.io_pool if executor else None)
+
+
+#  WARMUP 
+# One real inference per model: the first call pays for lazy init
+# (kernel selection, allocator growth, ORT session setup, HNSW index load).
+
+def _warm_embedder():
+    import encoders
+    encoders.encode([WARMUP_QUERY, WARMUP_DOCUMENT])
+
+
+def _warm_reranker(rag):
+    rag.rerank([[WARMUP_QUERY, WARMUP_DOCUMENT]])
+
+
+def _warm_index(rag):
+    import encoders
+    rag._dense_fetch(encoders.encode([WARMUP_QUERY])[0], 1)
+
+
+class StartupManager:
+    """
+    Loads the heavy components in the background so /health and /ready can
+    answer while models are still coming up.
+
+    - Router (+ embedder), RAG (+ Cross-Encoder, Chroma, BM25) and the brain
+      don't depend on each other, so they load on parallel threads.
+    - Warmup runs one inference through each model before we report ready.
+    - Every phase is timed; status() returns the breakdown.
+    """
+
+    def __init__(self, components, parallel=config.STARTUP_PARALLEL, warmup=config.STARTUP_WARMUP):
+        self.components = components  # The shared ml_models dict, filled as components load
+        self.parallel = parallel
+        self.warmup = warmup
+        self.state = "starting"
+        self.error = None
+        self.phases = {}
+        self.started_at = time.time()
+        self.ready_at = None
+        self._task = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        try:
+            await self._load_components()
+            if self.warmup:
+                await self._warmup()
+            self.ready_at = time.time()
+            self.phases["total"] = round(self.ready_at - self.started_at, 3)
+            self.state = "ready"
+            logger.info(f"System is ready to accept requests. Startup phases (s): {self.phases}")
+        except asyncio.CancelledError:
+            self.state = "stopped"
+            raise
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            logger.critical(f"Critical failure during startup: {e}")
+
+    async def _phase(self, name, fn, *args):
+        """Runs a blocking loader on its own thread and records how long it took."""
+        start = time.perf_counter()
+        try:
+            return await asyncio.to_thread(fn, *args)
+        finally:
+            self.phases[name] = round(time.perf_counter() - start, 3)
+
+    async def _load_components(self):
+        loaders = {
+            "embedder": _load_embedder,
+            "router": _load_router,
+            "rag": _load_rag,
+            "brain": lambda: _load_brain(self.components.get("executor")),
+        }
+        start = time.perf_counter()
+        if self.parallel:
+            results = await asyncio.gather(*(self._phase(name, fn) for name, fn in loaders.items()))
+            loaded = dict(zip(loaders, results))
+        else:
+            loaded = {name: await self._phase(name, fn) for name, fn in loaders.items()}
+        self.phases["load"] = round(time.perf_counter() - start, 3)
+
+        for name in ("router", "rag", "brain"):
+            self.components[name] = loaded[name]
+        logger.info("Router, RAG Engine and LLM Brain initialized successfully.")
+
+    async def _warmup(self):
+        rag = self.components["rag"]
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            self._phase("warmup_embedder", _warm_embedder),
+            self._phase("warmup_reranker", _warm_reranker, rag),
+            self._phase("warmup_index", _warm_index, rag),
+            return_exceptions=True
+        )
+        self.phases["warmup"] = round(time.perf_counter() - start, 3)
+        for result in results:
+            if isinstance(result, Exception):
+                # A failed warmup only costs the first user some latency
+                logger.warning(f"Warmup step failed: {result}")
+
+    def status(self) -> dict:
+        uptime = time.time() - self.started_at
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "error": self.error,
+            "seconds_since_start": round(uptime, 3),
+            "phases": dict(self.phases),
+        }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the server modules the same way they import each other (flat, from main/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,62 @@
+import json
+import os
+
+import numpy as np
+
+from candidates import CandidateIndex, chapter_key, collection_digest
+
+# Four 2-d chunks: rows 0-2 carry tag "risk", rows 2-3 are chapter 2
+EMBEDDINGS = np.array([[1, 0], [0.8, 0.6], [0, 1], [-1, 0]], dtype=np.float32)
+IDS = ["c0", "c1", "c2", "c3"]
+METAS = [{"chapter": "1. Basics"}, {"chapter": "1. Basics"}, {"chapter": "2. Risk"}, {"chapter": "2. Risk"}]
+
+
+def write_index(directory, lists, truncated=()):
+    np.save(os.path.join(directory, "embeddings-1.npy"), EMBEDDINGS)
+    index = {
+        "build_id": "1",
+        "collection_count": len(IDS),
+        "digest": collection_digest(IDS, IDS, METAS),
+        "dim": 2,
+        "embeddings": "embeddings-1.npy",
+        "chunks": [{"id": i, "text": i, "metadata": m} for i, m in zip(IDS, METAS)],
+        "lists": lists,
+        "truncated": list(truncated),
+    }
+    with open(os.path.join(directory, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    return str(directory)
+
+
+def test_rows_for_tags_and_chapters(tmp_path):
+    index = CandidateIndex(write_index(tmp_path, {"tag:risk": [0, 1, 2], "tag:trend": [2, 3], "chapter:2": [2, 3]}))
+    assert index.rows_for(tags=["risk"]).tolist() == [0, 1, 2]
+    assert index.rows_for(tags=["risk", "trend"]).tolist() == [0, 1, 2, 3]
+    assert index.rows_for(tags=["risk", "unknown"]) is None
+    assert index.rows_for(chapters=["2. Risk", "9"]).tolist() == [2, 3]
+    assert index.rows_for(chapters=["9"]) is None
+    assert chapter_key(2) == chapter_key(" 2. Risk") == "2"
+
+
+def test_truncated_lists_fall_back_to_ann(tmp_path):
+    index = CandidateIndex(write_index(tmp_path, {"tag:risk": [0, 1], "chapter:2": [2]}, ["tag:risk", "chapter:2"]))
+    assert index.rows_for(tags=["risk"]) is None
+    assert index.rows_for(chapters=["2"]) is None
+    assert not index.has_chapter("2")
+
+
+def test_nearest_ranks_rows_by_similarity(tmp_path):
+    index = CandidateIndex(write_index(tmp_path, {"tag:risk": [0, 1, 2]}))
+    rows = index.rows_for(tags=["risk"])
+    found = index.nearest([0, 1], rows, limit=2)
+    assert [c["id"] for c in found] == ["c2", "c1"]
+    assert found[0]["metadata"] == {"chapter": "2. Risk"}
+    assert found[1]["similarity"] == np.float32(0.6).item()
+    assert [c["id"] for c in index.nearest([1, 0], rows, limit=5)] == ["c0", "c1", "c2"]
+
+
+def test_load_ignores_a_stale_index(tmp_path):
+    directory = write_index(tmp_path, {"tag:risk": [0]})
+    assert CandidateIndex.load(directory, expected_digest=collection_digest(IDS, IDS, METAS)) is not None
+    assert CandidateIndex.load(directory, expected_digest=lambda: "something else") is None
+    assert CandidateIndex.load(str(tmp_path / "missing")) is None
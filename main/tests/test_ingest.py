@@ -0,0 +1,58 @@
+import sys
+import types
+import numpy as np
+import pytest
+
+import ingest
+from ingest import Checkpoint, chunk_metadata, tag_filter
+
+chromadb = pytest.importorskip("chromadb")
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    # _upsert embeds with the shared encoder; a fixed vector is enough for filtering
+    fake = types.SimpleNamespace(encode=lambda texts: np.ones((len(texts), 4), dtype=np.float32))
+    monkeypatch.setitem(sys.modules, "encoders", fake)
+    client = chromadb.EphemeralClient()
+    name = f"tags_{id(client)}"
+    yield client.get_or_create_collection(name=name, embedding_function=None)
+    client.delete_collection(name)
+
+
+def test_multi_tag_chunk_matches_each_of_its_tags(collection, tmp_path):
+    chunk = {"id": "c1", "text": "Put the stop loss below support.", "chapter": "2. Risk",
+             "path": "Risk > Stops", "tags": ["stop loss", "support"], "hash": "h1"}
+    other = {"id": "c2", "text": "Moving averages smooth price.", "chapter": "9. Indicators",
+             "path": "Indicators", "tags": ["moving average"], "hash": "h2"}
+    ingest._upsert(collection, [chunk, other], Checkpoint(str(tmp_path / "checkpoint.jsonl")))
+
+    for tag in ["stop loss", "support"]:
+        assert collection.get(where=tag_filter([tag]))["ids"] == ["c1"]
+        found = collection.query(query_embeddings=[[1.0] * 4], n_results=2, where=tag_filter([tag]))
+        assert found["ids"][0] == ["c1"]
+    assert sorted(collection.get(where=tag_filter(["support", "moving average"]))["ids"]) == ["c1", "c2"]
+    assert collection.get(where=tag_filter(["volume"]))["ids"] == []
+
+
+def test_legacy_single_tag_string_still_matches(collection):
+    collection.add(ids=["old"], documents=["legacy"], embeddings=[[1.0] * 4],
+                   metadatas=[{"chapter": "1", "path": "p", "tags": "support"}])
+    assert collection.get(where=tag_filter(["support"]))["ids"] == ["old"]
+
+
+def test_chunk_metadata_keeps_readable_tags():
+    metadata = chunk_metadata("2. Risk", "Risk", ["stop loss", "support"], "h1")
+    assert metadata["tags"] == "stop loss, support"
+    assert metadata["tag:stop loss"] is True and metadata["tag:support"] is True
+    assert tag_filter([]) is None
+
+
+def test_retagged_chunk_loses_old_tags(collection, tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.jsonl"))
+    chunk = {"id": "c1", "text": "Support holds.", "chapter": "4", "path": "p", "tags": ["support"], "hash": "h1"}
+    ingest._upsert(collection, [chunk], checkpoint)
+    ingest._upsert(collection, [{**chunk, "tags": ["resistance"]}], checkpoint)
+
+    assert collection.get(where=tag_filter(["support"]))["ids"] == []
+    assert collection.get(where=tag_filter(["resistance"]))["ids"] == ["c1"]
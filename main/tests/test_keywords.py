@@ -0,0 +1,39 @@
+from keywords import KeywordMatcher, fold_plural
+
+TERMS = ["stop loss", "loss", "moving average", "support", "drawdown", "short"]
+
+
+def test_longest_term_wins_and_nested_terms_are_dropped():
+    matcher = KeywordMatcher(TERMS)
+    assert matcher.match("Where should my STOP-LOSS go?") == (["stop loss"], False)
+    assert matcher.match("a loss after the moving average crossed") == (["moving average", "loss"], False)
+
+
+def test_plurals_are_folded():
+    assert fold_plural("losses") == "loss"
+    assert fold_plural("strategies") == "strategy"
+    assert KeywordMatcher(TERMS).match("I keep hitting my stop losses") == (["stop loss"], False)
+
+
+def test_only_whole_words_match():
+    matcher = KeywordMatcher(["stop"])
+    assert matcher.match("the market ran nonstop") == ([], False)
+    assert matcher.match("is there a keyboard shortcut") == ([], False)
+
+
+def test_typos_are_corrected_to_one_vocabulary_word():
+    matcher = KeywordMatcher(TERMS)
+    assert matcher.match("how deep can a drawdwn get") == (["drawdown"], True)
+    # Short words are never corrected: "lots" is not a typo of "loss"
+    assert matcher.match("buying lots") == ([], False)
+
+
+def test_generic_words_cause_false_positives_unless_marked_ambiguous():
+    loose = KeywordMatcher(TERMS)
+    assert loose.match("I have a short question") == (["short"], False)
+    assert loose.match("which sport do you like") == (["short"], True)
+
+    matcher = KeywordMatcher(TERMS, ambiguous=["short"])
+    assert matcher.match("I have a short question") == ([], False)
+    assert matcher.match("which sport do you like") == ([], False)
+    assert matcher.match("a short stop loss") == (["stop loss"], False)
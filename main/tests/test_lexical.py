@@ -0,0 +1,37 @@
+from lexical import BM25Index, reciprocal_rank_fusion
+
+DOCS = {
+    "a": "A stop loss closes the trade when price moves against you.",
+    "b": "Position sizing decides how much to risk on each trade.",
+    "c": "Stop loss, stop loss, stop loss: always place a stop loss before entry.",
+    "d": "A moving average smooths price.",
+}
+
+
+def build():
+    metas = [{"tags": "risk"} if i in ("a", "b") else {} for i in DOCS]
+    return BM25Index().build(list(DOCS), list(DOCS.values()), metas,
+                             lambda m: [m["tags"]] if m.get("tags") else [])
+
+
+def test_bm25_ranks_by_term_frequency_and_rarity():
+    index = build()
+    assert index.search("stop loss", top_n=10) == ["c", "a"]
+    assert index.search("sizing", top_n=10) == ["b"]
+    assert index.search("the of a", top_n=10) == []  # Stopwords only
+
+
+def test_bm25_respects_top_n_and_allowed_ids():
+    index = build()
+    assert index.search("stop loss price", top_n=1) == ["c"]
+    assert index.search("stop loss", top_n=10, allowed_ids=index.ids_for_tags(["risk"])) == ["a"]
+    assert index.ids_for_tags(["risk", "missing"]) == {"a", "b"}
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    fused = reciprocal_rank_fusion([["x", "y", "z"], ["y", "z", "w"]])
+    assert fused == ["y", "z", "x", "w"]
+
+
+def test_rrf_counts_an_id_once_per_list():
+    assert reciprocal_rank_fusion([["a", "b"], ["b"], []]) == ["b", "a"]
@@ -0,0 +1,60 @@
+import pytest
+
+from benchmark.loadgen import DEFAULT_MIX, QueryMix, compare, parse_mix, summarize
+
+
+def record(kind, status, ms, breakdown=None):
+    return {"kind": kind, "status": status, "latency_s": ms / 1000, "breakdown": breakdown}
+
+
+RECORDS = [
+    record("in_scope", 200, 100, {"retrieve": 10, "generate": 80}),
+    record("in_scope", 200, 300, {"retrieve": 30, "generate": 250}),
+    record("repeat", 200, 20, {"retrieve": 1}),
+    record("off_topic", 503, 5),
+    record("in_scope", "exception: ReadTimeout", 60_000),
+]
+
+
+def test_parse_mix_normalises_weights():
+    assert parse_mix("in_scope=3, repeat=1") == {"in_scope": 0.75, "repeat": 0.25}
+    assert parse_mix("") == DEFAULT_MIX
+
+
+def test_parse_mix_rejects_unknown_kinds():
+    with pytest.raises(ValueError, match="Unknown query kind"):
+        parse_mix("in_scope=1,spam=1")
+
+
+def test_query_mix_is_reproducible():
+    first = QueryMix(["stop loss", "drawdown"], seed=3)
+    second = QueryMix(["stop loss", "drawdown"], seed=3)
+    assert [first.next() for _ in range(20)] == [second.next() for _ in range(20)]
+    kinds = {QueryMix(["stop loss"], mix={"off_topic": 1.0}).next()[0] for _ in range(5)}
+    assert kinds == {"off_topic"}
+
+
+def test_summarize_counts_only_successes_in_latency():
+    report = summarize(RECORDS, elapsed_s=2.0, target_rps=3)
+    assert (report["requests"], report["ok"], report["rejected"], report["errors"]) == (5, 3, 1, 1)
+    assert report["throughput_rps"] == 1.5
+    assert report["latency_ms"]["p50"] == 100.0 and report["latency_ms"]["max"] == 300.0
+    assert report["latency_ms_by_kind"]["repeat"]["mean"] == 20.0
+    assert report["stages_ms"]["retrieve"]["mean"] == pytest.approx(13.67)
+    assert list(report["stages_ms"]) == ["generate", "retrieve"]
+
+
+def test_compare_flags_only_meaningful_regressions():
+    baseline = summarize(RECORDS, elapsed_s=2.0, target_rps=3)
+    assert compare(baseline, baseline) == []
+
+    slower = summarize([{**r, "latency_s": r["latency_s"] * 2} for r in RECORDS], elapsed_s=4.0, target_rps=3)
+    regressions = compare(slower, baseline)
+    assert any(r.startswith("latency p95") for r in regressions)
+    assert any(r.startswith("throughput") for r in regressions)
+    assert not any(r.startswith("stage") for r in regressions)  # Breakdowns unchanged
+
+    # A few ms of jitter on a fast path is not a regression, whatever the ratio
+    fast = summarize([record("repeat", 200, 2)], elapsed_s=1.0, target_rps=1)
+    jitter = summarize([record("repeat", 200, 6)], elapsed_s=1.0, target_rps=1)
+    assert compare(jitter, fast) == []
@@ -0,0 +1,96 @@
+from memory import SUMMARY_PREFIX, HistoryWindow, Session, Turn
+
+
+def conversation(pairs):
+    turns = []
+    for i in range(pairs):
+        turns += [Turn("user", f"question {i}"), Turn("model", f"answer {i}")]
+    return Session(turns)
+
+
+def make_window(calls, fail=False, **kwargs):
+    def summarize(previous, turns):
+        calls.append([t.text for t in turns])
+        return None if fail else f"{previous} + {len(turns)} messages".strip(" +")
+
+    options = dict(max_turns=4, token_budget=10_000, fold_batch=4, max_fold_input=40)
+    options.update(kwargs)
+    return HistoryWindow(summarize, **options)
+
+
+def texts(window):
+    return [t.text for t in window]
+
+
+def test_short_history_is_sent_verbatim():
+    calls = []
+    window, info = make_window(calls).build("u", conversation(2))
+    assert texts(window) == ["question 0", "answer 0", "question 1", "answer 1"]
+    assert calls == [] and info["tokens_saved"] == 0
+
+
+def test_messages_below_the_fold_batch_stay_in_the_window():
+    calls = []
+    # 3 pairs, window of 4 messages: 2 have fallen out, fewer than fold_batch
+    history_window, session = make_window(calls), conversation(3)
+    history_window.schedule_fold("u", session)
+    window, info = history_window.build("u", session)
+    assert calls == []
+    assert texts(window) == ["question 0", "answer 0", "question 1", "answer 1", "question 2", "answer 2"]
+    assert info["verbatim_turns"] == 6
+
+
+def test_full_batch_is_folded_after_the_turn():
+    calls = []
+    history_window, session = make_window(calls), conversation(4)
+
+    # build() never summarizes: the unfolded batch rides along verbatim
+    window, _ = history_window.build("u", session)
+    assert calls == [] and len(window) == 8
+
+    history_window.schedule_fold("u", session)
+    assert calls == [["question 0", "answer 0", "question 1", "answer 1"]]
+    assert session.summary[0] == 4
+    window, _ = history_window.build("u", session)
+    assert window[0].text.startswith(SUMMARY_PREFIX) and window[1].role == "model"
+    assert texts(window)[2:] == ["question 2", "answer 2", "question 3", "answer 3"]
+
+    # The next turn only has one pair pending again: no new fold, nothing lost
+    session.extend([Turn("user", "question 4"), Turn("model", "answer 4")])
+    history_window.schedule_fold("u", session)
+    window, _ = history_window.build("u", session)
+    assert len(calls) == 1
+    assert texts(window)[2:] == ["question 2", "answer 2", "question 3", "answer 3", "question 4", "answer 4"]
+
+
+def test_fold_runs_in_the_background_one_at_a_time():
+    calls, jobs = [], []
+    history_window, session = make_window(calls, submit_fn=jobs.append), conversation(5)
+    history_window.schedule_fold("u", session)
+    history_window.schedule_fold("u", session)
+    assert len(jobs) == 1 and calls == []
+
+    # While the fold is in flight the pending messages are still sent
+    window, _ = history_window.build("u", session)
+    assert texts(window)[0] == "question 0" and len(window) == 10
+
+    jobs.pop()()
+    assert len(calls) == 1 and session.summary[0] == 6
+    window, _ = history_window.build("u", session)
+    assert window[0].text.startswith(SUMMARY_PREFIX)
+    assert texts(window)[2:] == ["question 3", "answer 3", "question 4", "answer 4"]
+
+    session.extend(conversation(2).turns)
+    history_window.schedule_fold("u", session)
+    assert len(jobs) == 1  # The earlier fold finished, so a new one can start
+
+
+def test_failed_fold_keeps_the_summary_and_bounds_the_window():
+    calls = []
+    history_window, session = make_window(calls, fail=True), conversation(6)
+    history_window.schedule_fold("u", session)
+    window, _ = history_window.build("u", session)
+    assert len(calls) == 1
+    assert not window[0].text.startswith(SUMMARY_PREFIX)
+    assert window[0].role == "user"
+    assert len(window) <= 4 + 2 * 4 - 1
@@ -0,0 +1,36 @@
+import pytest
+
+import ratelimit
+from ratelimit import TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_starts_full_and_drains(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    assert [bucket.try_take() for _ in range(4)] == [True, True, True, False]
+    assert bucket.time_until_available() == pytest.approx(0.5)
+
+
+def test_bucket_refills_at_rate_up_to_capacity(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    assert bucket.try_take(3)
+    clock[0] += 1.0
+    assert bucket.available() == pytest.approx(2.0)
+    assert not bucket.try_take(3)
+    clock[0] += 60.0
+    assert bucket.available() == pytest.approx(3.0)
+    assert bucket.time_until_available(2) == 0.0
+
+
+def test_zero_rate_bucket_never_refills(clock):
+    bucket = TokenBucket(rate=0, capacity=1)
+    assert bucket.try_take()
+    clock[0] += 1000.0
+    assert not bucket.try_take()
+    assert bucket.time_until_available() == float("inf")
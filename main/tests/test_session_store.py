@@ -0,0 +1,83 @@
+import os
+
+from session_store import JsonlSessionStore
+
+
+def turn(text, role="user"):
+    return {"role": role, "text": text}
+
+
+def make_store(tmp_path, **kwargs):
+    kwargs.setdefault("compact_every", 0)
+    return JsonlSessionStore(path=str(tmp_path / "sessions.jsonl"), **kwargs)
+
+
+def test_torn_tail_is_truncated_on_startup(tmp_path):
+    store = make_store(tmp_path)
+    store.append("alice", [turn("hi"), turn("hello", "model")])
+    with open(store.path, "ab") as f:
+        f.write(b'"alice"\t{"role": "user", "te')  # Crash mid-write
+
+    reopened = make_store(tmp_path)
+    assert reopened.load("alice") == [turn("hi"), turn("hello", "model")]
+    reopened.append("alice", [turn("again")])
+    assert make_store(tmp_path).load("alice")[-1] == turn("again")
+
+
+def test_torn_tail_left_by_another_worker_is_not_merged_into_the_next_append(tmp_path):
+    store = make_store(tmp_path)
+    store.append("alice", [turn("one")])
+    with open(store.path, "ab") as f:
+        f.write(b'"bob"\t{"role": "us')  # Another worker died mid-write
+
+    store.append("alice", [turn("two")])
+    assert store.load("alice") == [turn("one"), turn("two")]
+    assert make_store(tmp_path).load("alice") == [turn("one"), turn("two")]
+    assert make_store(tmp_path).load("bob") == []
+
+
+def test_compaction_is_skipped_when_nothing_can_be_dropped(tmp_path):
+    store = make_store(tmp_path)
+    store.append("alice", [turn("one"), turn("two")])
+    inode = os.stat(store.path).st_ino
+
+    assert store.reclaimable_bytes() == 0
+    store.compact()
+    assert os.stat(store.path).st_ino == inode
+
+
+def test_compaction_drops_corrupt_records_and_turns_beyond_the_cap(tmp_path):
+    store = make_store(tmp_path, max_turns_per_user=2)
+    store.append("alice", [turn("one"), turn("two"), turn("three")])
+    with open(store.path, "ab") as f:
+        f.write(b"not a record\n")
+    store.append("bob", [turn("hey")])
+    size_before = os.path.getsize(store.path)
+
+    assert store.reclaimable_bytes() > 0
+    store.compact()
+    assert os.path.getsize(store.path) < size_before
+    assert store.load("alice") == [turn("two"), turn("three")]
+    assert make_store(tmp_path).load("alice") == [turn("two"), turn("three")]
+    assert make_store(tmp_path).load("bob") == [turn("hey")]
+
+
+def test_compaction_keeps_turns_appended_during_the_copy(tmp_path):
+    store = make_store(tmp_path, max_turns_per_user=1)
+    store.append("alice", [turn("old"), turn("new")])
+    other = make_store(tmp_path)
+
+    copy = JsonlSessionStore._copy
+    appended = []
+
+    def copy_then_append(src, dst, locations, offset):
+        if not appended:
+            appended.append(True)
+            other.append("carol", [turn("mid-compaction")])
+        return copy(src, dst, locations, offset)
+
+    store._copy = copy_then_append
+    store.compact()
+    assert store.load("alice") == [turn("new")]
+    assert store.load("carol") == [turn("mid-compaction")]
+    assert other.load("carol") == [turn("mid-compaction")]
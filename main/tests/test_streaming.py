@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+
+from executor import PipelineExecutor
+from scheduler import UserScheduler
+
+
+def slow_tokens(log, closed, count=50):
+    try:
+        for i in range(count):
+            time.sleep(0.01)
+            log.append(i)
+            yield i
+    finally:
+        closed.set()
+
+
+def test_stream_io_closes_the_generator_when_the_consumer_leaves():
+    executor = PipelineExecutor(io_workers=1, cpu_workers=1)
+    log, closed = [], threading.Event()
+
+    async def main():
+        stream = executor.stream_io(slow_tokens, log, closed)
+        assert await stream.__anext__() == 0
+        await stream.aclose()
+        return await asyncio.to_thread(closed.wait, 2)
+
+    try:
+        assert asyncio.run(main())
+        assert len(log) < 10  # Stopped early instead of pulling all 50 items
+    finally:
+        executor.shutdown()
+
+
+def test_stream_io_passes_items_and_errors_through():
+    executor = PipelineExecutor(io_workers=1, cpu_workers=1)
+
+    def failing():
+        yield "a"
+        raise ValueError("boom")
+
+    async def main():
+        items = []
+        try:
+            async for item in executor.stream_io(failing):
+                items.append(item)
+        except ValueError as e:
+            return items, str(e)
+
+    try:
+        assert asyncio.run(main()) == (["a"], "boom")
+    finally:
+        executor.shutdown()
+
+
+def test_abandoned_shared_stream_is_cancelled_but_shared_one_keeps_going():
+    scheduler = UserScheduler(coalesce=True)
+    state = {"cancelled": 0, "produced": 0}
+
+    async def tokens():
+        try:
+            for i in range(20):
+                await asyncio.sleep(0.01)
+                state["produced"] += 1
+                yield i
+        except asyncio.CancelledError:
+            state["cancelled"] += 1
+            raise
+
+    async def main():
+        # Two identical requests share one execution; one leaving doesn't stop it
+        first = scheduler.stream("u", "k", tokens)
+        second = scheduler.stream("u", "k", tokens)
+        assert await first.__anext__() == 0
+        assert await second.__anext__() == 0
+        await first.aclose()
+        assert [i async for i in second] == list(range(1, 20))
+        assert state["cancelled"] == 0
+
+        # Nobody left reading: the execution is cancelled
+        state["produced"] = 0
+        lone = scheduler.stream("u", "k2", tokens)
+        await lone.__anext__()
+        await lone.aclose()
+        await asyncio.sleep(0.05)
+        return state["produced"]
+
+    produced = asyncio.run(main())
+    assert state["cancelled"] == 1 and produced < 5